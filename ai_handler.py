@@ -1,39 +1,46 @@
 import os
+import re
+import json
+import time
 import asyncio
 import uuid
+import socket
+import weakref
+import threading
+import random
 import requests
 import base64
 import shutil
 import subprocess
-from groq import Groq
+import aiohttp
+from groq import Groq, AsyncGroq
 from openai import OpenAI
 from dotenv import load_dotenv
 from gtts import gTTS
 from logger_config import logger
+from description_cache import DescriptionCache
+from template_engine import TemplateDescriptionEngine
+from image_cache import ImageCache, ImageWarmPool, link_or_copy
+from downloader import adownload_to_file
+from rate_limiter import rate_limiter
 
 load_dotenv()
 
-class AIHandler:
-    def __init__(self):
-        logger.info("Initializing AIHandler...")
-        # Groq client for fast text generation
-        self.groq_client = Groq(
-            api_key=os.getenv("GROQ_API_KEY"),
-            timeout=300.0
-        )
-        
-        # OpenAI client for high-quality human-like TTS (Optional)
-        self.openai_key = os.getenv("OPENAI_API_KEY")
-        if self.openai_key:
-            self.openai_client = OpenAI(api_key=self.openai_key)
-        else:
-            self.openai_client = None
+TIKTOK_TTS_URL = "https://tiktok-tts.weilnet.workers.dev/api/generation"
 
-    def generate_product_description(self, product_name):
-        """Generates a high-engagement, short TikTok affiliate description (15-30s)."""
-        prompt = f"""
-        Tugas: Buat naskah video TikTok Affiliate yang VIRAL dan PERSUASIF untuk: {product_name}.
-        
+# A sentence ends at ., ! or ? (plus closing quotes) followed by whitespace, or at a newline
+SENTENCE_END = re.compile(r'[.!?]+["\')]*\s+|\n+')
+
+SCRIPT_MODEL = "llama-3.3-70b-versatile"
+
+# Pollinations output size (vertical TikTok frame)
+IMAGE_WIDTH = 1080
+IMAGE_HEIGHT = 1920
+MIN_SCRIPT_WORDS = 40
+MAX_SCRIPT_WORDS = 70
+
+# Shared body of every script prompt; the task line with the product name(s) is prepended per call
+SCRIPT_GUIDE = """
         TARGET DURASI: 15-30 detik (Sangat Singkat & To-the-point).
         
         KATEGORI HOOK (Pilih satu yang paling unik):
@@ -58,18 +65,517 @@ class AIHandler:
         - Panjang teks WAJIB antara 40-70 kata (Agar durasi 15-30 detik).
         - Gunakan Bahasa Indonesia yang sangat natural, jangan kaku.
         """
+
+HOOK_CATEGORIES = ["THE SECRET", "THE PROBLEM", "THE VISUAL", "THE URGENCY", "THE TEASE"]
+
+# Two variants sharing more than this fraction of their word pairs count as the same script
+VARIANT_SIMILARITY_THRESHOLD = 0.6
+
+def script_similarity(a, b):
+    """Jaccard similarity of the word bigrams of two scripts (0 = unrelated, 1 = identical)."""
+    def bigrams(text):
+        words = re.findall(r'\w+', text.casefold())
+        return set(zip(words, words[1:])) or set(words)
+    sa, sb = bigrams(a), bigrams(b)
+    if not sa or not sb:
+        return 0.0
+    return len(sa & sb) / len(sa | sb)
+
+def is_valid_script(text):
+    """Checks a generated script against the 40-70 word rule."""
+    if not isinstance(text, str):
+        return False
+    return MIN_SCRIPT_WORDS <= len(text.split()) <= MAX_SCRIPT_WORDS
+
+def split_complete_sentences(buffer):
+    """Splits a streaming buffer into finished sentences and the unfinished remainder."""
+    sentences = []
+    start = 0
+    for match in SENTENCE_END.finditer(buffer):
+        sentence = buffer[start:match.end()].strip()
+        if sentence:
+            sentences.append(sentence)
+        start = match.end()
+    return sentences, buffer[start:]
+
+class AIHandler:
+    def __init__(self):
+        logger.info("Initializing AIHandler...")
+        # Groq client for fast text generation
+        self.groq_client = Groq(
+            api_key=os.getenv("GROQ_API_KEY"),
+            timeout=300.0
+        )
+        # Async twin used by the bot so a slow completion never blocks the event loop
+        self.async_groq_client = AsyncGroq(
+            api_key=os.getenv("GROQ_API_KEY"),
+            timeout=300.0
+        )
+        # Per-call deadline (seconds) and max in-flight Groq requests for the async API
+        self.groq_deadline = float(os.getenv("GROQ_DEADLINE", "60"))
+        self.groq_max_concurrency = int(os.getenv("GROQ_MAX_CONCURRENCY", "4"))
+        self._groq_semaphores = weakref.WeakKeyDictionary()
+        # Scripts for the same (normalized) product are reused across users
+        self.description_cache = DescriptionCache()
+        # Offline script writer used when Groq misses DESCRIPTION_FALLBACK_DEADLINE (seconds)
+        self.template_engine = TemplateDescriptionEngine()
+        self.fallback_deadline = float(os.getenv("DESCRIPTION_FALLBACK_DEADLINE", "20"))
+        
+        # Pollinations image generation: parallel requests, attempts per image, overall deadline (s)
+        self.image_concurrency = int(os.getenv("POLLINATIONS_CONCURRENCY", "3"))
+        self.image_attempts = int(os.getenv("POLLINATIONS_ATTEMPTS", "3"))
+        self.image_deadline = float(os.getenv("POLLINATIONS_DEADLINE", "180"))
+        # Prompt/seed/model image cache; the warm pool is started by the dashboards
+        self.image_cache = ImageCache()
+        self.image_warm_pool = None
+        # User image jobs in flight; asyncio.run wrappers update it from several threads
+        self._image_jobs = 0
+        self._image_jobs_lock = threading.Lock()
+        self._activity_owner = f"{socket.gethostname()}:{os.getpid()}"
         
+        # OpenAI client for high-quality human-like TTS (Optional)
+        self.openai_key = os.getenv("OPENAI_API_KEY")
+        if self.openai_key:
+            self.openai_client = OpenAI(api_key=self.openai_key)
+        else:
+            self.openai_client = None
+
+    def _description_messages(self, product_name):
+        """Builds the chat messages for the TikTok affiliate script prompt."""
+        prompt = f"""
+        Tugas: Buat naskah video TikTok Affiliate yang VIRAL dan PERSUASIF untuk: {product_name}.
+        """ + SCRIPT_GUIDE
+        return [
+            {"role": "system", "content": "You are a professional TikTok content creator and affiliate marketer."},
+            {"role": "user", "content": prompt}
+        ]
+
+    def _batch_description_messages(self, product_names):
+        """Builds one JSON-mode prompt asking for a separate script per product."""
+        product_list = "\n".join(f"        {i}. {name}" for i, name in enumerate(product_names))
+        prompt = f"""
+        Tugas: Buat naskah video TikTok Affiliate yang VIRAL dan PERSUASIF untuk SETIAP produk berikut (satu naskah per produk):
+{product_list}
+        """ + SCRIPT_GUIDE + """
+        FORMAT OUTPUT (JSON saja, tanpa teks lain):
+        {"items": [{"index": <nomor produk>, "script": "<naskah>"}]}
+        """
+        return [
+            {"role": "system", "content": "You are a professional TikTok content creator and affiliate marketer. Reply with JSON only."},
+            {"role": "user", "content": prompt}
+        ]
+
+    def _variant_messages(self, product_name, count, hooks):
+        """Builds one JSON-mode prompt asking for `count` scripts, each with a different hook category."""
+        prompt = f"""
+        Tugas: Buat {count} naskah video TikTok Affiliate yang VIRAL dan PERSUASIF untuk: {product_name}.
+        Setiap naskah WAJIB memakai kategori hook yang BERBEDA, pilih dari: {", ".join(hooks)}.
+        Isi dan kalimat tiap naskah harus benar-benar berbeda satu sama lain.
+        """ + SCRIPT_GUIDE + """
+        FORMAT OUTPUT (JSON saja, tanpa teks lain):
+        {"variants": [{"hook": "<kategori hook>", "script": "<naskah>"}]}
+        """
+        return [
+            {"role": "system", "content": "You are a professional TikTok content creator and affiliate marketer. Reply with JSON only."},
+            {"role": "user", "content": prompt}
+        ]
+
+    def _groq_limit(self):
+        """
+        Caps in-flight Groq requests per event loop: an asyncio.Semaphore cannot be shared
+        between loops, and the sync wrappers run their own loop through asyncio.run.
+        """
+        loop = asyncio.get_running_loop()
+        semaphore = self._groq_semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._groq_semaphores[loop] = asyncio.Semaphore(self.groq_max_concurrency)
+        return semaphore
+
+    async def _with_groq_slot(self, make_call):
+        """
+        Awaits make_call() once a Groq slot is free. Callers put their deadline around this
+        call, so time spent queueing for a slot counts against it too.
+        """
+        async with self._groq_limit():
+            return await make_call()
+
+    @staticmethod
+    def _clean_description(text):
+        """Strips markup characters the TTS voice would otherwise read out."""
+        return text.replace('*', '').replace('#', '').strip()
+
+    @staticmethod
+    def _usage_tokens(completion):
+        usage = getattr(completion, "usage", None)
+        return getattr(usage, "total_tokens", None)
+
+    def generate_product_description(self, product_name):
+        """Generates a high-engagement, short TikTok affiliate description (15-30s)."""
+        cached = self.description_cache.get(product_name)
+        if cached:
+            return cached
         completion = self.groq_client.chat.completions.create(
-            model="llama-3.3-70b-versatile",
-            messages=[
-                {"role": "system", "content": "You are a professional TikTok content creator and affiliate marketer."},
-                {"role": "user", "content": prompt}
-            ],
+            model=SCRIPT_MODEL,
+            messages=self._description_messages(product_name),
             temperature=0.7,
             max_tokens=600
         )
-        text = completion.choices[0].message.content
-        return text.replace('*', '').replace('#', '').strip()
+        text = self._clean_description(completion.choices[0].message.content)
+        self.description_cache.put(product_name, text, self._usage_tokens(completion))
+        return text
+
+    def generate_description_with_fallback(self, product_name, metadata=None, deadline=None):
+        """
+        Like generate_product_description, but answers from the local template engine when
+        Groq errors or misses the deadline. Returns {"description", "engine"}.
+        """
+        cached = self.description_cache.get(product_name)
+        if cached:
+            return {"description": cached, "engine": "cache"}
+        try:
+            completion = self.groq_client.with_options(
+                timeout=deadline or self.fallback_deadline,
+                max_retries=0
+            ).chat.completions.create(
+                model=SCRIPT_MODEL,
+                messages=self._description_messages(product_name),
+                temperature=0.7,
+                max_tokens=600
+            )
+            text = self._clean_description(completion.choices[0].message.content)
+            self.description_cache.put(product_name, text, self._usage_tokens(completion))
+            return {"description": text, "engine": "groq"}
+        except Exception as e:
+            logger.warning(f"Groq failed ({e}), using template engine for: {product_name}")
+            return {"description": self.template_engine.generate(product_name, metadata), "engine": self.template_engine.name}
+
+    async def agenerate_product_description(self, product_name, timeout=None):
+        """Awaitable version of generate_product_description with a deadline and concurrency limit."""
+        cached = self.description_cache.get(product_name)
+        if cached:
+            return cached
+        completion = await asyncio.wait_for(
+            self._with_groq_slot(lambda: self.async_groq_client.chat.completions.create(
+                model=SCRIPT_MODEL,
+                messages=self._description_messages(product_name),
+                temperature=0.7,
+                max_tokens=600
+            )),
+            timeout or self.groq_deadline
+        )
+        text = self._clean_description(completion.choices[0].message.content)
+        self.description_cache.put(product_name, text, self._usage_tokens(completion))
+        return text
+
+    def _parse_batch_scripts(self, raw, count):
+        """Maps a JSON batch completion to {index: script}, keeping only well-formed, valid items."""
+        scripts = {}
+        try:
+            items = json.loads(raw).get("items", [])
+        except (ValueError, AttributeError) as e:
+            logger.warning(f"Batch description: unparseable JSON ({e})")
+            return scripts
+        for item in items:
+            if not isinstance(item, dict):
+                continue
+            index = item.get("index")
+            if not isinstance(index, int) or not 0 <= index < count or index in scripts:
+                continue
+            script = self._clean_description(item.get("script") or "")
+            if is_valid_script(script):
+                scripts[index] = script
+            else:
+                logger.warning(f"Batch description: item {index} rejected ({len(script.split())} words)")
+        return scripts
+
+    def generate_product_descriptions_batch(self, product_names, retries=1, timeout=None):
+        """
+        Generates one script per product in a single JSON completion. Malformed items are
+        re-batched up to `retries` times, then generated individually. Returns scripts in input order.
+        """
+        return asyncio.run(self.agenerate_product_descriptions_batch(product_names, retries, timeout))
+
+    async def agenerate_product_descriptions_batch(self, product_names, retries=1, timeout=None):
+        """Awaitable version of generate_product_descriptions_batch (deadline applies per request)."""
+        scripts = {}
+        for i, name in enumerate(product_names):
+            cached = self.description_cache.get(name)
+            if cached:
+                scripts[i] = cached
+        pending = [i for i in range(len(product_names)) if i not in scripts]
+        for attempt in range(retries + 1):
+            if not pending:
+                break
+            completion = await asyncio.wait_for(
+                self._with_groq_slot(lambda: self.async_groq_client.chat.completions.create(
+                    model=SCRIPT_MODEL,
+                    messages=self._batch_description_messages([product_names[i] for i in pending]),
+                    temperature=0.7,
+                    max_tokens=400 * len(pending),
+                    response_format={"type": "json_object"}
+                )),
+                timeout or self.groq_deadline
+            )
+            parsed = self._parse_batch_scripts(completion.choices[0].message.content, len(pending))
+            tokens = self._usage_tokens(completion)
+            for local_idx, script in parsed.items():
+                scripts[pending[local_idx]] = script
+                self.description_cache.put(product_names[pending[local_idx]], script, tokens and tokens // len(pending))
+            pending = [i for i in pending if i not in scripts]
+            logger.info(f"Batch description attempt {attempt + 1}: {len(product_names) - len(pending)}/{len(product_names)} scripts ready")
+
+        if pending:
+            singles = await asyncio.gather(*(self.agenerate_product_description(product_names[i], timeout) for i in pending))
+            scripts.update(zip(pending, singles))
+        return [scripts[i] for i in range(len(product_names))]
+
+    def _accept_variants(self, raw, variants):
+        """Appends valid, non-duplicate variants from a JSON completion to `variants` (in place)."""
+        try:
+            items = json.loads(raw).get("variants", [])
+        except (ValueError, AttributeError) as e:
+            logger.warning(f"Script variants: unparseable JSON ({e})")
+            return
+        for item in items:
+            if not isinstance(item, dict):
+                continue
+            hook = str(item.get("hook") or "").strip().upper()
+            script = self._clean_description(item.get("script") or "")
+            if hook not in HOOK_CATEGORIES or any(v["hook"] == hook for v in variants):
+                logger.warning(f"Script variants: dropped variant with missing/repeated hook '{hook}'")
+                continue
+            if not is_valid_script(script):
+                logger.warning(f"Script variants: dropped {hook} variant ({len(script.split())} words)")
+                continue
+            if any(script_similarity(script, v["script"]) > VARIANT_SIMILARITY_THRESHOLD for v in variants):
+                logger.warning(f"Script variants: dropped near-duplicate {hook} variant")
+                continue
+            variants.append({"hook": hook, "script": script})
+
+    def generate_description_variants(self, product_name, count=3, retries=1, timeout=None):
+        """
+        Generates up to `count` distinct scripts for A/B testing hooks from one JSON completion.
+        Each item is {"hook": <HOOK_CATEGORIES entry>, "script": <40-70 word script>}; missing
+        variants are requested again (only for unused hooks) up to `retries` times.
+        """
+        return asyncio.run(self.agenerate_description_variants(product_name, count, retries, timeout))
+
+    async def agenerate_description_variants(self, product_name, count=3, retries=1, timeout=None):
+        """Awaitable version of generate_description_variants (deadline applies per request)."""
+        count = min(count, len(HOOK_CATEGORIES))
+        variants = []
+        for attempt in range(retries + 1):
+            missing = count - len(variants)
+            if missing <= 0:
+                break
+            hooks = [h for h in HOOK_CATEGORIES if h not in {v["hook"] for v in variants}]
+            completion = await asyncio.wait_for(
+                self._with_groq_slot(lambda: self.async_groq_client.chat.completions.create(
+                    model=SCRIPT_MODEL,
+                    messages=self._variant_messages(product_name, missing, hooks),
+                    temperature=0.9,
+                    max_tokens=400 * missing,
+                    response_format={"type": "json_object"}
+                )),
+                timeout or self.groq_deadline
+            )
+            self._accept_variants(completion.choices[0].message.content, variants)
+            logger.info(f"Script variants attempt {attempt + 1}: {len(variants)}/{count} for {product_name}")
+
+        for variant in variants:
+            self.description_cache.put(product_name, variant["script"])
+        return variants[:count]
+
+    def stream_product_description(self, product_name):
+        """Streams the description from Groq, yielding each sentence as soon as it is complete."""
+        stream = self.groq_client.chat.completions.create(
+            model=SCRIPT_MODEL,
+            messages=self._description_messages(product_name),
+            temperature=0.7,
+            max_tokens=600,
+            stream=True
+        )
+        buffer = ""
+        for chunk in stream:
+            if not chunk.choices:
+                continue
+            buffer += chunk.choices[0].delta.content or ""
+            sentences, buffer = split_complete_sentences(buffer)
+            for sentence in sentences:
+                sentence = self._clean_description(sentence)
+                if sentence:
+                    yield sentence
+        tail = self._clean_description(buffer)
+        if tail:
+            yield tail
+
+    async def astream_product_description(self, product_name):
+        """Async generator twin of stream_product_description, backed by the AsyncGroq client."""
+        stream = await self.async_groq_client.chat.completions.create(
+            model=SCRIPT_MODEL,
+            messages=self._description_messages(product_name),
+            temperature=0.7,
+            max_tokens=600,
+            stream=True
+        )
+        buffer = ""
+        async for chunk in stream:
+            if not chunk.choices:
+                continue
+            buffer += chunk.choices[0].delta.content or ""
+            sentences, buffer = split_complete_sentences(buffer)
+            for sentence in sentences:
+                sentence = self._clean_description(sentence)
+                if sentence:
+                    yield sentence
+        tail = self._clean_description(buffer)
+        if tail:
+            yield tail
+
+    async def stream_description_to_speech(self, product_name, output_path, timeout=None, metadata=None, fallback=True):
+        """
+        Generates the description and voiceover together: every sentence is sent to TTS
+        while the next ones are still being generated. If Groq errors or misses the
+        fallback deadline, the local template engine writes the script instead.
+        Returns {"success", "description", "engine"} with engine in cache/groq/template.
+        """
+        cached = self.description_cache.get(product_name)
+        if cached:
+            return {"success": await self.text_to_speech(cached, output_path), "description": cached, "engine": "cache"}
+
+        # Sentence chunks go to a scratch folder that is removed on every exit path; a TTS call
+        # still running in a thread after cancellation then fails to write instead of leaking a file
+        chunk_dir = os.path.join(os.path.dirname(output_path), f"sentences_{uuid.uuid4().hex[:8]}")
+        os.makedirs(chunk_dir, exist_ok=True)
+        started = time.monotonic()
+        sentences = []
+        tts_tasks = []
+
+        async def synthesize(i, sentence):
+            path = await self._synthesize_sentence(i, sentence, chunk_dir)
+            if i == 0 and path:
+                logger.info(f"Streaming TTS: first sentence audio ready in {time.monotonic() - started:.2f}s")
+            return path
+
+        async def consume():
+            async for sentence in self.astream_product_description(product_name):
+                tts_tasks.append(asyncio.create_task(synthesize(len(sentences), sentence)))
+                sentences.append(sentence)
+
+        deadline = timeout or (self.fallback_deadline if fallback else self.groq_deadline)
+        try:
+            try:
+                await asyncio.wait_for(self._with_groq_slot(consume), deadline)
+            except BaseException as e:
+                for task in tts_tasks:
+                    task.cancel()
+                await asyncio.gather(*tts_tasks, return_exceptions=True)
+                if not fallback or not isinstance(e, Exception):
+                    raise
+                reason = f"missed {deadline:.0f}s deadline" if isinstance(e, asyncio.TimeoutError) else f"failed ({e})"
+                logger.warning(f"Groq {reason}, using template engine for: {product_name}")
+                description = self.template_engine.generate(product_name, metadata)
+                return {"success": await self.text_to_speech(description, output_path), "description": description, "engine": self.template_engine.name}
+
+            description = " ".join(sentences)
+            if not description:
+                return {"success": False, "description": description, "engine": "groq"}
+            self.description_cache.put(product_name, description)
+
+            chunk_files = await asyncio.gather(*tts_tasks)
+            if all(chunk_files):
+                if await asyncio.to_thread(self._merge_audio_chunks, list(chunk_files), output_path):
+                    return {"success": True, "description": description, "engine": "groq"}
+
+            # A sentence failed to synthesize or the merge failed: redo the whole text through the normal chain
+            logger.warning("Streaming TTS incomplete, falling back to full-text TTS.")
+            return {"success": await self.text_to_speech(description, output_path), "description": description, "engine": "groq"}
+        finally:
+            shutil.rmtree(chunk_dir, ignore_errors=True)
+
+    async def _synthesize_sentence(self, i, sentence, temp_dir):
+        """Renders one sentence to an mp3 chunk (OpenAI -> TikTok -> gTTS). Returns the path or None."""
+        c_path = os.path.join(temp_dir, f"sentence_{i}_{uuid.uuid4().hex[:4]}.mp3")
+
+        if self.openai_client:
+            try:
+                def save_openai():
+                    response = self.openai_client.audio.speech.create(
+                        model="tts-1",
+                        voice="nova",
+                        input=sentence
+                    )
+                    response.stream_to_file(c_path)
+                await asyncio.to_thread(save_openai)
+                return c_path
+            except Exception as e:
+                logger.error(f"OpenAI TTS Sentence {i} Error: {e}")
+
+        # TikTok voice only accepts ~200 characters per request
+        if len(sentence) < 200 and await asyncio.to_thread(self._tiktok_tts_chunk, sentence, c_path):
+            return c_path
+
+        try:
+            def save_gtts():
+                gTTS(text=sentence, lang='id').save(c_path)
+            await asyncio.to_thread(save_gtts)
+            return c_path
+        except Exception as e:
+            logger.error(f"gTTS Sentence {i} Error: {e}")
+        return None
+
+    def _tiktok_tts_chunk(self, chunk_text, path):
+        """Calls the TikTok TTS worker for a single chunk and writes the mp3 to path."""
+        payload = {"text": chunk_text, "voice": "id_001"}
+        try:
+            rate_limiter.acquire(TIKTOK_TTS_URL)
+            resp = requests.post(TIKTOK_TTS_URL, json=payload, timeout=60)
+            rate_limiter.record(TIKTOK_TTS_URL, resp.status_code)
+            if resp.status_code == 200:
+                data = resp.json()
+                if "data" in data:
+                    with open(path, "wb") as f:
+                        f.write(base64.b64decode(data["data"]))
+                    return True
+        except Exception as e:
+            logger.error(f"TikTok TTS Chunk Error: {e}")
+        return False
+
+    def _merge_audio_chunks(self, chunk_files, output_path):
+        """
+        Concatenates mp3 chunks in order into output_path using FFmpeg. The chunks are removed
+        either way; returns False when the merge fails so the caller can fall back.
+        """
+        if len(chunk_files) == 1:
+            shutil.move(chunk_files[0], output_path)
+            return True
+
+        # Create a concat file for FFmpeg
+        temp_dir = os.path.dirname(output_path)
+        list_path = os.path.join(temp_dir, f"list_{uuid.uuid4().hex[:4]}.txt")
+        with open(list_path, "w", encoding='utf-8') as f:
+            for cf in chunk_files:
+                # FFmpeg needs escaped paths if they have spaces, but here we keep it simple
+                f.write(f"file '{os.path.abspath(cf)}'\n")
+        
+        merge_cmd = [
+            'ffmpeg', '-y', '-f', 'concat', '-safe', '0',
+            '-i', list_path, '-c', 'copy', output_path
+        ]
+        
+        try:
+            subprocess.run(merge_cmd, capture_output=True, check=True)
+            return True
+        except Exception as e:
+            logger.error(f"FFmpeg Merge Error: {e}")
+            # A partial voiceover (e.g. only the first chunk) must not pass as success
+            try: os.remove(output_path)
+            except OSError: pass
+            return False
+        finally:
+            for path in [list_path, *chunk_files]:
+                try: os.remove(path)
+                except OSError: pass
 
     async def text_to_speech(self, text, output_path):
         """Converts text to audio with chunking for TikTok TTS to bypass character limits."""
@@ -91,12 +597,7 @@ class AIHandler:
 
         # 2. Try TikTok TTS with Chunking (Support for long duration)
         try:
-            import requests
-            import base64
-            import subprocess
-            
             # Split text by sentences or punctuation to keep chunks natural
-            import re
             sentences = re.split(r'([.!?\n]+)', text)
             chunks = []
             current_chunk = ""
@@ -116,28 +617,12 @@ class AIHandler:
 
             logger.info(f"TikTok TTS: Splitting text into {len(chunks)} chunks for long duration.")
             
-            chunk_files = []
-            api_url = "https://tiktok-tts.weilnet.workers.dev/api/generation"
-            
             temp_dir = os.path.dirname(output_path)
             
             async def generate_chunk(i, chunk_text):
-                def call_tiktok_chunk():
-                    payload = {"text": chunk_text, "voice": "id_001"}
-                    try:
-                        resp = requests.post(api_url, json=payload, timeout=60)
-                        if resp.status_code == 200:
-                            data = resp.json()
-                            if "data" in data:
-                                c_path = os.path.join(temp_dir, f"chunk_{i}_{uuid.uuid4().hex[:4]}.mp3")
-                                with open(c_path, "wb") as f:
-                                    f.write(base64.b64decode(data["data"]))
-                                return (i, c_path)
-                    except Exception as e:
-                        logger.error(f"TTS Chunk {i} Error: {e}")
-                    return (i, None)
-                
-                return await asyncio.to_thread(call_tiktok_chunk)
+                c_path = os.path.join(temp_dir, f"chunk_{i}_{uuid.uuid4().hex[:4]}.mp3")
+                ok = await asyncio.to_thread(self._tiktok_tts_chunk, chunk_text, c_path)
+                return (i, c_path if ok else None)
 
             # Generate all chunks in parallel
             tasks = [generate_chunk(i, chunk) for i, chunk in enumerate(chunks)]
@@ -147,37 +632,8 @@ class AIHandler:
             results.sort(key=lambda x: x[0])
             chunk_files = [path for i, path in results if path]
 
-            if chunk_files:
-                # Merge chunks using FFmpeg
-                if len(chunk_files) == 1:
-                    shutil.move(chunk_files[0], output_path)
-                    return True
-                else:
-                    # Create a concat file for FFmpeg
-                    list_path = os.path.join(temp_dir, f"list_{uuid.uuid4().hex[:4]}.txt")
-                    with open(list_path, "w", encoding='utf-8') as f:
-                        for cf in chunk_files:
-                            # FFmpeg needs escaped paths if they have spaces, but here we keep it simple
-                            f.write(f"file '{os.path.abspath(cf)}'\n")
-                    
-                    merge_cmd = [
-                        'ffmpeg', '-y', '-f', 'concat', '-safe', '0',
-                        '-i', list_path, '-c', 'copy', output_path
-                    ]
-                    
-                    try:
-                        subprocess.run(merge_cmd, capture_output=True, check=True)
-                        # Cleanup
-                        os.remove(list_path)
-                        for cf in chunk_files:
-                            try: os.remove(cf)
-                            except: pass
-                        return True
-                    except Exception as e:
-                        logger.error(f"FFmpeg Merge Error: {e}")
-                        # Fallback: just use first chunk if merge fails
-                        shutil.move(chunk_files[0], output_path)
-                        return True
+            if chunk_files and await asyncio.to_thread(self._merge_audio_chunks, chunk_files, output_path):
+                return True
         except Exception as e:
             logger.error(f"TikTok TTS Multi-chunk Error: {e}")
 
@@ -192,11 +648,88 @@ class AIHandler:
             logger.error(f"gTTS Error: {e}")
             return False
 
-    def generate_images_from_prompt(self, prompt, count=5, output_dir="temp/ai_images", model="flux"):
+    def start_image_warm_pool(self):
+        """Starts the background warm pool once per process (disable with IMAGE_WARM_POOL=0)."""
+        if self.image_warm_pool is None and os.getenv("IMAGE_WARM_POOL", "1") != "0":
+            self.image_warm_pool = ImageWarmPool(self)
+            self.image_warm_pool.start()
+        return self.image_warm_pool
+
+    def is_image_idle(self, idle_seconds):
+        """
+        True when no user image job is running and none finished in the last `idle_seconds`,
+        in this process or any other one sharing the image cache (workers, serving processes).
+        """
+        with self._image_jobs_lock:
+            busy = self._image_jobs
+        return busy == 0 and self.image_cache.idle_for() >= idle_seconds
+
+    def _start_image_job(self, prompt, model, size, timeout):
+        self.image_cache.record_request(prompt, model, size)
+        with self._image_jobs_lock:
+            self._image_jobs += 1
+            self.image_cache.mark_busy(self._activity_owner, time.time() + timeout)
+
+    def _finish_image_job(self):
+        with self._image_jobs_lock:
+            self._image_jobs -= 1
+            if self._image_jobs == 0:
+                self.image_cache.mark_busy(self._activity_owner, time.time())
+
+    def _cached_image_slots(self, prompt, model, size, slots, output_dir, seed, use_pool):
+        """Serves slots from the image cache (exact seed hits, else warm-pool images)."""
+        if seed is not None:
+            for i in range(len(slots)):
+                cached = self.image_cache.get(prompt, model, size, seed + i)
+                if cached:
+                    slots[i] = link_or_copy(cached, os.path.join(output_dir, f"ai_gen_{model}_{seed + i}_{i}.jpg"))
+        elif use_pool:
+            for i, (pool_seed, cached) in enumerate(self.image_cache.take_pooled(prompt, model, size, len(slots))):
+                slots[i] = link_or_copy(cached, os.path.join(output_dir, f"ai_gen_{model}_{pool_seed}_{i}.jpg"))
+        return sum(1 for p in slots if p)
+
+    def generate_images_from_prompt(self, prompt, count=5, output_dir="temp/ai_images", model="flux", timeout=None, seed=None):
         """Generates multiple images from a prompt using Pollinations AI (Flux or Zimage model)."""
+        return asyncio.run(self.agenerate_images_from_prompt(prompt, count, output_dir, model, timeout, seed=seed))
+
+    async def agenerate_images_from_prompt(self, prompt, count=5, output_dir="temp/ai_images", model="flux", timeout=None,
+                                           seed=None, use_pool=True, background=False, session=None):
+        """
+        Generates `count` images concurrently (at most POLLINATIONS_CONCURRENCY requests in flight)
+        over one pooled aiohttp session. A failed seed is retried with a fresh seed until the slot
+        succeeds, runs out of attempts, or the overall deadline passes. Images are streamed to disk.
+
+        Slots are first served from the image cache: exact (prompt, model, size, seed) hits when
+        `seed` is given (slot i uses seed + i), otherwise unused warm-pool images for the prompt.
+        Only images generated with the requested seed are cached; a random seed can never be
+        looked up again. `session` lets a long-lived caller (the warm pool) reuse its connections.
+        """
         os.makedirs(output_dir, exist_ok=True)
-        image_paths = []
-        
+        timeout = timeout or self.image_deadline
+        size = f"{IMAGE_WIDTH}x{IMAGE_HEIGHT}"
+        slots = [None] * count
+
+        # The image cache is SQLite (BEGIN IMMEDIATE for take/put): its calls run off the event loop
+        try:
+            if not background:
+                # Inside the try: even if cancelled while waiting, the thread still counts the job
+                await asyncio.to_thread(self._start_image_job, prompt, model, size, timeout)
+            served = await asyncio.to_thread(self._cached_image_slots, prompt, model, size, slots, output_dir, seed, use_pool)
+            if served:
+                logger.info(f"Image cache served {served}/{count} images for prompt: {prompt}")
+                if self.image_warm_pool:
+                    self.image_warm_pool.request_top_up()
+            if served < count:
+                await self._generate_image_slots(prompt, slots, output_dir, model, timeout, seed, size,
+                                                cache_results=not background, session=session)
+        finally:
+            if not background:
+                await asyncio.to_thread(self._finish_image_job)
+        return [p for p in slots if p]
+
+    async def _generate_image_slots(self, prompt, slots, output_dir, model, timeout, seed, size, cache_results=True, session=None):
+        """Fills every empty entry of `slots` with a freshly generated Pollinations image."""
+        count = len(slots)
         api_key = os.getenv("POLLINATIONS_API_KEY")
         headers = {}
         if api_key:
@@ -205,32 +738,52 @@ class AIHandler:
         # Clean prompt for URL
         clean_prompt = requests.utils.quote(prompt)
         
-        logger.info(f"Generating {count} images for prompt: {prompt} using {model} model")
-        
-        for i in range(count):
-            # Use integer seed as required by API
-            import random
-            seed = random.randint(0, 2147483647)
-            
-            # Use gen.pollinations.ai with specified model
-            # Note: Removed nologo as it's not documented in the latest API
-            url = f"https://gen.pollinations.ai/image/{clean_prompt}?seed={seed}&width=1080&height=1920&model={model}"
-            
-            try:
-                resp = requests.get(url, headers=headers, timeout=60)
-                if resp.status_code == 200:
-                    output_filename = f"ai_gen_{model}_{seed}_{i}.jpg"
-                    path = os.path.join(output_dir, output_filename)
-                    with open(path, "wb") as f:
-                        f.write(resp.content)
-                    image_paths.append(path)
-                    logger.info(f"Generated AI image {i+1}/{count}: {path}")
-                else:
-                    logger.error(f"Failed to generate image {i+1}: HTTP {resp.status_code} - {resp.text[:200]}")
-            except Exception as e:
-                logger.error(f"Error generating AI image {i+1}: {e}")
-                
-        return image_paths
+        missing = [i for i in range(count) if not slots[i]]
+        logger.info(f"Generating {len(missing)} images for prompt: {prompt} using {model} model")
+        semaphore = asyncio.Semaphore(self.image_concurrency)
+
+        async def fill_slot(session, i):
+            for attempt in range(self.image_attempts):
+                # Use integer seed as required by API (a requested seed is only tried first)
+                requested = seed is not None and attempt == 0
+                slot_seed = seed + i if requested else random.randint(0, 2147483647)
+                # Use gen.pollinations.ai with specified model
+                # Note: Removed nologo as it's not documented in the latest API
+                url = f"https://gen.pollinations.ai/image/{clean_prompt}?seed={slot_seed}&width={IMAGE_WIDTH}&height={IMAGE_HEIGHT}&model={model}"
+                path = os.path.join(output_dir, f"ai_gen_{model}_{slot_seed}_{i}.jpg")
+                try:
+                    async with semaphore:
+                        await rate_limiter.aacquire(url)
+                        result = await adownload_to_file(session, url, path, headers=headers, timeout=60)
+                        rate_limiter.record(url, result["status"])
+                    if not result["success"]:
+                        logger.error(f"Failed to generate image {i+1} (seed {slot_seed}): {result['error']}")
+                        continue
+                    slots[i] = path
+                    if cache_results and requested:
+                        await asyncio.to_thread(self.image_cache.put, prompt, model, size, slot_seed, path)
+                    logger.info(f"Generated AI image {i+1}/{count} (attempt {attempt+1}): {path}")
+                    return
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.error(f"Error generating AI image {i+1} (seed {slot_seed}): {e}")
+
+        async def fill_all(session):
+            tasks = [asyncio.create_task(fill_slot(session, i)) for i in missing]
+            done, pending = await asyncio.wait(tasks, timeout=timeout)
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+                logger.warning(f"AI image generation hit the {timeout}s deadline with {sum(1 for p in slots if p)}/{count} images")
+
+        if session is not None:
+            await fill_all(session)
+            return
+        connector = aiohttp.TCPConnector(limit=self.image_concurrency)
+        async with aiohttp.ClientSession(connector=connector) as session:
+            await fill_all(session)
 
 if __name__ == "__main__":
     # Test script
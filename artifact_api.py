@@ -0,0 +1,58 @@
+import os
+import re
+import uuid
+import hmac
+from flask import request, send_file, abort
+from artifact_store import file_sha256
+from logger_config import logger
+
+SHA256_RE = re.compile(r"^[0-9a-f]{64}$")
+EXT_RE = re.compile(r"^\.[a-z0-9]{1,5}$")
+
+def register_artifact_routes(app, store):
+    """
+    Serves this node's artifact store to render workers on other nodes:
+    GET/HEAD /artifacts/<sha256> downloads an object, PUT uploads one.
+    Disabled (403) unless ARTIFACT_TOKEN is set; clients send it as a Bearer token.
+    """
+    token = os.getenv("ARTIFACT_TOKEN")
+
+    def check(sha256):
+        supplied = request.headers.get("Authorization", "").removeprefix("Bearer ")
+        if not token or not hmac.compare_digest(supplied, token):
+            abort(403)
+        if not SHA256_RE.match(sha256):
+            abort(404)
+
+    @app.route("/artifacts/<sha256>", methods=["GET"])
+    def artifact_get(sha256):
+        check(sha256)
+        path = store.lookup(sha256)
+        if not path:
+            abort(404)
+        return send_file(os.path.abspath(path), mimetype="application/octet-stream", conditional=True)
+
+    @app.route("/artifacts/<sha256>", methods=["PUT"])
+    def artifact_put(sha256):
+        check(sha256)
+        if store.lookup(sha256):
+            return "", 200
+        ext = request.args.get("ext", "").lower()
+        incoming = os.path.join(store.root, "incoming")
+        os.makedirs(incoming, exist_ok=True)
+        tmp_path = os.path.join(incoming, f"{sha256}.{uuid.uuid4().hex[:8]}{ext if EXT_RE.match(ext) else ''}")
+        try:
+            with open(tmp_path, "wb") as f:
+                while True:
+                    chunk = request.stream.read(64 * 1024)
+                    if not chunk:
+                        break
+                    f.write(chunk)
+            if file_sha256(tmp_path) != sha256:
+                abort(400)
+            store.put(tmp_path, request.args.get("kind", "video"), sha256, link=True)
+            logger.info(f"Artifact {sha256[:12]} received from a remote worker")
+            return "", 201
+        finally:
+            try: os.remove(tmp_path)
+            except OSError: pass
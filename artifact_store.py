@@ -0,0 +1,263 @@
+import os
+import time
+import uuid
+import shutil
+import hashlib
+import sqlite3
+import contextlib
+import threading
+import requests
+from logger_config import logger
+from downloader import download_to_file
+from metrics import export_metrics
+
+STORE_DIR = os.path.join("temp", "store")
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _link_or_copy(src, dst, link=True):
+    """Hardlinks src to dst (replacing dst atomically); copies when hardlinks are unavailable or link=False."""
+    tmp = f"{dst}.{uuid.uuid4().hex[:8]}.link"
+    try:
+        if not link:
+            raise OSError("copy requested")
+        os.link(src, tmp)
+    except OSError:
+        shutil.copy(src, tmp)
+    os.replace(tmp, dst)
+    return dst
+
+class ArtifactStore:
+    """
+    Content-addressed store for images, audio and videos shared by the bot and dashboards.
+    Objects live at objects/<aa>/<bb>/<sha256><ext> and are handed to job workspaces as
+    hardlinks, so a photo scraped or uploaded twice occupies disk once.
+    Every workspace path that points at an object is a reference (SQLite `refs` table);
+    the collector drops references whose file is gone and deletes objects nobody
+    references once they have been idle for `grace` seconds (or the store is over max_bytes).
+    """
+    def __init__(self, root=None, grace=None, max_bytes=None):
+        self.root = root or STORE_DIR
+        self.objects_dir = os.path.join(self.root, "objects")
+        self.db_path = os.path.join(self.root, "index.sqlite")
+        self.grace = float(grace or os.getenv("ARTIFACT_GC_GRACE", 24 * 3600))
+        self.max_bytes = int(max_bytes or os.getenv("ARTIFACT_STORE_MAX_BYTES", 5 * 1024 ** 3))
+        self._collector = None
+        os.makedirs(self.objects_dir, exist_ok=True)
+        with self._connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("""CREATE TABLE IF NOT EXISTS objects (
+                sha256 TEXT PRIMARY KEY, path TEXT, kind TEXT, size INTEGER, created REAL, last_used REAL)""")
+            db.execute("CREATE TABLE IF NOT EXISTS refs (path TEXT PRIMARY KEY, sha256 TEXT)")
+            db.execute("CREATE INDEX IF NOT EXISTS refs_sha ON refs (sha256)")
+            # External identifiers (e.g. Telegram file_unique_id) that are known to name an object
+            db.execute("CREATE TABLE IF NOT EXISTS aliases (key TEXT PRIMARY KEY, sha256 TEXT, created REAL)")
+
+    @contextlib.contextmanager
+    def _connect(self):
+        """One transaction on a fresh connection that is closed afterwards (sqlite3's own `with` only commits)."""
+        with contextlib.closing(sqlite3.connect(self.db_path, timeout=30)) as db, db:
+            yield db
+
+    def object_path(self, sha256, ext=""):
+        return os.path.join(self.objects_dir, sha256[:2], sha256[2:4], sha256 + ext)
+
+    def lookup(self, sha256):
+        """Path of the stored object, or None if it is not in the store."""
+        with self._connect() as db:
+            row = db.execute("SELECT path FROM objects WHERE sha256=?", (sha256,)).fetchone()
+        return row[0] if row and os.path.exists(row[0]) else None
+
+    def _store(self, src_path, kind, sha256, link=True):
+        """Makes sure the object exists (linking or copying src into the store if new). Returns its path."""
+        existing = self.lookup(sha256)
+        if existing:
+            with self._connect() as db:
+                db.execute("UPDATE objects SET last_used=? WHERE sha256=?", (time.time(), sha256))
+            return existing, False
+        path = self.object_path(sha256, os.path.splitext(src_path)[1].lower())
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        _link_or_copy(src_path, path, link)
+        now = time.time()
+        with self._connect() as db:
+            db.execute("INSERT OR REPLACE INTO objects VALUES (?, ?, ?, ?, ?, ?)",
+                       (sha256, path, kind, os.path.getsize(path), now, now))
+        return path, True
+
+    def _add_ref(self, path, sha256):
+        with self._connect() as db:
+            db.execute("INSERT OR REPLACE INTO refs VALUES (?, ?)", (os.path.abspath(path), sha256))
+            db.execute("UPDATE objects SET last_used=? WHERE sha256=?", (time.time(), sha256))
+
+    def put(self, src_path, kind="image", sha256=None, link=False):
+        """
+        Adds a file to the store without referencing src_path. Returns the sha256.
+        src_path is copied, since the store does not own it and a hardlinked object would change
+        if the caller rewrote that path; pass link=True when src_path is deleted right after.
+        """
+        sha256 = sha256 or file_sha256(src_path)
+        self._store(src_path, kind, sha256, link)
+        return sha256
+
+    def adopt(self, path, kind="image", sha256=None):
+        """
+        Takes a freshly written workspace file into the store and keeps `path` as a reference.
+        If the same bytes are already stored, `path` is swapped for a hardlink to that object.
+        Returns the sha256.
+        """
+        sha256 = sha256 or file_sha256(path)
+        object_path, created = self._store(path, kind, sha256)
+        if not created:
+            _link_or_copy(object_path, path)
+        self._add_ref(path, sha256)
+        return sha256
+
+    def materialize(self, sha256, dest_path):
+        """Hardlinks a stored object into a workspace and records the reference. Returns dest_path or None."""
+        object_path = self.lookup(sha256)
+        if not object_path:
+            return None
+        os.makedirs(os.path.dirname(dest_path) or ".", exist_ok=True)
+        _link_or_copy(object_path, dest_path)
+        self._add_ref(dest_path, sha256)
+        return dest_path
+
+    def link_into(self, src_path, dest_path, kind="image"):
+        """Replacement for shutil.copy(src, dest): stores src once and hardlinks it to dest."""
+        return self.materialize(self.put(src_path, kind), dest_path)
+
+    def set_alias(self, key, sha256):
+        with self._connect() as db:
+            db.execute("INSERT OR REPLACE INTO aliases VALUES (?, ?, ?)", (key, sha256, time.time()))
+
+    def resolve_alias(self, key):
+        """sha256 of the object an alias points at, or None if unknown or no longer stored."""
+        with self._connect() as db:
+            row = db.execute("SELECT sha256 FROM aliases WHERE key=?", (key,)).fetchone()
+        return row[0] if row and self.lookup(row[0]) else None
+
+    def sha_for(self, path):
+        """sha256 of a workspace file, from its reference when it has one."""
+        with self._connect() as db:
+            row = db.execute("SELECT sha256 FROM refs WHERE path=?", (os.path.abspath(path),)).fetchone()
+        return row[0] if row else file_sha256(path)
+
+    def release(self, path):
+        """Drops the reference held by a workspace path (the file itself is left to the caller)."""
+        with self._connect() as db:
+            db.execute("DELETE FROM refs WHERE path=?", (os.path.abspath(path),))
+
+    def gc(self):
+        """Prunes dangling references and deletes unreferenced idle objects. Returns objects removed."""
+        now = time.time()
+        with self._connect() as db:
+            refs = db.execute("SELECT path FROM refs").fetchall()
+            gone = [(path,) for (path,) in refs if not os.path.exists(path)]
+            db.executemany("DELETE FROM refs WHERE path=?", gone)
+            rows = db.execute("""SELECT sha256, path, size, last_used FROM objects
+                WHERE sha256 NOT IN (SELECT sha256 FROM refs) ORDER BY last_used""").fetchall()
+            total = db.execute("SELECT COALESCE(SUM(size), 0) FROM objects").fetchone()[0]
+            doomed = []
+            for sha256, path, size, last_used in rows:
+                if last_used < now - self.grace or total > self.max_bytes:
+                    doomed.append((sha256, path))
+                    total -= size
+            db.executemany("DELETE FROM objects WHERE sha256=?", [(sha,) for sha, _ in doomed])
+            db.execute("DELETE FROM aliases WHERE sha256 NOT IN (SELECT sha256 FROM objects)")
+        for _, path in doomed:
+            try: os.remove(path)
+            except OSError: pass
+        if gone or doomed:
+            logger.info(f"Artifact store GC: {len(gone)} stale refs, {len(doomed)} objects removed")
+        self.export()
+        return len(doomed)
+
+    def stats(self):
+        with self._connect() as db:
+            objects, stored = db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM objects").fetchone()
+            refs, referenced = db.execute("""SELECT COUNT(*), COALESCE(SUM(o.size), 0)
+                FROM refs r JOIN objects o ON o.sha256 = r.sha256""").fetchone()
+        return {
+            "objects": objects,
+            "bytes": stored,
+            "refs": refs,
+            # What the workspaces would occupy if every reference were a separate copy
+            "bytes_saved": max(referenced - stored, 0),
+        }
+
+    def export(self):
+        export_metrics("artifact_store", self.stats(), min_interval=0)
+
+    def start_collector(self, interval=None):
+        """Runs gc() every ARTIFACT_GC_INTERVAL seconds in a daemon thread (once per store)."""
+        if self._collector:
+            return
+        interval = float(interval or os.getenv("ARTIFACT_GC_INTERVAL", 3600))
+
+        def loop():
+            while True:
+                try:
+                    self.gc()
+                except Exception as e:
+                    logger.error(f"Artifact store GC error: {e}")
+                time.sleep(interval)
+
+        self._collector = threading.Thread(target=loop, daemon=True, name="artifact-gc")
+        self._collector.start()
+
+class RemoteArtifactClient:
+    """
+    Moves objects between this node's store and the primary node's store over HTTP
+    (the /artifacts routes of the dashboard), so render workers on other machines can
+    fetch job inputs and push their outputs. Configured with ARTIFACT_REMOTE_URL and
+    ARTIFACT_TOKEN; objects are verified against their sha256 on arrival.
+    """
+    def __init__(self, store, base_url, token=None, timeout=120):
+        self.store = store
+        self.base_url = base_url.rstrip("/")
+        self.headers = {"Authorization": f"Bearer {token}"} if token else {}
+        self.timeout = timeout
+
+    @classmethod
+    def from_env(cls, store):
+        """Client for ARTIFACT_REMOTE_URL, or None when this node's store is the shared one."""
+        base_url = os.getenv("ARTIFACT_REMOTE_URL")
+        return cls(store, base_url, os.getenv("ARTIFACT_TOKEN")) if base_url else None
+
+    def ensure(self, sha256, kind="image", ext=""):
+        """Makes sure the object is in the local store, downloading it if needed."""
+        if self.store.lookup(sha256):
+            return True
+        tmp_path = os.path.join(self.store.root, "incoming", f"{sha256}.{uuid.uuid4().hex[:8]}{ext}")
+        result = download_to_file(f"{self.base_url}/artifacts/{sha256}", tmp_path, headers=self.headers,
+                                  timeout=self.timeout, max_bytes=self.store.max_bytes, allowed_types=None)
+        try:
+            if not result["success"]:
+                logger.error(f"Fetching artifact {sha256[:12]} failed: {result['error']}")
+                return False
+            if result["sha256"] != sha256:
+                logger.error(f"Artifact {sha256[:12]} arrived corrupted ({result['sha256'][:12]})")
+                return False
+            self.store.put(tmp_path, kind, sha256, link=True)
+            return True
+        finally:
+            try: os.remove(tmp_path)
+            except OSError: pass
+
+    def push(self, sha256, kind="video"):
+        """Uploads a local object to the shared store (no-op if it already has it)."""
+        path = self.store.lookup(sha256)
+        if not path:
+            raise FileNotFoundError(f"Artifact {sha256[:12]} is not in the local store")
+        url = f"{self.base_url}/artifacts/{sha256}"
+        if requests.head(url, headers=self.headers, timeout=30).status_code == 200:
+            return
+        params = {"kind": kind, "ext": os.path.splitext(path)[1]}
+        with open(path, "rb") as f:
+            resp = requests.put(url, data=f, params=params, headers=self.headers, timeout=self.timeout)
+        resp.raise_for_status()
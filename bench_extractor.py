@@ -0,0 +1,60 @@
+import os
+import re
+import sys
+import time
+from page_extractor import extract_product
+
+# Times product extraction on the saved pages in fixtures/pages.
+# Real product pages are several hundred KB of scripts, so each fixture is padded
+# with inert markup before </body> to reach a realistic size.
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "pages")
+PAD_KB = int(os.getenv("BENCH_PAD_KB", 400))
+ROUNDS = int(os.getenv("BENCH_ROUNDS", 200))
+
+def legacy_extract(html):
+    """The pre-extractor scrape_product logic, kept here as the baseline."""
+    blocked = "captcha" in html.lower() or "verify" in html.lower() and "challenge" in html.lower()
+    title_match = re.search(r'"title":"(.*?)"', html)
+    found = re.findall(r'https://[a-zA-Z0-9.-]+\.(?:byteimg|tiktokcdn)\.com/[a-zA-Z0-9/_.-]+~plv-photomode-video:1080:1080\.jpeg', html)
+    if not found:
+        found = re.findall(r'https://[a-zA-Z0-9.-]+\.(?:byteimg|tiktokcdn)\.com/[a-zA-Z0-9/_.-]+\.(?:webp|jpg|jpeg)', html)
+    return blocked, title_match, found
+
+PADDING = '<div class="x">' + "lorem ipsum dolor sit amet " * 37 + "</div>\n"
+
+def pad_html(html, kb=PAD_KB):
+    """Inserts ~kb KB of inert markup before </body> so fixtures weigh as much as real pages."""
+    filler = PADDING * max(kb * 1024 // len(PADDING), 0)
+    return html.replace("</body>", filler + "</body>", 1)
+
+def load_fixtures():
+    pages = {}
+    for name in sorted(os.listdir(FIXTURES_DIR)):
+        if name.endswith(".html"):
+            with open(os.path.join(FIXTURES_DIR, name), encoding="utf-8") as f:
+                pages[name] = pad_html(f.read())
+    return pages
+
+def bench(func, html):
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        func(html)
+    return (time.perf_counter() - start) / ROUNDS * 1000
+
+def main():
+    pages = load_fixtures()
+    if not pages:
+        print(f"No fixtures found in {FIXTURES_DIR}")
+        return 1
+    print(f"{ROUNDS} rounds per page, pages padded to ~{PAD_KB} KB\n")
+    print(f"{'fixture':<28}{'size KB':>9}{'legacy ms':>11}{'new ms':>9}  source / title")
+    for name, html in pages.items():
+        record = extract_product(html)
+        legacy_ms = bench(legacy_extract, html)
+        new_ms = bench(extract_product, html)
+        print(f"{name:<28}{len(html) // 1024:>9}{legacy_ms:>11.3f}{new_ms:>9.3f}  {record['source']} / {record['title']}")
+        print(f"{'':<28}{len(record['image_urls'])} images, price={record['price']}, shop={record['shop']}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
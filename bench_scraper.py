@@ -0,0 +1,135 @@
+import os
+import sys
+import json
+import logging
+import time
+import tempfile
+import threading
+import tracemalloc
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from scraper import TikTokShopScraper
+from scrape_cache import ScrapeCache
+from logger_config import logger
+from bench_extractor import pad_html
+
+# Offline harness for TikTokShopScraper: serves the saved corpus in fixtures/pages from a
+# local HTTP server (pages padded to BENCH_PAD_KB, like bench_extractor) and reports
+# extraction accuracy, parse throughput and memory per page.
+# No network access is needed; run it after every extractor change.
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "pages")
+ROUNDS = int(os.getenv("BENCH_ROUNDS", 50))
+# A tiny valid JPEG header is enough for the redirect-to-image case
+FAKE_JPEG = b"\xff\xd8\xff\xe0" + b"\x00" * 256 + b"\xff\xd9"
+
+def load_corpus():
+    with open(os.path.join(FIXTURES_DIR, "corpus.json"), encoding="utf-8") as f:
+        corpus = json.load(f)
+    for case in corpus["pages"]:
+        if case.get("file"):
+            with open(os.path.join(FIXTURES_DIR, case["file"]), encoding="utf-8") as f:
+                case["html"] = pad_html(f.read())
+    return corpus
+
+def start_server(cases):
+    """Serves /page/<name> for every corpus case and /img/* as a JPEG. Returns (server, base_url)."""
+    by_name = {case["name"]: case for case in cases}
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # Headers and body are separate writes; without this, delayed ACKs cap keep-alive at ~25 req/s
+        disable_nagle_algorithm = True
+
+        def do_GET(self):
+            if self.path.startswith("/img/"):
+                return self._send(200, FAKE_JPEG, "image/jpeg")
+            case = by_name.get(self.path.rsplit("/", 1)[-1])
+            if not case:
+                return self._send(404, b"not found", "text/plain")
+            if case.get("redirect"):
+                self.send_response(302)
+                self.send_header("Location", case["redirect"])
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self._send(case.get("status", 200), case["html"].encode("utf-8"), "text/html; charset=utf-8")
+
+        def _send(self, status, body, content_type):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+def check(result, expect):
+    """Returns the list of expected fields the scrape result got wrong."""
+    actual = {
+        "success": result.get("success"),
+        "is_captcha": result.get("is_captcha", False),
+        "is_direct": result.get("is_direct", False),
+        "product_name": result.get("product_name"),
+        "image_count": len(result.get("image_urls") or []),
+        "price": result.get("price"),
+        "shop": result.get("shop"),
+    }
+    return [f"{key}: expected {value!r}, got {actual[key]!r}" for key, value in expect.items() if actual[key] != value]
+
+def main():
+    # Per-page INFO/WARNING lines would drown the report
+    logger.setLevel(logging.ERROR)
+    corpus = load_corpus()
+    server, base_url = start_server(corpus["pages"])
+    scraper = TikTokShopScraper(temp_dir=tempfile.mkdtemp(prefix="bench_scraper_"))
+    # Private cache so results are never served from (or written to) the real one
+    scraper.cache = ScrapeCache(db_path=os.path.join(scraper.temp_dir, "scraper.sqlite"), product_ttl=-1, url_ttl=-1)
+    failures = 0
+
+    print("Extraction accuracy (via local server)")
+    for case in corpus["pages"]:
+        result = scraper.scrape_product(f"{base_url}/page/{case['name']}")
+        errors = check(result, case["expect"])
+        failures += bool(errors)
+        print(f"  {'OK  ' if not errors else 'FAIL'} {case['name']}" + "".join(f"\n         {e}" for e in errors))
+
+    print("\nextract_urls")
+    for link in corpus["links"]:
+        urls = scraper.extract_urls(link["text"])
+        ok = urls == link["expect"]
+        failures += not ok
+        print(f"  {'OK  ' if ok else 'FAIL'} {link['text'][:60]!r}" + ("" if ok else f"\n         got {urls}"))
+
+    print(f"\nThroughput ({ROUNDS} rounds)")
+    pages = [case for case in corpus["pages"] if case.get("html")]
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        for case in pages:
+            scraper._parse_product_page(case["name"], case.get("status", 200), case["html"])
+    parse_rate = ROUNDS * len(pages) / (time.perf_counter() - start)
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        for case in corpus["pages"]:
+            scraper.scrape_product(f"{base_url}/page/{case['name']}")
+    fetch_rate = ROUNDS * len(corpus["pages"]) / (time.perf_counter() - start)
+    print(f"  parse only:        {parse_rate:10.1f} pages/s")
+    print(f"  fetch + parse:     {fetch_rate:10.1f} pages/s (keep-alive session, local server)")
+
+    print("\nMemory per page (tracemalloc peak during parse)")
+    for case in pages:
+        tracemalloc.start()
+        scraper._parse_product_page(case["name"], case.get("status", 200), case["html"])
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"  {case['name']:<20} {len(case['html']) / 1024:8.1f} KB page {peak / 1024:8.1f} KB peak")
+
+    server.shutdown()
+    print(f"\n{failures} failure(s)")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,15 +2,24 @@ import os
 import logging
 import shutil
 import json
+import uuid
+import asyncio
+import weakref
+import contextlib
 from datetime import datetime
 from telegram import Update, ReplyKeyboardMarkup, ReplyKeyboardRemove, KeyboardButton
-from telegram.ext import ApplicationBuilder, ContextTypes, CommandHandler, MessageHandler, filters, ConversationHandler
+from telegram.ext import ApplicationBuilder, BaseUpdateProcessor, ContextTypes, CommandHandler, MessageHandler, filters, ConversationHandler
 from dotenv import load_dotenv
 
 from ai_handler import AIHandler
 from video_processor import VideoProcessor
 from logger_config import logger
 from scraper import TikTokShopScraper
+from artifact_store import ArtifactStore
+from delivery_cache import VideoDeliveryCache
+from job_executor import JobExecutor
+from job_queue import get_job_queue
+from render_jobs import arender_video
 
 # Load environment variables
 load_dotenv()
@@ -30,12 +39,52 @@ CONFIRM_KEYBOARD = ReplyKeyboardMarkup([
     [KeyboardButton("Batal ❌")]
 ], resize_keyboard=True)
 
+class ChatSerialUpdateProcessor(BaseUpdateProcessor):
+    """
+    Processes updates from different chats concurrently but one at a time per chat, so the
+    ConversationHandler state and the per-chat temp files never see two updates of one chat at once.
+    The chat lock is taken before a concurrency slot: a chat waiting on its own render holds no slot.
+    """
+    def __init__(self, max_concurrent_updates):
+        super().__init__(max_concurrent_updates)
+        self._chat_locks = weakref.WeakValueDictionary()
+
+    def _chat_lock(self, update):
+        chat = update.effective_chat if isinstance(update, Update) else None
+        if chat is None:
+            return contextlib.nullcontext()
+        lock = self._chat_locks.get(chat.id)
+        if lock is None:
+            lock = self._chat_locks[chat.id] = asyncio.Lock()
+        return lock
+
+    async def process_update(self, update, coroutine):
+        async with self._chat_lock(update):
+            await super().process_update(update, coroutine)
+
+    async def do_process_update(self, update, coroutine):
+        await coroutine
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
 class TikTokBot:
     def __init__(self):
         logger.info("Bot class initialized")
         self.ai_handler = AIHandler()
         self.video_processor = VideoProcessor()
         self.scraper = TikTokShopScraper()
+        self.artifact_store = ArtifactStore()
+        self.artifact_store.start_collector()
+        # Telegram file_id of every delivered render, so repeats are sent without re-uploading
+        self.video_deliveries = VideoDeliveryCache()
+        # Renders and other blocking work run here so the event loop keeps serving other users
+        self.jobs = JobExecutor()
+        # Renders are queued for worker.py processes (RENDER_MODE=inline renders on self.jobs instead)
+        self.render_queue = get_job_queue()
         self.temp_dir = "temp"
         os.makedirs(self.temp_dir, exist_ok=True)
         # Create bot-specific temp folder
@@ -76,6 +125,7 @@ class TikTokBot:
         logger.info(f"User {user.username} (ID: {user.id}) started the bot")
         self._save_user_data(user)
         context.user_data['images'] = []
+        context.user_data['products'] = []
         context.user_data['product_name'] = None
         
         welcome_text = (
@@ -132,35 +182,41 @@ class TikTokBot:
             
             all_images = []
             all_product_names = []
+            all_products = []
             captcha_hit = False
             
-            for i, url in enumerate(urls):
-                try:
-                    if num_links > 1:
-                        await status_msg.edit_text(f"⏳ Sedang memproses link {i+1} dari {num_links}...")
-                    
-                    result = self.scraper.scrape_product(url)
-                    if result['success'] and result.get('image_urls'):
-                        # Add to product names list
-                        if result['product_name'] not in all_product_names:
-                            all_product_names.append(result['product_name'])
-                        
-                        # Use less images per product if bulk to avoid too long video
-                        # If 1 link: use up to 6, if 10 links: use up to 2 per product
-                        limit = 6 if num_links == 1 else 3
-                        img_urls = result['image_urls'][:limit]
-                        
-                        paths = self.scraper.download_images(img_urls, chat_id)
-                        all_images.extend(paths)
-                    elif result.get('is_captcha'):
-                        captcha_hit = True
-                except Exception as e:
-                    logger.error(f"Error processing link {url}: {e}")
+            async def report_progress(done, total, url, result):
+                if total > 1:
+                    try:
+                        await status_msg.edit_text(f"⏳ {done} dari {total} link selesai diproses...")
+                    except: pass
+
+            # Use less images per product if bulk to avoid too long video
+            # If 1 link: use up to 6, if more links: use up to 3 per product
+            limit = 6 if num_links == 1 else 3
+            results = await self.scraper.scrape_products_async(urls, chat_id, image_limit=limit, on_progress=report_progress)
+
+            for url, result in zip(urls, results):
+                if result['success'] and result.get('image_urls'):
+                    # Add to product names list
+                    if result['product_name'] not in all_product_names:
+                        all_product_names.append(result['product_name'])
+
+                    paths = result.get('image_paths', [])
+                    all_images.extend(paths)
+                    if paths:
+                        all_products.append({"name": result['product_name'], "images": paths,
+                                             "price": result.get('price'), "shop": result.get('shop')})
+                elif result.get('is_captcha'):
+                    captcha_hit = True
+                elif not result['success']:
+                    logger.error(f"Error processing link {url}: {result.get('error')}")
 
             if all_images:
                 if 'images' not in context.user_data:
                     context.user_data['images'] = []
                 context.user_data['images'].extend(all_images)
+                context.user_data.setdefault('products', []).extend(all_products)
                 
                 # Combine product names (suggest first one or join first few)
                 if all_product_names:
@@ -187,11 +243,21 @@ class TikTokBot:
             context.user_data['images'] = []
         
         chat_id = update.message.chat_id
-        photo_file = await update.message.photo[-1].get_file()
+        photo = self._pick_photo_size(update.message.photo)
         
         image_idx = len(context.user_data['images'])
-        image_path = os.path.join(self.temp_dir, f"img_{chat_id}_{image_idx}.jpg")
-        await photo_file.download_to_drive(image_path)
+        # Unique name: workspace files may be hardlinks into the artifact store and must never be overwritten
+        image_path = os.path.join(self.temp_dir, f"img_{chat_id}_{image_idx}_{uuid.uuid4().hex[:6]}.jpg")
+
+        # Forwarded/re-sent photos keep their file_unique_id: link them from the store, no Telegram call
+        alias = f"telegram:{photo.file_unique_id}"
+        sha256 = self.artifact_store.resolve_alias(alias)
+        if sha256 and self.artifact_store.materialize(sha256, image_path):
+            logger.info(f"Known photo {photo.file_unique_id} linked from the artifact store")
+        else:
+            photo_file = await photo.get_file()
+            await photo_file.download_to_drive(image_path)
+            self.artifact_store.set_alias(alias, await self.jobs.run_io(self.artifact_store.adopt, image_path, "image"))
         
         context.user_data['images'].append(image_path)
         
@@ -205,6 +271,17 @@ class TikTokBot:
         )
         return WAITING_FOR_IMAGES
 
+    @staticmethod
+    def _pick_photo_size(sizes, width=1080, height=1920):
+        """
+        Smallest PhotoSize the renderer does not have to upscale (it fits images into a
+        width x height frame, so one side reaching the frame is enough); the largest otherwise.
+        """
+        covering = [p for p in sizes if p.width >= width or p.height >= height]
+        if covering:
+            return min(covering, key=lambda p: p.width * p.height)
+        return max(sizes, key=lambda p: p.width * p.height)
+
     async def finish_upload(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         images = context.user_data.get('images', [])
         if not images:
@@ -244,6 +321,7 @@ class TikTokBot:
         """Deletes temporary files related to a specific chat session."""
         images = context.user_data.get('images', [])
         for img in images:
+            self.artifact_store.release(img)
             if os.path.exists(img):
                 try: os.remove(img)
                 except: pass
@@ -252,16 +330,139 @@ class TikTokBot:
         video_path = os.path.join(self.temp_dir, f"video_{chat_id}.mp4")
         
         for path in [audio_path, video_path]:
+            self.artifact_store.release(path)
             if os.path.exists(path):
                 try: os.remove(path)
                 except: pass
         
         context.user_data['images'] = []
+        context.user_data['products'] = []
+
+    def _find_background_music(self):
+        """Returns the uploaded background soundtrack (MP3, MP4, MOV, etc.) or None."""
+        music_dir = os.path.join("assets", "music")
+        bg_files = [f for f in os.listdir(music_dir) if f.startswith("background.")] if os.path.exists(music_dir) else []
+        return os.path.join(music_dir, bg_files[0]) if bg_files else None
+
+    def _product_metadata(self, context):
+        """Scraped metadata of the first product (used by the template fallback engine)."""
+        products = context.user_data.get('products') or []
+        return products[0] if products else None
+
+    def _bulk_products(self, context, product_name):
+        """
+        Returns the scraped products when the user confirmed the suggested bulk name and
+        every collected image belongs to one of them, otherwise None (single video mode).
+        """
+        products = context.user_data.get('products', [])
+        images = context.user_data.get('images', [])
+        if len(products) < 2 or product_name.strip() != (context.user_data.get('product_name') or '').strip():
+            return None
+        if sum(len(p['images']) for p in products) != len(images):
+            return None
+        return products
+
+    def _render_fingerprint(self, images, audio_path, music_path):
+        image_hashes = [self.artifact_store.sha_for(path) for path in images]
+        return self.video_processor.render_fingerprint(image_hashes, self.artifact_store.sha_for(audio_path), music_path)
+
+    async def _send_cached_video(self, update, fingerprint, caption):
+        """Re-sends a previously delivered render by file_id. Returns False if it has to be uploaded."""
+        file_id = self.video_deliveries.get(fingerprint)
+        if not file_id:
+            return False
+        try:
+            await update.message.reply_video(video=file_id, caption=caption, parse_mode='Markdown')
+        except Exception as e:
+            logger.warning(f"Sending cached file_id for render {fingerprint[:12]} failed: {e}")
+            self.video_deliveries.invalidate(fingerprint)
+            return False
+        self.video_deliveries.mark_sent(fingerprint)
+        logger.info(f"Render {fingerprint[:12]} re-sent by file_id (no upload)")
+        return True
+
+    async def _upload_video(self, update, fingerprint, video_path, caption):
+        """Uploads a fresh render and records the file_id Telegram assigns to it."""
+        with open(video_path, 'rb') as video:
+            message = await update.message.reply_video(
+                video=video,
+                caption=caption,
+                parse_mode='Markdown',
+                write_timeout=300
+            )
+        if message.video:
+            self.video_deliveries.put(fingerprint, message.video.file_id)
+
+    async def handle_bulk_products(self, update: Update, context: ContextTypes.DEFAULT_TYPE, products):
+        """Creates one video per scraped product, with all scripts from a single batched LLM call."""
+        chat_id = update.message.chat_id
+        total = len(products)
+        status_msg = await update.message.reply_text(f"✍️ Menulis {total} naskah sekaligus...")
+
+        try:
+            try:
+                descriptions = await self.ai_handler.agenerate_product_descriptions_batch(
+                    [p['name'] for p in products], timeout=self.ai_handler.fallback_deadline
+                )
+                engine = "groq"
+            except Exception as e:
+                logger.warning(f"Batch description failed ({type(e).__name__}: {e}), using template engine")
+                descriptions = [self.ai_handler.template_engine.generate(p['name'], p) for p in products]
+                engine = self.ai_handler.template_engine.name
+            logger.info(f"Bulk descriptions for {total} products written by engine: {engine}")
+
+            music_path = self._find_background_music()
+            for i, (product, description) in enumerate(zip(products, descriptions)):
+                try:
+                    await status_msg.edit_text(f"🎬 Membuat video {i+1} dari {total}: {product['name'][:60]}")
+                except: pass
+
+                audio_path = os.path.join(self.temp_dir, f"audio_{chat_id}_{i}.mp3")
+                video_path = os.path.join(self.temp_dir, f"video_{chat_id}_{i}.mp4")
+                try:
+                    if not await self.ai_handler.text_to_speech(description, audio_path):
+                        raise Exception("Gagal menghasilkan suara (TTS).")
+                    caption = f"📦 *Produk:* {product['name']}\n\n*Salin Deskripsi:* \n```{description}```"
+                    fingerprint = await self.jobs.run_io(self._render_fingerprint, product['images'], audio_path, music_path)
+                    if not await self._send_cached_video(update, fingerprint, caption):
+                        await arender_video(
+                            self.render_queue, self.artifact_store, self.jobs,
+                            product['images'],
+                            audio_path,
+                            video_path,
+                            bg_music_path=music_path,
+                            description=description,
+                            priority=5
+                        )
+                        await self._upload_video(update, fingerprint, video_path, caption)
+                except Exception as e:
+                    logger.error(f"Bulk video {i+1}/{total} failed for {product['name']}: {e}")
+                    await update.message.reply_text(f"❌ *Gagal video {i+1}:* {str(e)}", parse_mode='Markdown')
+                finally:
+                    for path in [audio_path, video_path]:
+                        self.artifact_store.release(path)
+                        if os.path.exists(path):
+                            try: os.remove(path)
+                            except: pass
+
+            await status_msg.delete()
+            await update.message.reply_text(f"✅ *{total} Video Selesai Diproses!* \nKetik /start atau kirim link lagi untuk buat yang baru.", parse_mode='Markdown')
+        except Exception as e:
+            logger.error(f"Error detail: {e}")
+            await update.message.reply_text(f"❌ *Gagal:* {str(e)}", parse_mode='Markdown')
+
+        await self.cleanup_user_data(chat_id, context)
+        return ConversationHandler.END
 
     async def handle_product_name(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         product_name = update.message.text
         chat_id = update.message.chat_id
         images = context.user_data.get('images', [])
+
+        # Bulk link mode: one video per product instead of one combined slideshow
+        products = self._bulk_products(context, product_name)
+        if products:
+            return await self.handle_bulk_products(update, context, products)
         
         # Initial status
         status_msg = await update.message.reply_text("⏳ Persiapan dimulai...")
@@ -275,52 +476,49 @@ class TikTokBot:
             except: pass
 
         try:
-            # 1. Generate Description
-            await update_progress(1, 4, "✍️ Sedang menulis deskripsi produk yang persuasif...")
+            # 1 & 2. Generate Description + Text to Speech (streamed sentence by sentence)
+            await update_progress(1, 4, "✍️ Menulis deskripsi & menghasilkan suara AI (TikTok Voice)...")
             logger.info(f"Generating description for product: {product_name}")
-            try:
-                description = self.ai_handler.generate_product_description(product_name)
-            except Exception as e:
-                raise Exception(f"Gagal membuat deskripsi (Groq): {e}")
-            
-            # 2. Text to Speech
-            await update_progress(2, 4, "🎙️ Menghasilkan pengisi suara AI (TikTok Voice)...")
             audio_path = os.path.join(self.temp_dir, f"audio_{chat_id}.mp3")
-            success_tts = await self.ai_handler.text_to_speech(description, audio_path)
-            
-            if not success_tts:
+            result = await self.ai_handler.stream_description_to_speech(
+                product_name, audio_path, metadata=self._product_metadata(context)
+            )
+            description = result['description']
+            logger.info(f"Description for {product_name} written by engine: {result['engine']}")
+
+            if not result['success']:
                 raise Exception("Gagal menghasilkan suara (TTS).")
+            await update_progress(2, 4, "🎙️ Pengisi suara AI selesai dibuat...")
 
             # 3. Create Video
             await update_progress(3, 4, "🎬 Mengolah video slideshow, musik & subtitle...")
             video_path = os.path.join(self.temp_dir, f"video_{chat_id}.mp4")
             
             # Look for any background soundtrack (MP3, MP4, MOV, etc.)
-            music_dir = os.path.join("assets", "music")
-            bg_files = [f for f in os.listdir(music_dir) if f.startswith("background.")] if os.path.exists(music_dir) else []
-            music_path = os.path.join(music_dir, bg_files[0]) if bg_files else None
-            
-            try:
-                self.video_processor.create_video_from_images_and_audio(
-                    images, 
-                    audio_path, 
-                    video_path, 
-                    bg_music_path=music_path,
-                    description=description
-                )
-            except Exception as e:
-                raise Exception(f"Gagal mengolah video (FFmpeg): {e}")
-            
-            # 4. Finalizing
-            await update_progress(4, 4, "✨ Video hampir siap! Sedang mengunggah...")
+            music_path = self._find_background_music()
+            caption = f"📦 *Produk:* {product_name}\n\n*Salin Deskripsi:* \n```{description}```"
             
-            with open(video_path, 'rb') as video:
-                await update.message.reply_video(
-                    video=video, 
-                    caption=f"📦 *Produk:* {product_name}\n\n*Salin Deskripsi:* \n```{description}```",
-                    parse_mode='Markdown',
-                    write_timeout=300
-                )
+            # Identical inputs were rendered and delivered before: resend by file_id
+            fingerprint = await self.jobs.run_io(self._render_fingerprint, images, audio_path, music_path)
+            if not await self._send_cached_video(update, fingerprint, caption):
+                try:
+                    await arender_video(
+                        self.render_queue, self.artifact_store, self.jobs,
+                        images, 
+                        audio_path, 
+                        video_path, 
+                        bg_music_path=music_path,
+                        description=description,
+                        priority=10
+                    )
+                except Exception as e:
+                    raise Exception(f"Gagal mengolah video (FFmpeg): {e}")
+                # Keep the render in the store (outlives the workspace until GC) for repeat deliveries
+                await self.jobs.run_io(self.artifact_store.adopt, video_path, "video")
+                
+                # 4. Finalizing
+                await update_progress(4, 4, "✨ Video hampir siap! Sedang mengunggah...")
+                await self._upload_video(update, fingerprint, video_path, caption)
             
             await status_msg.delete()
             await self.cleanup_user_data(chat_id, context)
@@ -339,6 +537,11 @@ class TikTokBot:
         await update.message.reply_text("❌ Proses dibatalkan. Ketik /start untuk mulai lagi.", reply_markup=ReplyKeyboardRemove())
         return ConversationHandler.END
 
+    async def shutdown(self, application):
+        """Closes the scraper's keep-alive HTTP session and the job executor when the bot stops."""
+        await self.scraper.close_async_session()
+        self.jobs.shutdown(wait=False)
+
     def run(self):
         token = os.getenv("TELEGRAM_BOT_TOKEN")
         if not token:
@@ -346,7 +549,10 @@ class TikTokBot:
             return
 
         # Menambahkan timeout global pada aplikasi
-        app = ApplicationBuilder().token(token).read_timeout(300).write_timeout(300).build()
+        # Updates from different chats are processed concurrently (one at a time per chat); heavy work is awaited on the job executor
+        app = (ApplicationBuilder().token(token).read_timeout(300).write_timeout(300)
+               .concurrent_updates(ChatSerialUpdateProcessor(int(os.getenv("BOT_CONCURRENT_UPDATES", 32))))
+               .post_shutdown(self.shutdown).build())
 
         # Command handlers
         app.add_handler(CommandHandler("help", self.help_command))
@@ -0,0 +1,140 @@
+import os
+import time
+import shutil
+import asyncio
+import functools
+from logger_config import logger
+from video_processor import VideoProcessor
+from artifact_store import RemoteArtifactClient
+from job_queue import PermanentJobError
+from render_jobs import WORKER_DIR, input_fetcher
+from gallery_index import GalleryIndex
+
+AFFILIATE_KIND = "affiliate_video"
+MUSIC_KIND = "music_video"
+WEB_UPLOAD_FOLDER = os.path.join("temp", "web_uploads")
+
+# Handlers are created on first use so a worker only loads what its jobs need
+@functools.lru_cache(maxsize=None)
+def _ai_handler():
+    from ai_handler import AIHandler
+    return AIHandler()
+
+@functools.lru_cache(maxsize=None)
+def _scraper():
+    from scraper import TikTokShopScraper
+    return TikTokShopScraper()
+
+@functools.lru_cache(maxsize=None)
+def _gallery_index():
+    return GalleryIndex(WEB_UPLOAD_FOLDER)
+
+def finalize_session(job, store):
+    """
+    Links a finished dashboard job's video and script into its gallery session folder and
+    the gallery index. Idempotent: the worker calls it on the same node, the dashboard
+    whenever it reports the job as done (which covers workers on other nodes). Returns the video path.
+    """
+    result = job["result"]
+    session_dir = os.path.join(WEB_UPLOAD_FOLDER, result["session_id"])
+    video_path = os.path.join(session_dir, result["filename"])
+    if not os.path.exists(video_path) and not store.materialize(result["video"], video_path):
+        raise FileNotFoundError(f"Video of job {job['id']} is missing from the artifact store")
+    script_path = os.path.join(session_dir, "script.txt")
+    if not os.path.exists(script_path):
+        with open(script_path, "w", encoding='utf-8') as f:
+            f.write(result.get("script", ""))
+    try:
+        _gallery_index().add(video_path, script=result.get("script", ""),
+                             product=result.get("product_name"), created=time.time())
+    except Exception as e:
+        logger.error(f"Gallery index error for job {job['id']}: {e}")
+    return video_path
+
+def _run_content_job(job, store, report, produce):
+    """
+    Shared frame of the dashboard jobs: a scratch folder, input fetching, the render with
+    ffmpeg progress, storing the video and (on the primary node) filing it in the gallery.
+    `produce(workdir, fetch)` returns (image_paths, audio_path, bg_music_path, script, extra_result).
+    """
+    payload = job["payload"]
+    remote = RemoteArtifactClient.from_env(store)
+    workdir = os.path.join(WORKER_DIR, job["id"])
+    os.makedirs(workdir, exist_ok=True)
+    try:
+        images, audio_path, music_path, script, extra = produce(workdir, input_fetcher(store, remote, workdir))
+
+        report("rendering", 70)
+        output_path = os.path.join(workdir, "video.mp4")
+        VideoProcessor.create_video_from_images_and_audio(
+            images, audio_path, output_path, bg_music_path=music_path,
+            on_progress=lambda fraction: report("rendering", 70 + 25 * fraction))
+
+        report("storing", 96)
+        sha256 = store.put(output_path, "video", link=True)
+        if remote:
+            remote.push(sha256, "video")
+        result = {"video": sha256, "size": os.path.getsize(output_path), "session_id": payload["session_id"],
+                  "filename": payload["filename"], "script": script, **extra}
+        if not remote:
+            finalize_session({"id": job["id"], "result": result}, store)
+        logger.info(f"{job['kind']} job {job['id']} produced {sha256[:12]}")
+        return result
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def run_affiliate_job(job, store, report):
+    """Scrape (optional) -> script -> images -> voiceover -> render, for /generate_affiliate."""
+    payload = job["payload"]
+    ai_handler = _ai_handler()
+
+    def produce(workdir, fetch):
+        product = {}
+        if payload.get("url"):
+            report("scraping", 5)
+            product = _scraper().scrape_product(payload["url"])
+            if not product.get("success") and not payload.get("images"):
+                raise PermanentJobError(f"Gagal mengambil produk: {product.get('error') or 'halaman diblokir'}")
+
+        report("writing script", 20)
+        target_name = payload.get("product_name") or product.get("product_name") or "Produk Viral"
+        description = ai_handler.generate_description_with_fallback(target_name, product or None)["description"]
+
+        report("collecting images", 35)
+        if payload.get("images"):
+            images = [fetch(item, f"manual_img_{i}", "image") for i, item in enumerate(payload["images"])]
+        else:
+            images = []
+            for i, img_url in enumerate((product.get("image_urls") or [])[:6]):
+                path = os.path.join(workdir, f"img_{i}.jpg")
+                if _scraper().download_image(img_url, path):
+                    images.append(path)
+        if not images:
+            raise PermanentJobError("Gagal mendapatkan gambar. Berikan link valid atau upload foto manual.")
+
+        report("voiceover", 50)
+        audio_path = os.path.join(workdir, "voice.mp3")
+        if not asyncio.run(ai_handler.text_to_speech(description, audio_path)):
+            raise RuntimeError("Gagal menghasilkan suara (TTS).")
+        music_path = fetch(payload["music"], "background", "audio") if payload.get("music") else None
+        return images, audio_path, music_path, description, {"product_name": target_name}
+
+    return _run_content_job(job, store, report, produce)
+
+def run_music_job(job, store, report):
+    """Uploaded track + manual or AI visuals -> render, for /generate_music."""
+    payload = job["payload"]
+
+    def produce(workdir, fetch):
+        report("preparing", 5)
+        audio_path = fetch(payload["audio"], "music", "audio")
+        images = [fetch(item, f"man_{i}", "image") for i, item in enumerate(payload.get("images") or [])]
+        if not images or payload.get("image_prompt"):
+            report("generating visuals", 20)
+            images += _ai_handler().generate_images_from_prompt(
+                payload["prompt"], count=5, output_dir=workdir, model=payload.get("ai_model", "flux"))
+        if not images:
+            raise RuntimeError("Gagal mendapatkan gambar (AI atau Manual)!")
+        return images, audio_path, None, payload["prompt"], {}
+
+    return _run_content_job(job, store, report, produce)
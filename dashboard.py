@@ -1,8 +1,10 @@
-from flask import Flask, render_template_string, request, send_from_directory, redirect, url_for, flash, session
+from flask import Flask, render_template_string, request, send_from_directory, redirect, url_for, flash, session, jsonify
 import os
 import re
 import uuid
+import time
 import shutil
+import asyncio
 from datetime import datetime
 from functools import wraps
 from dotenv import load_dotenv
@@ -10,6 +12,12 @@ from ai_handler import AIHandler
 from video_processor import VideoProcessor
 from scraper import TikTokShopScraper
 from logger_config import logger
+from artifact_store import ArtifactStore
+from artifact_api import register_artifact_routes
+from job_queue import get_job_queue, SUCCEEDED, FAILED
+from render_jobs import RENDER_KIND, enqueue_render, collect_render
+from worker import start_local_worker
+from gallery_index import GalleryIndex
 
 load_dotenv()
 
@@ -25,11 +33,31 @@ os.makedirs(MUSIC_FOLDER, exist_ok=True)
 
 # Security
 DASHBOARD_AUTH_KEY = os.getenv("DASHBOARD_AUTH_KEY", "admin123") # Default for fallback
+GALLERY_PAGE_SIZE = int(os.getenv("GALLERY_PAGE_SIZE", 24))
+# Gallery sort options (gallery_index.SORTS) and their labels
+GALLERY_SORTS = {"newest": "Terbaru", "oldest": "Terlama", "largest": "Terbesar", "longest": "Terpanjang", "name": "Nama"}
 
 # Initialize Handlers
 ai_handler = AIHandler()
 video_processor = VideoProcessor()
 scraper = TikTokShopScraper()
+# Uploads and renders are content-addressed and hardlinked into session folders
+artifact_store = ArtifactStore()
+# Renders are handed to worker.py processes through the shared job queue
+render_queue = get_job_queue()
+# The gallery pages through a SQLite index instead of walking the upload folder
+gallery_index = GalleryIndex(UPLOAD_FOLDER)
+# Render workers on other nodes fetch inputs from / push videos to this node's store
+register_artifact_routes(app, artifact_store)
+
+def start_background_services():
+    """
+    Starts the artifact GC, the gallery index reconcile and (RENDER_MODE=inline) the in-process
+    render worker; serve.py calls this in one serving process per node.
+    """
+    artifact_store.start_collector()
+    gallery_index.start_reconcile()
+    start_local_worker(artifact_store)
 
 def login_required(f):
     @wraps(f)
@@ -363,6 +391,19 @@ CREATE_CONTENT = """
         </div>
 
         <script>
+            {% if job_id %}
+            // A queued render: poll its state and reload once it has finished
+            document.getElementById('loading-overlay').classList.remove('hidden');
+            document.getElementById('loading-overlay').classList.add('flex');
+            (function follow() {
+                fetch('/jobs/{{ job_id }}').then(r => r.json()).then(job => {
+                    if (job.error && !job.state) { window.location = '/create'; return; }
+                    document.getElementById('status-text').innerText = '📽️ ' + (job.stage || job.state) + ' ' + Math.round(job.progress || 0) + '%';
+                    if (job.state === 'succeeded' || job.state === 'failed') { window.location.reload(); return; }
+                    setTimeout(follow, 2000);
+                }).catch(() => setTimeout(follow, 5000));
+            })();
+            {% endif %}
             document.getElementById('creator-form').onsubmit = function() {
                 document.getElementById('loading-overlay').classList.remove('hidden');
                 document.getElementById('loading-overlay').classList.add('flex');
@@ -394,6 +435,13 @@ GALLERY_CONTENT = """
     <header class="mb-10">
         <h2 class="text-3xl font-black text-slate-800 tracking-tight">Galeri Karya</h2>
         <p class="text-slate-500 mt-1 font-medium">Koleksi video affiliate yang siap dipublikasikan.</p>
+        <form method="get" action="/gallery" class="mt-4">
+            <select name="sort" onchange="this.form.submit()" class="px-4 py-2 bg-white border border-slate-200 rounded-xl text-xs font-black text-slate-500 uppercase tracking-widest">
+                {% for key, label in sorts.items() %}
+                <option value="{{ key }}" {% if key == sort %}selected{% endif %}>{{ label }}</option>
+                {% endfor %}
+            </select>
+        </form>
     </header>
 
     <div class="grid grid-cols-1 md:grid-cols-2 xxl:grid-cols-3 gap-8">
@@ -410,7 +458,8 @@ GALLERY_CONTENT = """
                     <span class="text-xs font-black text-slate-300 uppercase tracking-widest">{{ video.date }}</span>
                     <span class="w-2 h-2 bg-emerald-500 rounded-full"></span>
                 </div>
-                <h4 class="font-extrabold text-slate-800 text-lg mb-4 line-clamp-1" title="{{ video.name }}">{{ video.name }}</h4>
+                <h4 class="font-extrabold text-slate-800 text-lg mb-1 line-clamp-1" title="{{ video.name }}">{{ video.product or video.name }}</h4>
+                <p class="text-[10px] font-black text-slate-300 uppercase tracking-widest mb-4">{{ '%d:%02d' % (video.duration // 60, video.duration % 60) }} · {{ '%.1f' % (video.size / 1048576) }} MB</p>
                 
                 {% if video.script %}
                 <div class="bg-slate-50 border border-slate-100 rounded-2xl p-4 mb-6 group/script">
@@ -447,7 +496,18 @@ GALLERY_CONTENT = """
         }
     </script>
     
-    {% if not videos %}
+    {% if next_cursor or not first_page %}
+    <div class="flex justify-center gap-4 mt-10">
+        {% if not first_page %}
+        <a href="/gallery?sort={{ sort }}" class="px-8 py-3.5 bg-white border border-slate-200 text-slate-600 font-black text-sm rounded-xl hover:bg-slate-50 transition-all">⏮ Halaman Pertama</a>
+        {% endif %}
+        {% if next_cursor %}
+        <a href="/gallery?sort={{ sort }}&after={{ next_cursor|urlencode }}" class="px-8 py-3.5 bg-slate-900 text-white font-black text-sm rounded-xl hover:bg-slate-800 transition-all">Berikutnya ⏭</a>
+        {% endif %}
+    </div>
+    {% endif %}
+
+    {% if not videos and first_page %}
     <div class="text-center py-40 bg-white rounded-[3rem] border border-dashed border-slate-200">
         <div class="text-8xl mb-10 transform scale-110">🎬</div>
         <h3 class="text-3xl font-black text-slate-800 mb-4">Galeri Masih Kosong</h3>
@@ -624,41 +684,66 @@ def index():
     logs, stats, active_users = get_dashboard_data()
     return render_template_string(LAYOUT_START + INDEX_CONTENT + LAYOUT_END, title="Dashboard", active="dashboard", logs=logs, stats=stats, active_users=active_users)
 
+def _collect_job_video(job):
+    """Links a finished render job's video into its session folder and the gallery. Returns (video, script)."""
+    meta = job["payload"].get("meta") or {}
+    session_id = meta["session_id"]
+    video_name = f"tiktok_video_{session_id}.mp4"
+    video_path = os.path.join(UPLOAD_FOLDER, session_id, video_name)
+    if not os.path.exists(video_path):
+        collect_render(render_queue, artifact_store, job, video_path)
+        gallery_index.add(video_path, product=meta.get("product_name"), created=time.time())
+        logger.info(f"Video created successfully for {meta.get('product_name')}")
+    try:
+        with open(os.path.join(UPLOAD_FOLDER, session_id, f"tiktok_video_{session_id}_script.txt"), "r", encoding='utf-8') as f:
+            description = f.read()
+    except OSError:
+        description = ""
+    return f"{session_id}/{video_name}", description
+
 @app.route("/create")
 @login_required
 def create():
-    return render_template_string(LAYOUT_START + CREATE_CONTENT + LAYOUT_END, title="Create Video", active="create")
+    """Creator form; with ?job= it follows a queued render and shows the video once it is done."""
+    job_id = request.args.get("job")
+    job = render_queue.get(job_id) if job_id else None
+    # Only renders queued by /generate carry the session they belong to
+    if job and (job["kind"] != RENDER_KIND or not (job["payload"].get("meta") or {}).get("session_id")):
+        job = None
+    if job and job["state"] == SUCCEEDED:
+        try:
+            result_video, description = _collect_job_video(job)
+            return render_template_string(LAYOUT_START + CREATE_CONTENT + LAYOUT_END, title="Video Created", active="create",
+                                          result_video=result_video, description=description)
+        except FileNotFoundError:
+            flash("Video sudah kedaluwarsa dan dihapus dari server. Silakan buat ulang.")
+            job = None
+    elif job and job["state"] == FAILED:
+        flash(f"Error: {job['error']}")
+        job = None
+    elif job_id and not job:
+        flash("Proses tidak ditemukan.")
+    return render_template_string(LAYOUT_START + CREATE_CONTENT + LAYOUT_END, title="Create Video", active="create",
+                                  job_id=job["id"] if job else None)
+
+@app.route("/jobs/<job_id>")
+@login_required
+def job_status(job_id):
+    job = render_queue.get(job_id)
+    if not job:
+        return jsonify({"error": "job not found"}), 404
+    return jsonify({key: job.get(key) for key in ("id", "state", "stage", "progress", "error")})
 
 @app.route("/gallery")
 @login_required
 def gallery():
-    videos = []
-    if os.path.exists(UPLOAD_FOLDER):
-        for root, dirs, files in os.walk(UPLOAD_FOLDER):
-            for file in files:
-                if file.endswith(".mp4"):
-                    full_path = os.path.join(root, file)
-                    rel_path = os.path.relpath(full_path, UPLOAD_FOLDER).replace("\\", "/")
-                    
-                    # Read corresponding script if exists
-                    script_content = ""
-                    script_path = full_path.replace(".mp4", "_script.txt")
-                    if os.path.exists(script_path):
-                        try:
-                            with open(script_path, "r", encoding='utf-8') as f:
-                                script_content = f.read()
-                        except: pass
-                        
-                    stat = os.stat(full_path)
-                    videos.append({
-                        "name": file,
-                        "path": rel_path,
-                        "script": script_content,
-                        "date": datetime.fromtimestamp(stat.st_mtime).strftime("%Y-%m-%d %H:%M"),
-                        "timestamp": stat.st_mtime
-                    })
-    videos.sort(key=lambda x: x["timestamp"], reverse=True)
-    return render_template_string(LAYOUT_START + GALLERY_CONTENT + LAYOUT_END, title="Gallery", active="gallery", videos=videos)
+    sort = request.args.get("sort", "newest")
+    videos, next_cursor = gallery_index.page(sort, request.args.get("after"), GALLERY_PAGE_SIZE)
+    for video in videos:
+        video["date"] = datetime.fromtimestamp(video["created"]).strftime("%Y-%m-%d %H:%M")
+    return render_template_string(LAYOUT_START + GALLERY_CONTENT + LAYOUT_END, title="Gallery", active="gallery",
+                                  videos=videos, sort=sort, sorts=GALLERY_SORTS, next_cursor=next_cursor,
+                                  first_page=not request.args.get("after"))
 
 @app.route("/delete_video", methods=["POST"])
 @login_required
@@ -668,6 +753,7 @@ def delete_video():
         full_path = os.path.join(UPLOAD_FOLDER, path)
         if os.path.exists(full_path):
             os.remove(full_path)
+            gallery_index.remove(path)
             # Try to remove parent dir if empty
             parent = os.path.dirname(full_path)
             try: 
@@ -732,24 +818,12 @@ def generate():
     scraped_name = ""
     
     if urls:
-        num_links = len(urls)
-        for i, url in enumerate(urls):
-            try:
-                result = scraper.scrape_product(url)
-                if result['success'] and result.get('image_urls'):
-                    if not scraped_name: scraped_name = result['product_name']
-                    limit = 6 if num_links == 1 else 3
-                    img_urls = result['image_urls'][:limit]
-                    for j, img_url in enumerate(img_urls):
-                        try:
-                            import requests
-                            resp = requests.get(img_url, headers=scraper.headers, timeout=10)
-                            if resp.status_code == 200:
-                                path = os.path.join(session_dir, f"scraped_{i}_{j}.jpg")
-                                with open(path, "wb") as f: f.write(resp.content)
-                                image_paths.append(path)
-                        except: continue
-            except: continue
+        limit = 6 if len(urls) == 1 else 3
+        results = asyncio.run(scraper.scrape_products_async(urls, session_id, image_limit=limit, output_dir=session_dir, keep_session=False))
+        for result in results:
+            if result['success'] and result.get('image_paths'):
+                if not scraped_name: scraped_name = result['product_name']
+                image_paths.extend(result['image_paths'])
 
     if not product_name:
         product_name = scraped_name if scraped_name else "New Product"
@@ -759,6 +833,7 @@ def generate():
         for i, file in enumerate(files):
             path = os.path.join(session_dir, f"manual_{i}.jpg")
             file.save(path)
+            artifact_store.adopt(path, "image")
             image_paths.append(path)
     
     if not image_paths:
@@ -769,29 +844,23 @@ def generate():
         description = ai_handler.generate_product_description(product_name)
         audio_path = os.path.join(session_dir, "voice.mp3")
         
-        import asyncio
         loop = asyncio.new_event_loop()
         asyncio.set_event_loop(loop)
         if not loop.run_until_complete(ai_handler.text_to_speech(description, audio_path)):
             raise Exception("TTS Failed")
         
         # 4. Generate Video
-        video_path = os.path.join(session_dir, f"tiktok_video_{session_id}.mp4")
         script_path = os.path.join(session_dir, f"tiktok_video_{session_id}_script.txt")
         
         # Save script to txt for gallery persistence
         with open(script_path, "w", encoding='utf-8') as f:
             f.write(description)
-            
-        success = video_processor.create_video_from_images_and_audio(image_paths, audio_path, video_path)
-        
-        if success:
-            logger.info(f"Video created successfully for {product_name or scraped_name}")
-            return render_template_string(LAYOUT_START + CREATE_CONTENT + LAYOUT_END, 
-                                         title="Video Created", 
-                                         active="create", 
-                                         result_video=f"{session_id}/tiktok_video_{session_id}.mp4",
-                                         description=description)
+
+        # The render runs on a worker (worker.py, or the in-process one in inline mode); the create
+        # page follows the job instead of holding this request
+        job_id = enqueue_render(render_queue, artifact_store, image_paths, audio_path, priority=5,
+                                meta={"session_id": session_id, "product_name": product_name})
+        return redirect(url_for("create", job=job_id))
     except Exception as e:
         flash(f"Error: {e}")
         return redirect(url_for("create"))
@@ -801,5 +870,7 @@ def download(filename):
     return send_from_directory(UPLOAD_FOLDER, filename, as_attachment=True)
 
 if __name__ == "__main__":
+    # Development server; production runs `python serve.py dashboard`
+    start_background_services()
     # host='0.0.0.0' allows access from other devices on same WiFi
     app.run(debug=True, host='0.0.0.0', port=5000)
@@ -1,17 +1,23 @@
-from flask import Flask, render_template_string, request, send_from_directory, redirect, url_for, flash, session
+from flask import Flask, render_template_string, request, send_from_directory, redirect, url_for, flash, session, jsonify, Response
 import os
 import re
+import json
 import uuid
 import shutil
 import time
-import asyncio
 from datetime import datetime
 from functools import wraps
 from dotenv import load_dotenv
 from ai_handler import AIHandler
-from video_processor import VideoProcessor
-from scraper import TikTokShopScraper
 from logger_config import logger
+from metrics import read_metrics
+from artifact_store import ArtifactStore
+from artifact_api import register_artifact_routes
+from job_queue import get_job_queue, SUCCEEDED, FAILED, FINISHED_STATES
+from render_jobs import stored_input
+from worker import start_local_worker
+from content_jobs import AFFILIATE_KIND, MUSIC_KIND, finalize_session
+from gallery_index import GalleryIndex
 
 load_dotenv()
 
@@ -25,11 +31,35 @@ os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(MUSIC_FOLDER, exist_ok=True)
 
 DASHBOARD_AUTH_KEY = os.getenv("DASHBOARD_AUTH_KEY", "admin123")
+# How often the progress stream re-reads a job, and how long one stream may hold a server thread
+# (the browser's EventSource reconnects on its own when a stream ends early)
+JOB_EVENTS_POLL = float(os.getenv("JOB_EVENTS_POLL", 2))
+JOB_EVENTS_MAX_SECONDS = float(os.getenv("JOB_EVENTS_MAX_SECONDS", 120))
+GALLERY_PAGE_SIZE = int(os.getenv("GALLERY_PAGE_SIZE", 24))
+# Gallery sort options (gallery_index.SORTS) and their labels
+GALLERY_SORTS = {"newest": "Terbaru", "oldest": "Terlama", "largest": "Terbesar", "longest": "Terpanjang", "name": "Nama"}
 
-# Initialize Handlers
+# Initialize Handlers (scraping and rendering run in worker.py; see content_jobs.py)
 ai_handler = AIHandler()
-video_processor = VideoProcessor()
-scraper = TikTokShopScraper()
+# Uploads, AI images and renders are content-addressed and hardlinked into session folders
+artifact_store = ArtifactStore()
+# Renders are handed to worker.py processes through the shared job queue
+render_queue = get_job_queue()
+# The gallery pages through a SQLite index filled as jobs finish (content_jobs.finalize_session)
+gallery_index = GalleryIndex(UPLOAD_FOLDER)
+# Render workers on other nodes fetch inputs from / push videos to this node's store
+register_artifact_routes(app, artifact_store)
+
+def start_background_services():
+    """
+    Starts the image warm pool (pre-generates popular prompts while idle), the artifact GC,
+    the gallery index reconcile and (RENDER_MODE=inline) the in-process job worker. Threads do
+    not survive fork, so serve.py calls this in one serving process per node.
+    """
+    ai_handler.start_image_warm_pool()
+    artifact_store.start_collector()
+    gallery_index.start_reconcile()
+    start_local_worker(artifact_store)
 
 # --- Security Decorator ---
 def require_auth(f):
@@ -235,6 +265,47 @@ STATS_CONTENT = """
             <div class="text-4xl font-black text-slate-800">{{ stats.images_processed }}</div>
         </div>
     </div>
+
+    <div class="grid grid-cols-1 md:grid-cols-3 gap-6 mb-10">
+        <div class="glass-panel p-8 rounded-[2rem] relative overflow-hidden group hover:scale-[1.02] transition-all duration-300">
+            <div class="absolute top-0 right-0 w-24 h-24 bg-emerald-500/10 rounded-bl-[4rem] flex items-center justify-center text-2xl group-hover:bg-emerald-500/20 transition-all">🧠</div>
+            <div class="text-slate-400 font-bold text-xs uppercase tracking-widest mb-1">Cache Naskah (Hit Ratio)</div>
+            <div class="text-4xl font-black text-slate-800">{{ (stats.cache_hit_ratio * 100)|round(1) }}%</div>
+        </div>
+        <div class="glass-panel p-8 rounded-[2rem] relative overflow-hidden group hover:scale-[1.02] transition-all duration-300">
+            <div class="absolute top-0 right-0 w-24 h-24 bg-yellow-500/10 rounded-bl-[4rem] flex items-center justify-center text-2xl group-hover:bg-yellow-500/20 transition-all">⚡</div>
+            <div class="text-slate-400 font-bold text-xs uppercase tracking-widest mb-1">Token Groq Dihemat</div>
+            <div class="text-4xl font-black text-slate-800">{{ stats.cache_tokens_saved }}</div>
+        </div>
+        <div class="glass-panel p-8 rounded-[2rem] relative overflow-hidden group hover:scale-[1.02] transition-all duration-300">
+            <div class="absolute top-0 right-0 w-24 h-24 bg-indigo-500/10 rounded-bl-[4rem] flex items-center justify-center text-2xl group-hover:bg-indigo-500/20 transition-all">🔗</div>
+            <div class="text-slate-400 font-bold text-xs uppercase tracking-widest mb-1">Reuse Koneksi Scraper</div>
+            <div class="text-4xl font-black text-slate-800">{{ (stats.connection_reuse_rate * 100)|round(1) }}%</div>
+        </div>
+    </div>
+
+    {% if stats.rate_limits %}
+    <div class="glass-panel p-8 rounded-[2rem] mb-10">
+        <div class="text-slate-400 font-bold text-xs uppercase tracking-widest mb-4">Rate Limit per Host</div>
+        <table class="w-full text-sm">
+            <thead>
+                <tr class="text-left text-slate-400 text-xs uppercase">
+                    <th class="pb-2">Host</th><th class="pb-2">Rate (req/s)</th><th class="pb-2">Antrian</th><th class="pb-2">Throttle</th>
+                </tr>
+            </thead>
+            <tbody>
+                {% for host, limit in stats.rate_limits.items() %}
+                <tr class="border-t border-slate-100">
+                    <td class="py-2 font-bold text-slate-700">{{ host }}</td>
+                    <td class="py-2">{{ limit.rate|round(2) }}</td>
+                    <td class="py-2">{{ limit.queue }}</td>
+                    <td class="py-2 {% if limit.throttled %}text-red-500 font-bold{% endif %}">{{ limit.throttled }}</td>
+                </tr>
+                {% endfor %}
+            </tbody>
+        </table>
+    </div>
+    {% endif %}
 """
 
 AFFILIATE_CREATOR_CONTENT = """
@@ -321,16 +392,50 @@ AFFILIATE_CREATOR_CONTENT = """
             <p class="mt-8 text-slate-400 font-medium max-w-xs">Mohon tunggu sebentar, AI sedang meracik video viral Anda.</p>
         </div>
         <script>
-            document.getElementById('creator-form').onsubmit = function() {
-                document.getElementById('loading-overlay').classList.remove('hidden');
-                document.getElementById('loading-overlay').classList.add('flex');
-                const statuses = ["🚀 Connecting...", "🧠 Groq AI Hooking...", "⚡ TTS Generating...", "🎨 Compositing...", "📽️ Final Rendering..."];
-                let i = 0;
-                setInterval(() => {
-                    document.getElementById('status-text').innerText = statuses[i % statuses.length];
-                    i++;
-                }, 3000);
+            const STAGES = {
+                "queued": "⏳ Menunggu antrean render...", "starting": "🚀 Connecting...", "retrying": "🔁 Mencoba ulang...",
+                "scraping": "🔍 Mengambil data produk...", "writing script": "🧠 Groq AI Hooking...",
+                "collecting images": "🖼️ Menyiapkan gambar...", "voiceover": "⚡ TTS Generating...",
+                "rendering": "📽️ Final Rendering...", "storing": "💾 Menyimpan video..."
             };
+            function showOverlay(show) {
+                const overlay = document.getElementById('loading-overlay');
+                overlay.classList.toggle('hidden', !show);
+                overlay.classList.toggle('flex', show);
+            }
+            // Real progress from the worker, streamed by /jobs/<id>/events
+            function followJob(jobId) {
+                showOverlay(true);
+                const source = new EventSource('/jobs/' + jobId + '/events');
+                source.onmessage = function(e) {
+                    const job = JSON.parse(e.data);
+                    document.getElementById('status-text').innerText = (STAGES[job.stage] || job.stage) + ' ' + Math.round(job.progress) + '%';
+                    if (job.state === 'succeeded' || job.state === 'failed') {
+                        source.close();
+                        window.location = '/create_affiliate?job=' + jobId;
+                    }
+                };
+                source.addEventListener('error', function(e) {
+                    if (e.data) { source.close(); window.location = '/create_affiliate'; }
+                });
+            }
+            document.getElementById('creator-form').onsubmit = async function(e) {
+                e.preventDefault();
+                showOverlay(true);
+                document.getElementById('status-text').innerText = "📤 Mengunggah...";
+                const resp = await fetch(this.action, { method: 'POST', body: new FormData(this), headers: { 'Accept': 'application/json' } });
+                // Not JSON: e.g. the session expired and we were sent to the login page
+                if (!(resp.headers.get('Content-Type') || '').includes('json')) { window.location = resp.url; return; }
+                const data = await resp.json();
+                if (!resp.ok) {
+                    showOverlay(false);
+                    alert(data.error);
+                    return;
+                }
+                history.replaceState(null, '', '/create_affiliate?job=' + data.job_id);
+                followJob(data.job_id);
+            };
+            {% if job_id %}followJob("{{ job_id }}");{% endif %}
         </script>
     </div>
 """
@@ -403,25 +508,51 @@ MUSIC_CREATOR_CONTENT = """
         {% endif %}
 
         <script>
-            document.getElementById('music-form').onsubmit = function() {
-                document.getElementById('music-submit-btn').classList.add('hidden');
-                document.getElementById('music-loading').classList.remove('hidden');
-                const steps = [
-                    { t: "🎨 Memanggil Seniman AI...", p: 20 },
-                    { t: "🎭 Menghasilkan Visual...", p: 45 },
-                    { t: "🎵 Meracik Audio...", p: 70 },
-                    { t: "⚡ Rendering Final...", p: 95 }
-                ];
-                let i = 0;
-                setInterval(() => {
-                    if(i < steps.length) {
-                        document.getElementById('music-status-text').innerText = steps[i].t;
-                        document.getElementById('music-bar').style.width = steps[i].p + '%';
-                        document.getElementById('music-percent').innerText = steps[i].p + '%';
-                        i++;
+            const MUSIC_STAGES = {
+                "queued": "⏳ Menunggu antrean render...", "starting": "🎨 Memanggil Seniman AI...", "retrying": "🔁 Mencoba ulang...",
+                "preparing": "🎵 Meracik Audio...", "generating visuals": "🎭 Menghasilkan Visual...",
+                "rendering": "⚡ Rendering Final...", "storing": "💾 Menyimpan video..."
+            };
+            function showMusicProgress(show) {
+                document.getElementById('music-submit-btn').classList.toggle('hidden', show);
+                document.getElementById('music-loading').classList.toggle('hidden', !show);
+            }
+            // Real progress from the worker, streamed by /jobs/<id>/events
+            function followMusicJob(jobId) {
+                showMusicProgress(true);
+                const source = new EventSource('/jobs/' + jobId + '/events');
+                source.onmessage = function(e) {
+                    const job = JSON.parse(e.data);
+                    const percent = Math.round(job.progress) + '%';
+                    document.getElementById('music-status-text').innerText = MUSIC_STAGES[job.stage] || job.stage;
+                    document.getElementById('music-bar').style.width = percent;
+                    document.getElementById('music-percent').innerText = percent;
+                    if (job.state === 'succeeded' || job.state === 'failed') {
+                        source.close();
+                        window.location = '/create_music?job=' + jobId;
                     }
-                }, 4000);
+                };
+                source.addEventListener('error', function(e) {
+                    if (e.data) { source.close(); window.location = '/create_music'; }
+                });
+            }
+            document.getElementById('music-form').onsubmit = async function(e) {
+                e.preventDefault();
+                showMusicProgress(true);
+                document.getElementById('music-status-text').innerText = "📤 Mengunggah...";
+                const resp = await fetch(this.action, { method: 'POST', body: new FormData(this), headers: { 'Accept': 'application/json' } });
+                // Not JSON: e.g. the session expired and we were sent to the login page
+                if (!(resp.headers.get('Content-Type') || '').includes('json')) { window.location = resp.url; return; }
+                const data = await resp.json();
+                if (!resp.ok) {
+                    showMusicProgress(false);
+                    alert(data.error);
+                    return;
+                }
+                history.replaceState(null, '', '/create_music?job=' + data.job_id);
+                followMusicJob(data.job_id);
             };
+            {% if job_id %}followMusicJob("{{ job_id }}");{% endif %}
         </script>
     </div>
 """
@@ -433,6 +564,13 @@ GALLERY_CONTENT = """
         </div>
         <h2 class="text-4xl md:text-5xl font-black text-slate-800 tracking-tight leading-tight">Gudang <span class="text-transparent bg-clip-text bg-gradient-to-r from-emerald-500 to-yellow-400">Konten.</span></h2>
         <p class="text-slate-500 mt-2 text-lg font-medium max-w-2xl">Semua hasil kreasi video affiliate dan musik Anda tersimpan rapi di sini.</p>
+        <form method="get" action="/gallery" class="mt-6">
+            <select name="sort" onchange="this.form.submit()" class="px-4 py-2 bg-white/70 border border-emerald-100 rounded-xl text-xs font-black text-slate-600 uppercase tracking-widest">
+                {% for key, label in sorts.items() %}
+                <option value="{{ key }}" {% if key == sort %}selected{% endif %}>{{ label }}</option>
+                {% endfor %}
+            </select>
+        </form>
     </header>
 
     <div class="grid grid-cols-1 sm:grid-cols-2 lg:grid-cols-3 gap-8">
@@ -447,7 +585,8 @@ GALLERY_CONTENT = """
                 </div>
             </div>
             <div class="p-6">
-                <h4 class="font-black text-slate-800 text-lg mb-2 line-clamp-1 italic" title="{{ video.name }}">{{ video.name }}</h4>
+                <h4 class="font-black text-slate-800 text-lg mb-2 line-clamp-1 italic" title="{{ video.name }}">{{ video.product or video.name }}</h4>
+                <p class="text-[10px] font-black text-slate-400 uppercase tracking-widest mb-4">{{ '%d:%02d' % (video.duration // 60, video.duration % 60) }} · {{ '%.1f' % (video.size / 1048576) }} MB</p>
                 
                 {% if video.script %}
                 <div class="mb-5 p-4 bg-slate-900/90 rounded-2xl relative group/script">
@@ -471,7 +610,18 @@ GALLERY_CONTENT = """
         {% endfor %}
     </div>
 
-    {% if not videos %}
+    {% if next_cursor or not first_page %}
+    <div class="flex justify-center gap-4 mt-12">
+        {% if not first_page %}
+        <a href="/gallery?sort={{ sort }}" class="px-8 py-3 glass-panel rounded-2xl text-xs font-black text-slate-600 uppercase tracking-widest hover:text-emerald-600 transition-all">⏮ Halaman Pertama</a>
+        {% endif %}
+        {% if next_cursor %}
+        <a href="/gallery?sort={{ sort }}&after={{ next_cursor|urlencode }}" class="px-8 py-3 bg-emerald-500 text-white rounded-2xl text-xs font-black uppercase tracking-widest hover:bg-emerald-600 transition-all">Berikutnya ⏭</a>
+        {% endif %}
+    </div>
+    {% endif %}
+
+    {% if not videos and first_page %}
     <div class="text-center py-32 glass-panel rounded-[3rem] border-dashed border-2 border-emerald-100">
         <div class="text-8xl mb-8">🗂️</div>
         <h3 class="text-2xl font-black text-slate-800 mb-10">Belum ada karya yang tersimpan.</h3>
@@ -637,8 +787,28 @@ LOGIN_HTML = """
 
 # --- Helper Logic ---
 def get_stats():
-    stats = {"total_users": 0, "videos_created": 0, "images_processed": 0}
+    stats = {"total_users": 0, "videos_created": 0, "images_processed": 0, "cache_hit_ratio": 0.0, "cache_tokens_saved": 0, "connection_reuse_rate": 0.0, "rate_limits": {}}
     try:
+        # Description cache metrics exported by the bot and dashboard processes
+        cache_stats = read_metrics("description_cache").values()
+        hits = sum(c.get("hits", 0) for c in cache_stats)
+        lookups = hits + sum(c.get("misses", 0) for c in cache_stats)
+        stats["cache_hit_ratio"] = hits / lookups if lookups else 0.0
+        stats["cache_tokens_saved"] = sum(c.get("tokens_saved", 0) for c in cache_stats)
+
+        # Keep-alive effectiveness of the scraper HTTP sessions
+        http_stats = read_metrics("scraper_http").values()
+        requests_made = sum(h.get("requests", 0) for h in http_stats)
+        new_connections = sum(h.get("new_connections", 0) for h in http_stats)
+        stats["connection_reuse_rate"] = max(requests_made - new_connections, 0) / requests_made if requests_made else 0.0
+
+        # Per-host limiter state summed over processes (each process has its own buckets)
+        for buckets in read_metrics("rate_limits").values():
+            for host, bucket in buckets.items():
+                total = stats["rate_limits"].setdefault(host, {"rate": 0.0, "queue": 0, "throttled": 0})
+                for key in total:
+                    total[key] += bucket.get(key, 0)
+
         # Load real users from JSON
         users_file = os.path.join("logs", "users.json")
         if os.path.exists(users_file):
@@ -647,12 +817,9 @@ def get_stats():
                 users_data = json.load(f)
                 stats["total_users"] = len(users_data)
         
-        # Simple stats based on gallery files
-        if os.path.exists(UPLOAD_FOLDER):
-            all_files = os.listdir(UPLOAD_FOLDER)
-            videos = [f for f in all_files if f.endswith('.mp4')]
-            stats["videos_created"] = len(videos)
-            stats["images_processed"] = len(videos) * 5 # average 5 images per video
+        # Simple stats based on the gallery index
+        stats["videos_created"] = gallery_index.count()
+        stats["images_processed"] = stats["videos_created"] * 5 # average 5 images per video
     except Exception: pass
     return stats
 
@@ -681,12 +848,51 @@ def index():
 @app.route("/create_affiliate")
 @require_auth
 def create_affiliate():
-    return render_template_string(LAYOUT_START + AFFILIATE_CREATOR_CONTENT + LAYOUT_END, title="Affiliate Video Creator", active="create_affiliate")
+    return _job_page(AFFILIATE_CREATOR_CONTENT, "Affiliate Video Creator", "create_affiliate", "result_video")
 
 @app.route("/create_music")
 @require_auth
 def create_music():
-    return render_template_string(LAYOUT_START + MUSIC_CREATOR_CONTENT + LAYOUT_END, title="Music Video AI Artist", active="create_music")
+    return _job_page(MUSIC_CREATOR_CONTENT, "Music Video AI Artist", "create_music", "result_music")
+
+def _find_background_music():
+    for file in os.listdir(MUSIC_FOLDER):
+        if file.startswith("background"):
+            return os.path.join(MUSIC_FOLDER, file)
+    return None
+
+def _job_accepted(job_id, page):
+    """The page script gets the job id as JSON; a plain form post lands on the page following the job."""
+    if request.accept_mimetypes.best == "application/json":
+        return jsonify({"job_id": job_id, "events": url_for("job_events", job_id=job_id)}), 202
+    return redirect(url_for(page, job=job_id))
+
+def _job_rejected(message, page):
+    if request.accept_mimetypes.best == "application/json":
+        return jsonify({"error": message}), 400
+    flash(message)
+    return redirect(url_for(page))
+
+def _job_page(template, title, active, result_key):
+    """Renders a creator page, either following a running job (?job=) or showing its result."""
+    job_id = request.args.get("job")
+    job = render_queue.get(job_id) if job_id else None
+    if job and job["state"] == SUCCEEDED:
+        try:
+            finalize_session(job, artifact_store)
+        except FileNotFoundError:
+            # Old ?job= link: the render was garbage-collected from the artifact store
+            flash("Video sudah kedaluwarsa dan dihapus dari server. Silakan buat ulang.")
+            return render_template_string(LAYOUT_START + template + LAYOUT_END, title=title, active=active, job_id=None)
+        result = job["result"]
+        return render_template_string(LAYOUT_START + template + LAYOUT_END, title=title, active=active,
+                                      description=result.get("script") if result_key == "result_video" else None,
+                                      **{result_key: f"{result['session_id']}/{result['filename']}"})
+    if job and job["state"] == FAILED:
+        flash(f"Error Produksi: {job['error']}")
+        job = None
+    return render_template_string(LAYOUT_START + template + LAYOUT_END, title=title, active=active,
+                                  job_id=job["id"] if job else None)
 
 @app.route("/generate_affiliate", methods=["POST"])
 @require_auth
@@ -698,75 +904,36 @@ def generate_affiliate():
     # Validation
     if not url:
         if not product_name or not manual_images or manual_images[0].filename == '':
-            flash("Jika Link kosong, Anda WAJIB mengisi Nama Produk dan Upload Foto Manual!")
-            return redirect(url_for("create_affiliate"))
+            return _job_rejected("Jika Link kosong, Anda WAJIB mengisi Nama Produk dan Upload Foto Manual!", "create_affiliate")
     
     try:
         session_id = str(uuid.uuid4())[:8]
         session_dir = os.path.join(UPLOAD_FOLDER, session_id)
         os.makedirs(session_dir, exist_ok=True)
         
-        # 1. Handle Info & Script
-        scraped_name, scraped_images = None, []
-        if url:
-            scraped_name, scraped_images = scraper.scrape_product_images(url)
-        
-        # 2. AI Script
-        target_name = product_name or scraped_name or "Produk Viral"
-        description = ai_handler.generate_product_description(target_name)
-        
-        # 3. Handle Images
-        local_images = []
-        # Priority: Manual Upload -> Scraped
+        # Manual uploads take priority over scraped images; both go to the worker via the artifact store
+        images = []
         if manual_images and manual_images[0].filename != '':
             for i, img in enumerate(manual_images[:10]):
                 path = os.path.join(session_dir, f"manual_img_{i}.jpg")
                 img.save(path)
-                local_images.append(path)
-        else:
-            # Current case: URL must exist if manual_images missing (checked in validation)
-            if not scraped_images:
-                flash("Gagal mendapatkan gambar. Berikan link valid atau upload foto manual.")
-                return redirect(url_for("create_affiliate"))
-            for i, img_url in enumerate(scraped_images[:6]):
-                img_path = os.path.join(session_dir, f"img_{i}.jpg")
-                if scraper.download_image(img_url, img_path):
-                    local_images.append(img_path)
-        
-        # 4. Audio (TTS)
-        audio_path = os.path.join(session_dir, f"audio_{session_id}.mp3")
-        asyncio.run(ai_handler.text_to_speech(description, audio_path))
+                artifact_store.adopt(path, "image")
+                images.append(stored_input(artifact_store, path, "image"))
         
-        # 5. Mix with Music if exists
-        bg_music = None
-        for file in os.listdir(MUSIC_FOLDER):
-            if file.startswith("background"):
-                bg_music = os.path.join(MUSIC_FOLDER, file)
-                break
-        
-        if bg_music:
-            mixed_audio = os.path.join(session_dir, f"mixed_{session_id}.mp3")
-            if video_processor.mix_audio_with_bg_music(audio_path, bg_music, mixed_audio):
-                audio_path = mixed_audio
-                
-        # 6. Render
-        video_path = os.path.join(session_dir, f"video_{session_id}.mp4")
-        # Save script txt for gallery
-        with open(os.path.join(session_dir, "script.txt"), "w", encoding='utf-8') as f:
-            f.write(description)
-            
-        success = video_processor.create_video_from_images_and_audio(local_images, audio_path, video_path)
-        
-        if success:
-            return render_template_string(LAYOUT_START + AFFILIATE_CREATOR_CONTENT + LAYOUT_END, 
-                                          title="Video Created", active="create_affiliate", 
-                                          result_video=f"{session_id}/video_{session_id}.mp4",
-                                          description=description)
+        bg_music = _find_background_music()
+        # Scrape, script, TTS and render run on a worker; the page follows /jobs/<id>/events
+        job_id = render_queue.enqueue(AFFILIATE_KIND, {
+            "session_id": session_id,
+            "filename": f"video_{session_id}.mp4",
+            "url": url,
+            "product_name": product_name,
+            "images": images,
+            "music": stored_input(artifact_store, bg_music, "audio") if bg_music else None,
+        }, priority=5)
+        return _job_accepted(job_id, "create_affiliate")
     except Exception as e:
         logger.error(f"Affiliate Gen Error: {e}")
-        flash(f"Error Produksi: {e}")
-        
-    return redirect(url_for("create_affiliate"))
+        return _job_rejected(f"Error Produksi: {e}", "create_affiliate")
 
 @app.route("/generate_music", methods=["POST"])
 @require_auth
@@ -777,8 +944,7 @@ def generate_music():
     ai_model = request.form.get("ai_model", "flux")
     
     if not audio_file:
-        flash("Wajib upload file audio!")
-        return redirect(url_for("create_music"))
+        return _job_rejected("Wajib upload file audio!", "create_music")
         
     try:
         session_id = str(uuid.uuid4())[:8]
@@ -789,71 +955,87 @@ def generate_music():
         audio_name = f"music_{session_id}_{audio_file.filename}"
         audio_path = os.path.join(session_dir, audio_name)
         audio_file.save(audio_path)
+        artifact_store.adopt(audio_path, "audio")
         
-        # 2. Get Images
-        local_images = []
-        # Save manual images if uploaded
+        # 2. Save manual images if uploaded (AI visuals are generated by the worker)
+        images = []
         if manual_images and manual_images[0].filename != '':
             for i, img in enumerate(manual_images[:10]):
                 path = os.path.join(session_dir, f"man_{i}.jpg")
                 img.save(path)
-                local_images.append(path)
-        
-        # If no manual images or prompt provided, use AI
-        if not local_images or image_prompt:
-            prompt = image_prompt or audio_file.filename.split('.')[0]
-            ai_images = ai_handler.generate_images_from_prompt(prompt, count=5, model=ai_model)
-            for i, img_path in enumerate(ai_images):
-                new_path = os.path.join(session_dir, os.path.basename(img_path))
-                shutil.copy(img_path, new_path)
-                local_images.append(new_path)
+                artifact_store.adopt(path, "image")
+                images.append(stored_input(artifact_store, path, "image"))
                 
-        # 3. Render
-        video_path = os.path.join(session_dir, f"music_video_{session_id}.mp4")
-        
-        # Save prompt for gallery display
-        prompt_to_save = image_prompt or audio_file.filename.split('.')[0]
-        with open(os.path.join(session_dir, "script.txt"), "w", encoding='utf-8') as f:
-            f.write(prompt_to_save)
-            
-        success = video_processor.create_video_from_images_and_audio(local_images, audio_path, video_path)
-        
-        if success:
-            return render_template_string(LAYOUT_START + MUSIC_CREATOR_CONTENT + LAYOUT_END, 
-                                          title="Music Video Ready", active="create_music", 
-                                          result_music=f"{session_id}/music_video_{session_id}.mp4")
+        # 3. Render on a worker; the prompt doubles as the gallery caption
+        job_id = render_queue.enqueue(MUSIC_KIND, {
+            "session_id": session_id,
+            "filename": f"music_video_{session_id}.mp4",
+            "audio": stored_input(artifact_store, audio_path, "audio"),
+            "images": images,
+            "image_prompt": image_prompt,
+            "prompt": image_prompt or audio_file.filename.split('.')[0],
+            "ai_model": ai_model,
+        }, priority=5)
+        return _job_accepted(job_id, "create_music")
     except Exception as e:
         logger.error(f"Music Gen Error: {e}")
-        flash(f"Error Music Gen: {e}")
-        
-    return redirect(url_for("create_music"))
+        return _job_rejected(f"Error Music Gen: {e}", "create_music")
+
+def _job_view(job):
+    return {key: job.get(key) for key in ("id", "kind", "state", "stage", "progress", "error")}
+
+@app.route("/jobs/<job_id>")
+@require_auth
+def job_status(job_id):
+    job = render_queue.get(job_id)
+    if not job:
+        return jsonify({"error": "job not found"}), 404
+    return jsonify(_job_view(job))
+
+@app.route("/jobs/<job_id>/events")
+@require_auth
+def job_events(job_id):
+    """
+    Server-Sent Events: one message per stage/progress change. The stream ends when the job
+    finishes, the client disconnects or after JOB_EVENTS_MAX_SECONDS (the browser then reconnects).
+    """
+    def stream():
+        started = last_sent = time.time()
+        last = None
+        try:
+            while True:
+                job = render_queue.get(job_id)
+                if not job:
+                    yield f"event: error\ndata: {json.dumps({'error': 'job not found'})}\n\n"
+                    return
+                view = _job_view(job)
+                if view != last:
+                    yield f"data: {json.dumps(view)}\n\n"
+                    last, last_sent = view, time.time()
+                elif time.time() - last_sent > 10:
+                    # Comment line keeps proxies from closing an idle stream and notices a closed tab
+                    yield ": keepalive\n\n"
+                    last_sent = time.time()
+                if job["state"] in FINISHED_STATES or time.time() - started > JOB_EVENTS_MAX_SECONDS:
+                    return
+                time.sleep(JOB_EVENTS_POLL)
+        except GeneratorExit:
+            # The client went away: the server closes the stream when a write fails
+            return
+
+    return Response(stream(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 @app.route("/gallery")
 @require_auth
 def gallery():
-    videos = []
-    if os.path.exists(UPLOAD_FOLDER):
-        for session_id in os.listdir(UPLOAD_FOLDER):
-            session_dir = os.path.join(UPLOAD_FOLDER, session_id)
-            if os.path.isdir(session_dir):
-                for f in os.listdir(session_dir):
-                    if f.endswith(".mp4"):
-                        path = f"{session_id}/{f}"
-                        # Try to get script
-                        script = ""
-                        script_path = os.path.join(session_dir, "script.txt")
-                        if os.path.exists(script_path):
-                            with open(script_path, "r", encoding='utf-8') as sf:
-                                script = sf.read()
-                        
-                        mtime = os.path.getmtime(os.path.join(session_dir, f))
-                        videos.append({
-                            "name": f, "path": path, "script": script,
-                            "date": datetime.fromtimestamp(mtime).strftime("%d %b %Y, %H:%M"),
-                            "raw_time": mtime
-                        })
-    videos.sort(key=lambda x: x['raw_time'], reverse=True)
-    return render_template_string(LAYOUT_START + GALLERY_CONTENT + LAYOUT_END, title="Media Gallery", active="gallery", videos=videos)
+    sort = request.args.get("sort", "newest")
+    videos, next_cursor = gallery_index.page(sort, request.args.get("after"), GALLERY_PAGE_SIZE)
+    for video in videos:
+        video["date"] = datetime.fromtimestamp(video["created"]).strftime("%d %b %Y, %H:%M")
+    return render_template_string(LAYOUT_START + GALLERY_CONTENT + LAYOUT_END, title="Media Gallery", active="gallery",
+                                  videos=videos, sort=sort, sorts=GALLERY_SORTS, next_cursor=next_cursor,
+                                  first_page=not request.args.get("after"))
 
 @app.route("/users")
 @require_auth
@@ -901,6 +1083,7 @@ def delete_video():
         session_dir = os.path.dirname(full_path)
         if os.path.exists(session_dir):
             shutil.rmtree(session_dir)
+            gallery_index.remove_session(os.path.basename(session_dir))
             flash("Karya berhasil dihapus.")
     return redirect(url_for("gallery"))
 
@@ -909,4 +1092,6 @@ def download(filename):
     return send_from_directory(UPLOAD_FOLDER, filename, as_attachment=True)
 
 if __name__ == "__main__":
+    # Development server; production runs `python serve.py dashboard_pro`
+    start_background_services()
     app.run(debug=True, host='0.0.0.0', port=5000)
@@ -0,0 +1,47 @@
+import os
+import time
+import sqlite3
+import contextlib
+from logger_config import logger
+
+CACHE_DIR = os.path.join("temp", "cache")
+
+class VideoDeliveryCache:
+    """
+    Remembers the Telegram file_id of every delivered video, keyed by render fingerprint,
+    so an identical render is re-sent by reference instead of uploading the MP4 again.
+    A file_id that fails to send is invalidated and the next delivery uploads afresh.
+    """
+    def __init__(self, db_path=None):
+        self.db_path = db_path or os.path.join(CACHE_DIR, "deliveries.sqlite")
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        with self._connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("""CREATE TABLE IF NOT EXISTS videos (
+                fingerprint TEXT PRIMARY KEY, file_id TEXT, created REAL, last_sent REAL, sends INTEGER DEFAULT 1)""")
+
+    @contextlib.contextmanager
+    def _connect(self):
+        """One transaction on a fresh connection that is closed afterwards (sqlite3's own `with` only commits)."""
+        with contextlib.closing(sqlite3.connect(self.db_path, timeout=30)) as db, db:
+            yield db
+
+    def get(self, fingerprint):
+        with self._connect() as db:
+            row = db.execute("SELECT file_id FROM videos WHERE fingerprint=?", (fingerprint,)).fetchone()
+        return row[0] if row else None
+
+    def put(self, fingerprint, file_id):
+        now = time.time()
+        with self._connect() as db:
+            db.execute("INSERT OR REPLACE INTO videos (fingerprint, file_id, created, last_sent) VALUES (?, ?, ?, ?)",
+                       (fingerprint, file_id, now, now))
+
+    def mark_sent(self, fingerprint):
+        with self._connect() as db:
+            db.execute("UPDATE videos SET last_sent=?, sends=sends+1 WHERE fingerprint=?", (time.time(), fingerprint))
+
+    def invalidate(self, fingerprint):
+        logger.info(f"Invalidating cached file_id for render {fingerprint[:12]}")
+        with self._connect() as db:
+            db.execute("DELETE FROM videos WHERE fingerprint=?", (fingerprint,))
@@ -0,0 +1,102 @@
+import os
+import re
+import time
+import threading
+from collections import OrderedDict
+from logger_config import logger
+from metrics import export_metrics
+
+# Purely decorative seller phrases around the real product name. Words that can tell two
+# products apart ("original", "new", "baru", "hot", "sale", "100%") are deliberately kept.
+PROMO_TOKENS = [
+    "gratis ongkir", "free ongkir", "bisa cod", "ready stock", "flash sale", "best seller",
+    "bestseller", "terlaris", "promo", "diskon", "cod",
+]
+PROMO_PATTERN = re.compile(r'\b(?:' + '|'.join(re.escape(t) for t in PROMO_TOKENS) + r')\b')
+NON_WORD_PATTERN = re.compile(r'[^\w\s]|_')
+SPACES_PATTERN = re.compile(r'\s+')
+
+def normalize_product_name(name):
+    """Casefolds a product title and strips promo tokens, emoji, punctuation and extra spaces."""
+    text = (name or "").casefold()
+    text = NON_WORD_PATTERN.sub(" ", text)
+    text = PROMO_PATTERN.sub(" ", text)
+    return SPACES_PATTERN.sub(" ", text).strip()
+
+class DescriptionCache:
+    """
+    In-memory LRU cache of generated scripts keyed by normalized product name.
+    Each key collects up to `max_variants` scripts; lookups only hit once the pool is full,
+    and then rotate through the variants so repeated products do not get identical videos.
+    """
+    def __init__(self, ttl=None, max_keys=None, max_variants=None):
+        self.ttl = float(ttl or os.getenv("DESCRIPTION_CACHE_TTL", 6 * 3600))
+        self.max_keys = int(max_keys or os.getenv("DESCRIPTION_CACHE_SIZE", 500))
+        self.max_variants = int(max_variants or os.getenv("DESCRIPTION_CACHE_VARIANTS", 3))
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.tokens_saved = 0
+        self._tokens_total = 0
+        self._tokens_calls = 0
+
+    def get(self, product_name):
+        """Returns a cached script for the product or None when a new variant should be generated."""
+        key = normalize_product_name(product_name)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key) if key else None
+            if entry:
+                entry["variants"] = [v for v in entry["variants"] if now - v["created"] < self.ttl]
+                if not entry["variants"]:
+                    del self._entries[key]
+                    entry = None
+
+            if not entry or len(entry["variants"]) < self.max_variants:
+                self.misses += 1
+                result = None
+            else:
+                self._entries.move_to_end(key)
+                variant = entry["variants"][entry["next"] % len(entry["variants"])]
+                entry["next"] += 1
+                self.hits += 1
+                self.tokens_saved += variant["tokens"] or self._average_tokens()
+                result = variant["text"]
+        self.export()
+        return result
+
+    def put(self, product_name, text, tokens=None):
+        """Stores a freshly generated script as one more variant for the product."""
+        key = normalize_product_name(product_name)
+        if not key or not text:
+            return
+        with self._lock:
+            if tokens:
+                self._tokens_total += tokens
+                self._tokens_calls += 1
+            entry = self._entries.setdefault(key, {"variants": [], "next": 0})
+            if text not in (v["text"] for v in entry["variants"]):
+                entry["variants"].append({"text": text, "tokens": tokens, "created": time.time()})
+                del entry["variants"][:-self.max_variants]
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_keys:
+                evicted, _ = self._entries.popitem(last=False)
+                logger.info(f"Description cache: evicted '{evicted}'")
+
+    def _average_tokens(self):
+        return self._tokens_total // self._tokens_calls if self._tokens_calls else 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+            "tokens_saved": self.tokens_saved,
+            "keys": len(self._entries),
+        }
+
+    def export(self):
+        """Publishes hit ratio and tokens saved for the dashboards (throttled)."""
+        export_metrics("description_cache", self.stats())
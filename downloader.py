@@ -0,0 +1,123 @@
+import os
+import uuid
+import hashlib
+import aiohttp
+import requests
+from logger_config import logger
+
+# Upper bound for any single remote media file (bytes)
+MAX_DOWNLOAD_BYTES = int(os.getenv("DOWNLOAD_MAX_BYTES", 20 * 1024 * 1024))
+IMAGE_CONTENT_TYPES = ("image/",)
+CHUNK_SIZE = 64 * 1024
+
+EXTENSIONS = {
+    "image/jpeg": ".jpg",
+    "image/jpg": ".jpg",
+    "image/png": ".png",
+    "image/webp": ".webp",
+    "image/avif": ".avif",
+}
+
+def extension_for(content_type, default=".jpg"):
+    """Maps a Content-Type header to a file extension."""
+    return EXTENSIONS.get((content_type or "").split(";")[0].strip().lower(), default)
+
+def _check_headers(url, status, content_type, content_length, allowed_types, max_bytes):
+    """Returns an error string if the response must not be downloaded, else None."""
+    if status != 200:
+        return f"HTTP {status}"
+    if allowed_types and not (content_type or "").lower().startswith(tuple(allowed_types)):
+        return f"unexpected content type '{content_type}'"
+    if content_length and int(content_length) > max_bytes:
+        return f"too large ({content_length} bytes > {max_bytes})"
+    return None
+
+class _AtomicWriter:
+    """Streams chunks into a temp file next to dest, hashing as it goes; commit() renames it into place."""
+    def __init__(self, dest_path, max_bytes):
+        os.makedirs(os.path.dirname(dest_path) or ".", exist_ok=True)
+        self.dest_path = dest_path
+        self.tmp_path = f"{dest_path}.{uuid.uuid4().hex[:8]}.part"
+        self.max_bytes = max_bytes
+        self.hash = hashlib.sha256()
+        self.size = 0
+        self.file = open(self.tmp_path, "wb")
+
+    def write(self, chunk):
+        self.size += len(chunk)
+        if self.size > self.max_bytes:
+            raise ValueError(f"too large (> {self.max_bytes} bytes)")
+        self.hash.update(chunk)
+        self.file.write(chunk)
+
+    def commit(self):
+        self.file.close()
+        os.replace(self.tmp_path, self.dest_path)
+
+    def discard(self):
+        self.file.close()
+        try: os.remove(self.tmp_path)
+        except OSError: pass
+
+def _result(success, path=None, writer=None, content_type=None, error=None, status=None):
+    return {
+        "success": success,
+        "status": status,
+        "path": path,
+        "sha256": writer.hash.hexdigest() if success and writer else None,
+        "size": writer.size if writer else 0,
+        "content_type": content_type,
+        "error": error,
+    }
+
+def download_to_file(url, dest_path, session=None, headers=None, timeout=15,
+                     max_bytes=MAX_DOWNLOAD_BYTES, allowed_types=IMAGE_CONTENT_TYPES):
+    """
+    Streams `url` to `dest_path` in chunks with size/content-type checks and a sha256 computed
+    on the fly. The file only appears at dest_path once complete (atomic rename).
+    Returns {"success", "status", "path", "sha256", "size", "content_type", "error"}.
+    """
+    http = session or requests
+    writer = None
+    try:
+        with http.get(url, headers=headers, timeout=timeout, stream=True) as resp:
+            content_type = resp.headers.get("Content-Type", "")
+            error = _check_headers(url, resp.status_code, content_type, resp.headers.get("Content-Length"), allowed_types, max_bytes)
+            if error:
+                return _result(False, content_type=content_type, error=error, status=resp.status_code)
+            writer = _AtomicWriter(dest_path, max_bytes)
+            for chunk in resp.iter_content(CHUNK_SIZE):
+                writer.write(chunk)
+            writer.commit()
+            return _result(True, dest_path, writer, content_type, status=resp.status_code)
+    except Exception as e:
+        if writer:
+            writer.discard()
+        logger.error(f"Download failed for {url}: {e}")
+        return _result(False, writer=writer, error=str(e))
+
+async def adownload_to_file(session, url, dest_path, headers=None, timeout=15,
+                            max_bytes=MAX_DOWNLOAD_BYTES, allowed_types=IMAGE_CONTENT_TYPES):
+    """aiohttp twin of download_to_file; `session` is an aiohttp.ClientSession. Same result dict."""
+    writer = None
+    try:
+        async with session.get(url, headers=headers, timeout=aiohttp.ClientTimeout(total=timeout)) as resp:
+            content_type = resp.headers.get("Content-Type", "")
+            error = _check_headers(url, resp.status, content_type, resp.headers.get("Content-Length"), allowed_types, max_bytes)
+            if error:
+                if resp.status != 200:
+                    body = await resp.text(errors="replace")
+                    error = f"{error} - {body[:200]}"
+                return _result(False, content_type=content_type, error=error, status=resp.status)
+            writer = _AtomicWriter(dest_path, max_bytes)
+            async for chunk in resp.content.iter_chunked(CHUNK_SIZE):
+                writer.write(chunk)
+            writer.commit()
+            return _result(True, dest_path, writer, content_type, status=resp.status)
+    except BaseException as e:
+        if writer:
+            writer.discard()
+        if not isinstance(e, Exception):
+            raise
+        logger.error(f"Download failed for {url}: {e}")
+        return _result(False, writer=writer, error=str(e))
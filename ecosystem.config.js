@@ -7,17 +7,33 @@ module.exports = {
       restart_delay: 3000,
       env: {
         NODE_ENV: "production",
+        RENDER_MODE: "queue",
       }
     },
     {
       name: "tiktok-affiliate-dashboard",
-      script: "dashboard.py",
+      script: "serve.py",
+      args: "dashboard",
       interpreter: "python3",
       restart_delay: 3000,
       env: {
         NODE_ENV: "production",
+        RENDER_MODE: "queue",
         FLASK_APP: "dashboard.py"
       }
+    },
+    {
+      name: "tiktok-render-worker",
+      script: "worker.py",
+      interpreter: "python3",
+      instances: 2,
+      exec_mode: "fork",
+      kill_timeout: 120000,
+      restart_delay: 3000,
+      env: {
+        NODE_ENV: "production",
+        RENDER_MODE: "queue",
+      }
     }
   ]
 };
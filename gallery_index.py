@@ -0,0 +1,167 @@
+import os
+import json
+import base64
+import sqlite3
+import contextlib
+import threading
+from logger_config import logger
+from video_processor import VideoProcessor
+
+CACHE_DIR = os.path.join("temp", "cache")
+GALLERY_ROOT = os.path.join("temp", "web_uploads")
+
+# Gallery sort name -> (column, direction); ties are broken by path in the same direction
+SORTS = {
+    "newest": ("created", "DESC"),
+    "oldest": ("created", "ASC"),
+    "largest": ("size", "DESC"),
+    "longest": ("duration", "DESC"),
+    "name": ("name", "ASC"),
+}
+COLUMNS = ("path", "session", "name", "script", "product", "size", "duration", "mtime", "created")
+
+class GalleryIndex:
+    """
+    SQLite index of the videos under the gallery folder (temp/web_uploads/<session>/*.mp4), so
+    gallery pages are one indexed query instead of a directory walk that stats every MP4 and
+    reads every script. Renders are added as they finish; reconcile() catches files created or
+    deleted behind its back. Pages use keyset pagination: the cursor is the last row's
+    (sort value, path), so deep pages cost the same as the first one.
+    """
+    def __init__(self, root=None, db_path=None):
+        self.root = root or GALLERY_ROOT
+        self.db_path = db_path or os.path.join(CACHE_DIR, "gallery.sqlite")
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        with self._connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("""CREATE TABLE IF NOT EXISTS videos (
+                path TEXT PRIMARY KEY, session TEXT, name TEXT, script TEXT, product TEXT,
+                size INTEGER, duration REAL, mtime REAL, created REAL)""")
+            db.execute("CREATE INDEX IF NOT EXISTS videos_session ON videos (session)")
+            for column in {column for column, _ in SORTS.values()}:
+                db.execute(f"CREATE INDEX IF NOT EXISTS videos_{column} ON videos ({column}, path)")
+
+    @contextlib.contextmanager
+    def _connect(self):
+        """One transaction on a fresh connection that is closed afterwards (sqlite3's own `with` only commits)."""
+        with contextlib.closing(sqlite3.connect(self.db_path, timeout=30)) as db, db:
+            yield db
+
+    def _relative(self, video_path):
+        return os.path.relpath(video_path, self.root).replace("\\", "/")
+
+    @staticmethod
+    def _read_script(video_path):
+        """dashboard.py saves <video>_script.txt next to the video, the job pipeline script.txt in the session folder."""
+        for script_path in (os.path.splitext(video_path)[0] + "_script.txt",
+                            os.path.join(os.path.dirname(video_path), "script.txt")):
+            try:
+                with open(script_path, "r", encoding='utf-8') as f:
+                    return f.read()
+            except OSError:
+                continue
+        return ""
+
+    def add(self, video_path, script=None, product=None, created=None):
+        """
+        Indexes (or refreshes) one video; unchanged files are not probed again. `created` is
+        when it joined the gallery (defaults to the file's mtime, which for a deduplicated
+        render is the first copy's); a re-indexed video keeps its original time.
+        """
+        path = self._relative(video_path)
+        stat = os.stat(video_path)
+        with self._connect() as db:
+            row = db.execute("SELECT size, mtime, product, created FROM videos WHERE path=?", (path,)).fetchone()
+        if row and (row[0], row[1]) == (stat.st_size, stat.st_mtime) and product in (None, row[2]):
+            return path
+        try:
+            duration = VideoProcessor.get_duration(video_path)
+        except Exception:
+            duration = 0.0
+        with self._connect() as db:
+            db.execute("""INSERT OR REPLACE INTO videos (path, session, name, script, product, size, duration, mtime, created)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                (path, path.split("/", 1)[0] if "/" in path else "", os.path.basename(path),
+                 self._read_script(video_path) if script is None else script,
+                 product if product is not None else (row[2] if row else None),
+                 stat.st_size, duration, stat.st_mtime,
+                 row[3] if row else (created or stat.st_mtime)))
+        return path
+
+    def remove(self, path):
+        """Drops one video (path relative to the gallery folder)."""
+        with self._connect() as db:
+            db.execute("DELETE FROM videos WHERE path=?", (path,))
+
+    def remove_session(self, session_id):
+        """Drops every video of a deleted session folder."""
+        with self._connect() as db:
+            db.execute("DELETE FROM videos WHERE session=?", (session_id,))
+
+    def count(self):
+        with self._connect() as db:
+            return db.execute("SELECT COUNT(*) FROM videos").fetchone()[0]
+
+    def page(self, sort="newest", after=None, limit=24):
+        """
+        Returns (videos, next_cursor) for one gallery page. `after` is the cursor of the
+        previous page (None for the first); next_cursor is None on the last page.
+        """
+        column, direction = SORTS.get(sort, SORTS["newest"])
+        query = f"SELECT {', '.join(COLUMNS)} FROM videos"
+        params = []
+        if after:
+            try:
+                value, path = json.loads(base64.urlsafe_b64decode(after.encode("ascii")))
+            except (ValueError, TypeError):
+                # A mangled cursor starts over at the first page
+                return self.page(sort, None, limit)
+            query += f" WHERE ({column}, path) {'<' if direction == 'DESC' else '>'} (?, ?)"
+            params += [value, path]
+        query += f" ORDER BY {column} {direction}, path {direction} LIMIT ?"
+        with self._connect() as db:
+            rows = db.execute(query, params + [limit + 1]).fetchall()
+        videos = [dict(zip(COLUMNS, row)) for row in rows[:limit]]
+        next_cursor = None
+        if len(rows) > limit:
+            last = videos[-1]
+            next_cursor = base64.urlsafe_b64encode(json.dumps([last[column], last["path"]]).encode("utf-8")).decode("ascii")
+        return videos, next_cursor
+
+    def reconcile(self):
+        """Adds MP4s missing from the index (or changed on disk) and drops rows whose file is gone."""
+        with self._connect() as db:
+            known = {path: (size, mtime) for path, size, mtime in db.execute("SELECT path, size, mtime FROM videos")}
+        added = 0
+        seen = set()
+        for root, _, files in os.walk(self.root):
+            for file in files:
+                if not file.endswith(".mp4"):
+                    continue
+                video_path = os.path.join(root, file)
+                path = self._relative(video_path)
+                seen.add(path)
+                try:
+                    stat = os.stat(video_path)
+                    if known.get(path) != (stat.st_size, stat.st_mtime):
+                        self.add(video_path)
+                        added += 1
+                except OSError:
+                    continue
+        gone = [(path,) for path in known if path not in seen]
+        with self._connect() as db:
+            db.executemany("DELETE FROM videos WHERE path=?", gone)
+        logger.info(f"Gallery index reconciled: {added} added, {len(gone)} removed")
+        return {"added": added, "removed": len(gone)}
+
+    def start_reconcile(self):
+        """Reconciles in a daemon thread so a large backlog of unindexed videos does not delay startup."""
+        thread = threading.Thread(target=self._safe_reconcile, daemon=True, name="gallery-reconcile")
+        thread.start()
+        return thread
+
+    def _safe_reconcile(self):
+        try:
+            self.reconcile()
+        except Exception as e:
+            logger.error(f"Gallery reconcile error: {e}")
@@ -0,0 +1,200 @@
+import os
+import re
+import time
+import uuid
+import shutil
+import sqlite3
+import contextlib
+import asyncio
+import threading
+import aiohttp
+from logger_config import logger
+
+CACHE_DIR = os.path.join("temp", "cache")
+
+def normalize_prompt(prompt):
+    """Casefolds a prompt and collapses whitespace/punctuation so trivial variants share a key."""
+    text = re.sub(r'[^\w\s]|_', ' ', (prompt or "").casefold())
+    return re.sub(r'\s+', ' ', text).strip()
+
+def link_or_copy(src, dst):
+    """Hardlinks src to dst when possible (same filesystem), otherwise copies it; an existing dst is replaced."""
+    tmp = f"{dst}.{uuid.uuid4().hex[:8]}.link"
+    try:
+        os.link(src, tmp)
+    except OSError:
+        shutil.copy(src, tmp)
+    os.replace(tmp, dst)
+    return dst
+
+class ImageCache:
+    """
+    Disk cache of AI images keyed by (normalized prompt, model, size, seed) with LRU eviction.
+    Entries flagged `pooled` are pre-generated images that have not been handed out yet; they
+    are consumed by take_pooled() so two users never receive the same warm-pool image.
+    The index lives in SQLite so the bot and dashboard processes share it.
+    """
+    def __init__(self, db_path=None, image_dir=None, max_entries=None, pool_target=None):
+        self.db_path = db_path or os.path.join(CACHE_DIR, "images.sqlite")
+        self.image_dir = image_dir or os.path.join(CACHE_DIR, "images")
+        self.max_entries = int(max_entries or os.getenv("IMAGE_CACHE_SIZE", 500))
+        self.pool_target = int(pool_target or os.getenv("IMAGE_POOL_SIZE", 5))
+        os.makedirs(self.image_dir, exist_ok=True)
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        with self._connect() as db:
+            db.execute("""CREATE TABLE IF NOT EXISTS images (
+                prompt TEXT, model TEXT, size TEXT, seed INTEGER, path TEXT,
+                pooled INTEGER DEFAULT 0, created REAL, last_used REAL,
+                PRIMARY KEY (prompt, model, size, seed))""")
+            db.execute("CREATE INDEX IF NOT EXISTS images_lru ON images (last_used)")
+            db.execute("""CREATE TABLE IF NOT EXISTS prompt_stats (
+                prompt TEXT, model TEXT, size TEXT, requests INTEGER DEFAULT 0, last_requested REAL,
+                display_prompt TEXT, PRIMARY KEY (prompt, model, size))""")
+            db.execute("CREATE TABLE IF NOT EXISTS activity (owner TEXT PRIMARY KEY, busy_until REAL)")
+
+    @contextlib.contextmanager
+    def _connect(self):
+        """One transaction on a fresh connection that is closed afterwards (sqlite3's own `with` only commits)."""
+        with contextlib.closing(sqlite3.connect(self.db_path, timeout=30)) as db, db:
+            yield db
+
+    def record_request(self, prompt, model, size):
+        """Counts a user request for the prompt; the warm pool targets the most frequent ones."""
+        key = normalize_prompt(prompt)
+        with self._connect() as db:
+            db.execute("""INSERT INTO prompt_stats (prompt, model, size, requests, last_requested, display_prompt)
+                VALUES (?, ?, ?, 1, ?, ?)
+                ON CONFLICT (prompt, model, size) DO UPDATE SET
+                requests = requests + 1, last_requested = excluded.last_requested""",
+                (key, model, size, time.time(), prompt))
+
+    def mark_busy(self, owner, until):
+        """Records that `owner` (a process) has user image work until `until` (a timestamp)."""
+        with self._connect() as db:
+            db.execute("INSERT OR REPLACE INTO activity (owner, busy_until) VALUES (?, ?)", (owner, until))
+
+    def idle_for(self):
+        """Seconds since the last user image work in any process sharing this cache (negative while busy)."""
+        with self._connect() as db:
+            row = db.execute("SELECT MAX(busy_until) FROM activity").fetchone()
+        return time.time() - (row[0] or 0)
+
+    def get(self, prompt, model, size, seed):
+        """Returns the cached image path for an exact (prompt, model, size, seed) key or None."""
+        with self._connect() as db:
+            row = db.execute("SELECT path FROM images WHERE prompt=? AND model=? AND size=? AND seed=?",
+                             (normalize_prompt(prompt), model, size, seed)).fetchone()
+            if row and os.path.exists(row[0]):
+                db.execute("UPDATE images SET last_used=? WHERE path=?", (time.time(), row[0]))
+                return row[0]
+        return None
+
+    def put(self, prompt, model, size, seed, src_path, pooled=False):
+        """Links a generated image into the cache and returns its cache path."""
+        path = os.path.join(self.image_dir, f"{model}_{size}_{seed}_{uuid.uuid4().hex[:6]}.jpg")
+        link_or_copy(src_path, path)
+        now = time.time()
+        with self._connect() as db:
+            old = db.execute("SELECT path FROM images WHERE prompt=? AND model=? AND size=? AND seed=?",
+                             (normalize_prompt(prompt), model, size, seed)).fetchone()
+            db.execute("""INSERT OR REPLACE INTO images (prompt, model, size, seed, path, pooled, created, last_used)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                (normalize_prompt(prompt), model, size, seed, path, int(pooled), now, now))
+        if old and old[0] != path:
+            self._remove_file(old[0])
+        self.evict()
+        return path
+
+    def take_pooled(self, prompt, model, size, limit):
+        """Hands out up to `limit` warm-pool images for the prompt, removing them from the pool."""
+        taken = []
+        with self._connect() as db:
+            db.execute("BEGIN IMMEDIATE")
+            rows = db.execute("""SELECT seed, path FROM images WHERE prompt=? AND model=? AND size=? AND pooled=1
+                ORDER BY created LIMIT ?""", (normalize_prompt(prompt), model, size, limit)).fetchall()
+            for seed, path in rows:
+                db.execute("UPDATE images SET pooled=0, last_used=? WHERE path=?", (time.time(), path))
+                if os.path.exists(path):
+                    taken.append((seed, path))
+        return taken
+
+    def pool_deficits(self, top_n=10):
+        """Returns [(prompt, model, size, missing)] for the most requested prompts whose pool is short."""
+        with self._connect() as db:
+            rows = db.execute("""SELECT s.prompt, s.display_prompt, s.model, s.size,
+                (SELECT COUNT(*) FROM images i WHERE i.prompt=s.prompt AND i.model=s.model AND i.size=s.size AND i.pooled=1)
+                FROM prompt_stats s ORDER BY s.requests DESC, s.last_requested DESC LIMIT ?""", (top_n,)).fetchall()
+        return [(display or key, model, size, self.pool_target - pooled)
+                for key, display, model, size, pooled in rows if pooled < self.pool_target]
+
+    def evict(self):
+        """Drops least recently used entries beyond max_entries (pooled images go last)."""
+        with self._connect() as db:
+            total = db.execute("SELECT COUNT(*) FROM images").fetchone()[0]
+            excess = total - self.max_entries
+            if excess <= 0:
+                return
+            rows = db.execute("SELECT path FROM images ORDER BY pooled, last_used LIMIT ?", (excess,)).fetchall()
+            db.executemany("DELETE FROM images WHERE path=?", rows)
+        for (path,) in rows:
+            self._remove_file(path)
+        logger.info(f"Image cache: evicted {len(rows)} images")
+
+    @staticmethod
+    def _remove_file(path):
+        try: os.remove(path)
+        except OSError: pass
+
+class ImageWarmPool(threading.Thread):
+    """
+    Background thread that pre-generates images for the most frequent prompts while no process
+    sharing the cache has generated user images for `idle_seconds`, so later requests are
+    served instantly. It keeps one event loop and one aiohttp session for its whole life
+    instead of starting a fresh loop (and connection pool) per batch.
+    """
+    def __init__(self, ai_handler, idle_seconds=None, interval=None, top_n=None):
+        super().__init__(daemon=True, name="image-warm-pool")
+        self.ai_handler = ai_handler
+        self.cache = ai_handler.image_cache
+        self.idle_seconds = float(idle_seconds or os.getenv("IMAGE_POOL_IDLE_SECONDS", 60))
+        self.interval = float(interval or os.getenv("IMAGE_POOL_INTERVAL", 30))
+        self.top_n = int(top_n or os.getenv("IMAGE_POOL_TOP_PROMPTS", 10))
+        self._wake = threading.Event()
+        self.loop = None
+        self.session = None
+
+    def request_top_up(self):
+        """Asks the pool to re-check deficits at its next idle moment instead of waiting a full interval."""
+        self._wake.set()
+
+    def run(self):
+        logger.info("Image warm pool started")
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            try:
+                self.top_up()
+            except Exception as e:
+                logger.error(f"Image warm pool error: {e}")
+
+    def top_up(self):
+        for prompt, model, size, missing in self.cache.pool_deficits(self.top_n):
+            if not self.ai_handler.is_image_idle(self.idle_seconds):
+                return
+            logger.info(f"Image warm pool: generating {missing} images for '{prompt}' ({model})")
+            staging = os.path.join(CACHE_DIR, "staging")
+            paths = self.loop.run_until_complete(self._generate(prompt, missing, staging, model))
+            for path in paths:
+                # Generated files are named ai_gen_{model}_{seed}_{slot}.jpg
+                seed = int(os.path.splitext(os.path.basename(path))[0].rsplit("_", 2)[1])
+                self.cache.put(prompt, model, size, seed, path, pooled=True)
+                ImageCache._remove_file(path)
+
+    async def _generate(self, prompt, count, output_dir, model):
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self.ai_handler.image_concurrency))
+        return await self.ai_handler.agenerate_images_from_prompt(
+            prompt, count=count, output_dir=output_dir, model=model, use_pool=False, background=True, session=self.session
+        )
@@ -0,0 +1,89 @@
+import os
+import re
+import subprocess
+from urllib.parse import urlsplit
+from logger_config import logger
+
+# Slides are scaled into a 1080x1920 frame, so 1080 px variants are the ideal download
+TARGET_RESOLUTION = int(os.getenv("IMAGE_TARGET_RESOLUTION", 1080))
+# Max differing bits (of 64) for two downloads to count as the same picture
+DHASH_THRESHOLD = int(os.getenv("IMAGE_DHASH_THRESHOLD", 6))
+
+# "~tplv-xxx-resize-jpeg:1080:1080.jpeg", "~plv-photomode-video:1080:1080.jpeg", ...
+SIZE_RE = re.compile(r':(\d+):(\d+)')
+EXTENSION_RE = re.compile(r'\.(?:jpe?g|png|webp|avif|image)$', re.IGNORECASE)
+
+def object_key(url):
+    """
+    Identifies the stored object behind a CDN URL. Mirrors (p16/p19/...) and the
+    `~tplv-...`/size suffixes are renditions of the same key, so host and suffix are dropped.
+    """
+    path = urlsplit(url).path
+    return EXTENSION_RE.sub("", path.split("~", 1)[0])
+
+def variant_size(url):
+    """Largest dimension encoded in the variant suffix, or None for the original/unknown size."""
+    path = urlsplit(url).path
+    if "~" not in path:
+        return None
+    sizes = SIZE_RE.findall(path.split("~", 1)[1])
+    return max(max(int(w), int(h)) for w, h in sizes) if sizes else None
+
+def canonicalize_image_urls(urls, target=TARGET_RESOLUTION):
+    """
+    Collapses CDN variants of the same object into one URL (first-seen order kept), picking
+    the variant whose size is closest to `target`; on a tie the larger one wins. Variants
+    with an unknown size are only used when nothing sized is available.
+    """
+    groups = {}
+    for url in urls:
+        groups.setdefault(object_key(url), []).append(url)
+
+    def rank(url):
+        size = variant_size(url)
+        if size is None:
+            return (1, 0, 0)
+        return (0, abs(size - target), -size)
+
+    return [min(variants, key=rank) for variants in groups.values()]
+
+def dhash(path):
+    """
+    64-bit difference hash: ffmpeg shrinks the image to 9x8 grayscale and each bit says whether
+    a pixel is brighter than its right neighbour. Returns None if ffmpeg cannot decode the file.
+    """
+    command = [
+        'ffmpeg', '-v', 'error', '-i', path,
+        '-vf', 'scale=9:8:flags=area,format=gray', '-frames:v', '1',
+        '-f', 'rawvideo', '-'
+    ]
+    try:
+        pixels = subprocess.run(command, capture_output=True, check=True, timeout=15).stdout
+    except (subprocess.SubprocessError, OSError) as e:
+        logger.warning(f"dHash failed for {os.path.basename(path)}: {e}")
+        return None
+    if len(pixels) < 72:
+        return None
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            value = (value << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return value
+
+def dedupe_images(paths, threshold=DHASH_THRESHOLD):
+    """
+    Drops downloads that look the same as an earlier one (dHash Hamming distance <= threshold).
+    The duplicate files are deleted. Returns the kept paths in their original order.
+    """
+    kept, hashes = [], []
+    for path in paths:
+        value = dhash(path)
+        if value is not None and any(bin(value ^ other).count("1") <= threshold for other in hashes):
+            logger.info(f"Dropping visual duplicate: {os.path.basename(path)}")
+            try: os.remove(path)
+            except OSError: pass
+            continue
+        kept.append(path)
+        if value is not None:
+            hashes.append(value)
+    return kept
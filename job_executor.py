@@ -0,0 +1,75 @@
+import os
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from logger_config import logger
+from metrics import export_metrics
+
+class JobExecutor:
+    """
+    Runs blocking pipeline work (ffmpeg renders, sync LLM calls, hashing) off the event loop.
+    The `thread` backend suits jobs that mostly wait on a subprocess or the network; the
+    `process` backend isolates CPU-bound jobs, which must then be picklable module-level
+    functions. run_io() always uses a small thread pool for calls that cannot be pickled
+    (bound methods holding clients, locks or SQLite handles).
+    """
+    def __init__(self, backend=None, max_workers=None):
+        self.backend = (backend or os.getenv("JOB_EXECUTOR_BACKEND", "thread")).lower()
+        self.max_workers = int(max_workers or os.getenv("JOB_EXECUTOR_WORKERS", 2))
+        if self.backend == "process":
+            self.pool = ProcessPoolExecutor(max_workers=self.max_workers)
+        else:
+            self.backend = "thread"
+            self.pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="job")
+        self.io_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="job-io")
+        self.pending = 0
+        self.completed = 0
+        self.failed = 0
+        self._lock = threading.Lock()
+        logger.info(f"Job executor started: {self.backend} backend, {self.max_workers} workers")
+
+    def _track(self, future):
+        with self._lock:
+            self.pending += 1
+        self.export()
+
+        def done(f):
+            with self._lock:
+                self.pending -= 1
+                if f.cancelled() or f.exception():
+                    self.failed += 1
+                else:
+                    self.completed += 1
+            self.export()
+        future.add_done_callback(done)
+        return future
+
+    def submit(self, fn, *args, **kwargs):
+        """Queues a job and returns its concurrent.futures.Future."""
+        return self._track(self.pool.submit(fn, *args, **kwargs))
+
+    async def run(self, fn, *args, **kwargs):
+        """Submits a job to the configured backend and awaits its result."""
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+    async def run_io(self, fn, *args, **kwargs):
+        """Awaits a blocking call on the I/O thread pool (no pickling required)."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.io_pool, functools.partial(fn, *args, **kwargs))
+
+    def snapshot(self):
+        return {
+            "backend": self.backend,
+            "workers": self.max_workers,
+            "pending": self.pending,
+            "completed": self.completed,
+            "failed": self.failed,
+        }
+
+    def export(self):
+        export_metrics("jobs", self.snapshot(), min_interval=5)
+
+    def shutdown(self, wait=True):
+        self.pool.shutdown(wait=wait, cancel_futures=not wait)
+        self.io_pool.shutdown(wait=wait, cancel_futures=not wait)
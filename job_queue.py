@@ -0,0 +1,410 @@
+import os
+import abc
+import json
+import time
+import uuid
+import sqlite3
+import contextlib
+import asyncio
+from logger_config import logger
+from metrics import export_metrics
+from resp_client import RespClient
+
+QUEUE_DIR = os.path.join("temp", "jobs")
+# A worker must heartbeat within this many seconds or its job is handed to another worker
+LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", 60))
+RETRY_BASE_DELAY = 5
+
+QUEUED, RUNNING, SUCCEEDED, FAILED = "queued", "running", "succeeded", "failed"
+FINISHED_STATES = (SUCCEEDED, FAILED)
+
+class PermanentJobError(Exception):
+    """Raised by a job handler when retrying cannot help (bad input); the job fails at once."""
+
+class JobQueue(abc.ABC):
+    """
+    Durable job queue. Producers enqueue(); workers claim() the highest-priority runnable
+    job under a lease, heartbeat() while working and complete() or fail() it. Failed
+    attempts are retried with exponential backoff until max_attempts; a job whose lease
+    expires (worker or node died) is handed to the next worker. Backends implement the
+    storage; use get_job_queue() to build the configured one.
+    """
+    def __init__(self, lease=None):
+        self.lease = float(lease or LEASE_SECONDS)
+
+    @abc.abstractmethod
+    def enqueue(self, kind, payload, priority=0, max_attempts=3):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def get(self, job_id):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def claim(self, worker_id, kinds=None):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def heartbeat(self, job_id, worker_id, stage=None, progress=None):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def complete(self, job_id, worker_id, result=None):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def fail(self, job_id, worker_id, error, retry=True):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def cancel(self, job_id, reason="cancelled"):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def stats(self):
+        raise NotImplementedError
+
+    def purge_finished(self, older_than=7 * 24 * 3600):
+        return 0
+
+    def wait(self, job_id, timeout=None, poll=0.5):
+        """Blocks until the job finishes and returns it (or the last state seen on timeout)."""
+        deadline = time.time() + timeout if timeout else None
+        while True:
+            job = self.get(job_id)
+            if not job or job["state"] in FINISHED_STATES or (deadline and time.time() >= deadline):
+                return job
+            time.sleep(poll)
+
+    async def await_job(self, job_id, timeout=None, poll=0.5):
+        """Async twin of wait() for the bot's event loop."""
+        deadline = time.time() + timeout if timeout else None
+        while True:
+            job = await asyncio.to_thread(self.get, job_id)
+            if not job or job["state"] in FINISHED_STATES or (deadline and time.time() >= deadline):
+                return job
+            await asyncio.sleep(poll)
+
+    def export(self):
+        export_metrics("job_queue", self.stats(), min_interval=5)
+
+class SQLiteJobQueue(JobQueue):
+    """Queue in temp/jobs/queue.sqlite, shared by every process on one node."""
+    def __init__(self, db_path=None, lease=None):
+        super().__init__(lease)
+        self.db_path = db_path or os.path.join(QUEUE_DIR, "queue.sqlite")
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        with self._connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("""CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY, kind TEXT, payload TEXT, state TEXT, priority INTEGER DEFAULT 0,
+                attempts INTEGER DEFAULT 0, max_attempts INTEGER DEFAULT 3,
+                worker TEXT, lease_expires REAL, available_at REAL,
+                stage TEXT, progress REAL DEFAULT 0, result TEXT, error TEXT,
+                created REAL, updated REAL)""")
+            db.execute("CREATE INDEX IF NOT EXISTS jobs_runnable ON jobs (state, priority DESC, created)")
+
+    @contextlib.contextmanager
+    def _connect(self):
+        """One transaction on a fresh connection that is closed afterwards (sqlite3's own `with` only commits)."""
+        with contextlib.closing(sqlite3.connect(self.db_path, timeout=30)) as db, db:
+            yield db
+
+    @staticmethod
+    def _row_to_job(cursor, row):
+        job = {col[0]: value for col, value in zip(cursor.description, row)}
+        job["payload"] = json.loads(job["payload"]) if job["payload"] else {}
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def enqueue(self, kind, payload, priority=0, max_attempts=3):
+        """Adds a job and returns its id."""
+        job_id = uuid.uuid4().hex[:12]
+        now = time.time()
+        with self._connect() as db:
+            db.execute("""INSERT INTO jobs (id, kind, payload, state, priority, max_attempts, available_at, stage, created, updated)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                (job_id, kind, json.dumps(payload), QUEUED, priority, max_attempts, now, QUEUED, now, now))
+        logger.info(f"Job {job_id} queued ({kind}, priority {priority})")
+        self.export()
+        return job_id
+
+    def get(self, job_id):
+        with self._connect() as db:
+            cursor = db.execute("SELECT * FROM jobs WHERE id=?", (job_id,))
+            row = cursor.fetchone()
+            return self._row_to_job(cursor, row) if row else None
+
+    def _expire_leases(self, db, now):
+        """Jobs whose worker stopped heartbeating go back to the queue (or fail when out of attempts)."""
+        expired = db.execute("SELECT id, attempts, max_attempts FROM jobs WHERE state=? AND lease_expires<?",
+                             (RUNNING, now)).fetchall()
+        for job_id, attempts, max_attempts in expired:
+            if attempts >= max_attempts:
+                db.execute("UPDATE jobs SET state=?, error=?, worker=NULL, updated=? WHERE id=?",
+                           (FAILED, "lease expired (worker lost)", now, job_id))
+            else:
+                db.execute("UPDATE jobs SET state=?, stage=?, worker=NULL, available_at=?, updated=? WHERE id=?",
+                           (QUEUED, QUEUED, now, now, job_id))
+            logger.warning(f"Job {job_id}: lease expired, {'failed' if attempts >= max_attempts else 'requeued'}")
+
+    def claim(self, worker_id, kinds=None):
+        """Leases the next runnable job to worker_id. Returns the job dict or None."""
+        now = time.time()
+        with self._connect() as db:
+            db.execute("BEGIN IMMEDIATE")
+            self._expire_leases(db, now)
+            query = "SELECT id FROM jobs WHERE state=? AND available_at<=?"
+            params = [QUEUED, now]
+            if kinds:
+                query += f" AND kind IN ({','.join('?' * len(kinds))})"
+                params += list(kinds)
+            row = db.execute(query + " ORDER BY priority DESC, created LIMIT 1", params).fetchone()
+            if not row:
+                return None
+            db.execute("""UPDATE jobs SET state=?, worker=?, lease_expires=?, attempts=attempts+1,
+                stage=?, progress=0, updated=? WHERE id=?""",
+                (RUNNING, worker_id, now + self.lease, "starting", now, row[0]))
+        self.export()
+        return self.get(row[0])
+
+    def heartbeat(self, job_id, worker_id, stage=None, progress=None):
+        """Extends the lease (optionally reporting progress). False means the lease was lost."""
+        now = time.time()
+        with self._connect() as db:
+            updated = db.execute("""UPDATE jobs SET lease_expires=?, stage=COALESCE(?, stage),
+                progress=COALESCE(?, progress), updated=? WHERE id=? AND worker=? AND state=?""",
+                (now + self.lease, stage, progress, now, job_id, worker_id, RUNNING)).rowcount
+        return bool(updated)
+
+    def complete(self, job_id, worker_id, result=None):
+        now = time.time()
+        with self._connect() as db:
+            db.execute("""UPDATE jobs SET state=?, stage=?, progress=100, result=?, worker=NULL, updated=?
+                WHERE id=? AND worker=?""", (SUCCEEDED, SUCCEEDED, json.dumps(result or {}), now, job_id, worker_id))
+        logger.info(f"Job {job_id} succeeded")
+        self.export()
+
+    def fail(self, job_id, worker_id, error, retry=True):
+        """Records a failed attempt; the job is retried with backoff while attempts remain."""
+        now = time.time()
+        with self._connect() as db:
+            row = db.execute("SELECT attempts, max_attempts FROM jobs WHERE id=? AND worker=?", (job_id, worker_id)).fetchone()
+            if not row:
+                return
+            attempts, max_attempts = row
+            if retry and attempts < max_attempts:
+                delay = RETRY_BASE_DELAY * 2 ** (attempts - 1)
+                db.execute("""UPDATE jobs SET state=?, stage=?, error=?, worker=NULL, available_at=?, updated=?
+                    WHERE id=?""", (QUEUED, "retrying", str(error), now + delay, now, job_id))
+                logger.warning(f"Job {job_id} attempt {attempts}/{max_attempts} failed ({error}), retrying in {delay}s")
+            else:
+                db.execute("UPDATE jobs SET state=?, stage=?, error=?, worker=NULL, updated=? WHERE id=?",
+                           (FAILED, FAILED, str(error), now, job_id))
+                logger.error(f"Job {job_id} failed: {error}")
+        self.export()
+
+    def cancel(self, job_id, reason="cancelled"):
+        """Fails a job that no worker has picked up yet. Returns True if it was still queued."""
+        with self._connect() as db:
+            updated = db.execute("UPDATE jobs SET state=?, stage=?, error=?, updated=? WHERE id=? AND state=?",
+                                 (FAILED, FAILED, reason, time.time(), job_id, QUEUED)).rowcount
+        return bool(updated)
+
+    def stats(self):
+        with self._connect() as db:
+            counts = dict(db.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall())
+        return {state: counts.get(state, 0) for state in (QUEUED, RUNNING, SUCCEEDED, FAILED)}
+
+    def purge_finished(self, older_than=7 * 24 * 3600):
+        with self._connect() as db:
+            return db.execute("DELETE FROM jobs WHERE state IN (?, ?) AND updated<?",
+                              (*FINISHED_STATES, time.time() - older_than)).rowcount
+
+class RedisJobQueue(JobQueue):
+    """
+    Queue on a Redis server (RESP protocol) so workers on several nodes share it.
+    Jobs are hashes; runnable ids sit in a per-kind sorted set ordered by priority then age,
+    retries wait in a `delayed` set and running jobs in a `leases` set scored by expiry.
+    A worker takes a job by winning `ZADD NX` on the lease set *before* removing it from
+    the runnable set, so a node dying at any point leaves either a queued job or an
+    expiring lease, never a lost job.
+    """
+    def __init__(self, url=None, lease=None, prefix=None, result_ttl=None):
+        super().__init__(lease)
+        self.redis = RespClient(url or os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+        self.prefix = prefix or os.getenv("JOB_QUEUE_PREFIX", "tiktokbot:jobs")
+        self.result_ttl = int(result_ttl or os.getenv("JOB_RESULT_TTL", 7 * 24 * 3600))
+
+    def _key(self, *parts):
+        return ":".join((self.prefix, *parts))
+
+    @staticmethod
+    def _score(priority, created):
+        # Higher priority first, then oldest first
+        return created - priority * 1e10
+
+    def _hset(self, job_id, **fields):
+        args = []
+        for name, value in fields.items():
+            args += [name, "" if value is None else value]
+        self.redis.execute("HSET", self._key("job", job_id), *args)
+
+    def enqueue(self, kind, payload, priority=0, max_attempts=3):
+        job_id = uuid.uuid4().hex[:12]
+        now = time.time()
+        self._hset(job_id, id=job_id, kind=kind, payload=json.dumps(payload), state=QUEUED, priority=priority,
+                   attempts=0, max_attempts=max_attempts, worker="", lease_expires=0, available_at=now,
+                   stage=QUEUED, progress=0, result="", error="", created=now, updated=now)
+        self.redis.execute("ZADD", self._key("queued", kind), self._score(priority, now), job_id)
+        self.redis.execute("SADD", self._key("kinds"), kind)
+        logger.info(f"Job {job_id} queued ({kind}, priority {priority})")
+        self.export()
+        return job_id
+
+    def get(self, job_id):
+        flat = self.redis.execute("HGETALL", self._key("job", job_id))
+        if not flat:
+            return None
+        job = dict(zip(flat[::2], flat[1::2]))
+        for name in ("priority", "attempts", "max_attempts"):
+            job[name] = int(job.get(name) or 0)
+        for name in ("lease_expires", "available_at", "progress", "created", "updated"):
+            job[name] = float(job.get(name) or 0)
+        job["payload"] = json.loads(job["payload"]) if job.get("payload") else {}
+        job["result"] = json.loads(job["result"]) if job.get("result") else None
+        job["worker"] = job.get("worker") or None
+        job["error"] = job.get("error") or None
+        return job
+
+    def _promote_delayed(self, now):
+        for job_id in self.redis.execute("ZRANGEBYSCORE", self._key("delayed"), "-inf", now) or []:
+            job = self.get(job_id)
+            if job and job["state"] == QUEUED:
+                self.redis.execute("ZADD", self._key("queued", job["kind"]), "NX",
+                                   self._score(job["priority"], job["created"]), job_id)
+            self.redis.execute("ZREM", self._key("delayed"), job_id)
+
+    def _expire_leases(self, now):
+        for job_id in self.redis.execute("ZRANGEBYSCORE", self._key("leases"), "-inf", now) or []:
+            job = self.get(job_id)
+            if job and job["state"] == RUNNING:
+                if job["attempts"] >= job["max_attempts"]:
+                    self._finish(job_id, FAILED, error="lease expired (worker lost)")
+                else:
+                    self._hset(job_id, state=QUEUED, stage=QUEUED, worker="", available_at=now, updated=now)
+                    self.redis.execute("ZADD", self._key("queued", job["kind"]), "NX",
+                                       self._score(job["priority"], job["created"]), job_id)
+                logger.warning(f"Job {job_id}: lease expired, {'failed' if job['attempts'] >= job['max_attempts'] else 'requeued'}")
+            elif job and job["state"] == QUEUED:
+                # The claiming worker died between taking the lease and marking the job running
+                self.redis.execute("ZADD", self._key("queued", job["kind"]), "NX",
+                                   self._score(job["priority"], job["created"]), job_id)
+            self.redis.execute("ZREM", self._key("leases"), job_id)
+
+    def claim(self, worker_id, kinds=None):
+        now = time.time()
+        self._promote_delayed(now)
+        self._expire_leases(now)
+        kinds = kinds or self.redis.execute("SMEMBERS", self._key("kinds")) or []
+        # Best candidate across kinds first; a lost race just moves on to the next one
+        candidates = []
+        for kind in kinds:
+            reply = self.redis.execute("ZRANGE", self._key("queued", kind), 0, 4, "WITHSCORES") or []
+            candidates += [(float(score), job_id, kind) for job_id, score in zip(reply[::2], reply[1::2])]
+        for _, job_id, kind in sorted(candidates):
+            if not self.redis.execute("ZADD", self._key("leases"), "NX", now + self.lease, job_id):
+                continue
+            if not self.redis.execute("ZREM", self._key("queued", kind), job_id):
+                # Cancelled (or claimed and finished) in the meantime
+                self.redis.execute("ZREM", self._key("leases"), job_id)
+                continue
+            self._hset(job_id, state=RUNNING, worker=worker_id, lease_expires=now + self.lease,
+                       stage="starting", progress=0, updated=now)
+            self.redis.execute("HINCRBY", self._key("job", job_id), "attempts", 1)
+            self.export()
+            return self.get(job_id)
+        return None
+
+    def _owns(self, job_id, worker_id):
+        state, worker = self.redis.execute("HMGET", self._key("job", job_id), "state", "worker")
+        return state == RUNNING and worker == worker_id
+
+    def heartbeat(self, job_id, worker_id, stage=None, progress=None):
+        if not self._owns(job_id, worker_id):
+            return False
+        now = time.time()
+        # The lease must still exist (ZADD ... CH reports 0 for an unchanged score, so it cannot tell);
+        # XX: never resurrect a lease that expires between the two commands
+        if self.redis.execute("ZSCORE", self._key("leases"), job_id) is None:
+            return False
+        self.redis.execute("ZADD", self._key("leases"), "XX", now + self.lease, job_id)
+        fields = {"lease_expires": now + self.lease, "updated": now}
+        if stage is not None:
+            fields["stage"] = stage
+        if progress is not None:
+            fields["progress"] = progress
+        self._hset(job_id, **fields)
+        return True
+
+    def _finish(self, job_id, state, result=None, error=None):
+        now = time.time()
+        self._hset(job_id, state=state, stage=state, worker="", updated=now, error=error,
+                   **({"progress": 100, "result": json.dumps(result or {})} if state == SUCCEEDED else {}))
+        self.redis.execute("ZREM", self._key("leases"), job_id)
+        self.redis.execute("HINCRBY", self._key("counts"), state, 1)
+        self.redis.execute("EXPIRE", self._key("job", job_id), self.result_ttl)
+
+    def complete(self, job_id, worker_id, result=None):
+        if not self._owns(job_id, worker_id):
+            return
+        self._finish(job_id, SUCCEEDED, result=result)
+        logger.info(f"Job {job_id} succeeded")
+        self.export()
+
+    def fail(self, job_id, worker_id, error, retry=True):
+        if not self._owns(job_id, worker_id):
+            return
+        job = self.get(job_id)
+        now = time.time()
+        if retry and job["attempts"] < job["max_attempts"]:
+            delay = RETRY_BASE_DELAY * 2 ** (job["attempts"] - 1)
+            self._hset(job_id, state=QUEUED, stage="retrying", error=str(error), worker="",
+                       available_at=now + delay, updated=now)
+            self.redis.execute("ZADD", self._key("delayed"), now + delay, job_id)
+            self.redis.execute("ZREM", self._key("leases"), job_id)
+            logger.warning(f"Job {job_id} attempt {job['attempts']}/{job['max_attempts']} failed ({error}), retrying in {delay}s")
+        else:
+            self._finish(job_id, FAILED, error=str(error))
+            logger.error(f"Job {job_id} failed: {error}")
+        self.export()
+
+    def cancel(self, job_id, reason="cancelled"):
+        job = self.get(job_id)
+        if not job or job["state"] != QUEUED:
+            return False
+        removed = self.redis.execute("ZREM", self._key("queued", job["kind"]), job_id)
+        removed += self.redis.execute("ZREM", self._key("delayed"), job_id)
+        if removed:
+            self._finish(job_id, FAILED, error=reason)
+        return bool(removed)
+
+    def stats(self):
+        counts = self.redis.execute("HGETALL", self._key("counts")) or []
+        counts = {name: int(value) for name, value in zip(counts[::2], counts[1::2])}
+        queued = self.redis.execute("ZCARD", self._key("delayed"))
+        for kind in self.redis.execute("SMEMBERS", self._key("kinds")) or []:
+            queued += self.redis.execute("ZCARD", self._key("queued", kind))
+        return {
+            QUEUED: queued,
+            RUNNING: self.redis.execute("ZCARD", self._key("leases")),
+            SUCCEEDED: counts.get(SUCCEEDED, 0),
+            FAILED: counts.get(FAILED, 0),
+        }
+
+def get_job_queue():
+    """Builds the queue selected by JOB_QUEUE_BACKEND (sqlite for one node, redis for several)."""
+    backend = os.getenv("JOB_QUEUE_BACKEND", "sqlite").lower()
+    if backend == "redis":
+        return RedisJobQueue()
+    return SQLiteJobQueue()
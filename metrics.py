@@ -0,0 +1,74 @@
+import os
+import sys
+import json
+import time
+import threading
+from logger_config import LOGS_DIR
+
+# Each process writes its own snapshot files here; the dashboards read and aggregate them
+METRICS_DIR = os.path.join(LOGS_DIR, "metrics")
+os.makedirs(METRICS_DIR, exist_ok=True)
+
+# Role of the current process (bot, dashboard_pro, ...) used to namespace its snapshot files
+PROCESS_ROLE = os.path.splitext(os.path.basename(sys.argv[0] or "python"))[0] or "python"
+
+_last_export = {}
+_lock = threading.Lock()
+
+def export_metrics(name, data, min_interval=10):
+    """
+    Writes a metrics snapshot to logs/metrics/<role>.<name>.json (atomically).
+    Calls within `min_interval` seconds of the previous export for the same name are skipped.
+    """
+    now = time.time()
+    with _lock:
+        if now - _last_export.get(name, 0) < min_interval:
+            return False
+        _last_export[name] = now
+
+    path = os.path.join(METRICS_DIR, f"{PROCESS_ROLE}.{name}.json")
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "w", encoding='utf-8') as f:
+            json.dump({"updated_at": now, "pid": os.getpid(), "data": data}, f)
+        os.replace(tmp_path, path)
+        return True
+    except Exception:
+        try: os.remove(tmp_path)
+        except: pass
+        return False
+
+def set_process_role(role):
+    """
+    Renames the current process's snapshot files. Processes that share a role (serving
+    workers, worker.py replicas) each need their own role or they overwrite each other.
+    """
+    global PROCESS_ROLE
+    PROCESS_ROLE = role
+    with _lock:
+        _last_export.clear()
+
+def clear_metrics(role_prefix):
+    """Deletes snapshots left behind by earlier processes whose role starts with `role_prefix`."""
+    if not os.path.exists(METRICS_DIR):
+        return
+    for file in os.listdir(METRICS_DIR):
+        if file.startswith(role_prefix):
+            try: os.remove(os.path.join(METRICS_DIR, file))
+            except OSError: pass
+
+def read_metrics(name):
+    """Returns {role: data} for every process that exported metrics under `name`."""
+    results = {}
+    if not os.path.exists(METRICS_DIR):
+        return results
+    suffix = f".{name}.json"
+    for file in os.listdir(METRICS_DIR):
+        if not file.endswith(suffix):
+            continue
+        try:
+            with open(os.path.join(METRICS_DIR, file), "r", encoding='utf-8') as f:
+                results[file[:-len(suffix)]] = json.load(f)["data"]
+        except Exception:
+            continue
+    return results
@@ -1,4 +1,4 @@
-from flask import Flask, render_template_string, request, send_from_directory, redirect, url_for, flash, session
+from flask import Flask, render_template_string, request, send_from_directory, redirect, url_for, flash, session, jsonify
 import os
 import uuid
 import shutil
@@ -9,6 +9,11 @@ from dotenv import load_dotenv
 from ai_handler import AIHandler
 from video_processor import VideoProcessor
 from logger_config import logger
+from artifact_store import ArtifactStore
+from job_queue import get_job_queue, SUCCEEDED, FAILED
+from render_jobs import stored_input
+from content_jobs import MUSIC_KIND
+from worker import start_local_worker
 import time
 
 load_dotenv()
@@ -26,6 +31,18 @@ DASHBOARD_AUTH_KEY = os.getenv("DASHBOARD_AUTH_KEY", "admin123")
 # Initialize Handlers
 ai_handler = AIHandler()
 video_processor = VideoProcessor()
+artifact_store = ArtifactStore()
+# Music videos are jobs on the shared queue (worker.py, or the in-process worker in inline mode)
+render_queue = get_job_queue()
+
+def start_background_services():
+    """
+    Starts the image warm pool, the artifact GC and (RENDER_MODE=inline) the in-process job
+    worker; serve.py calls this in one serving process per node.
+    """
+    ai_handler.start_image_warm_pool()
+    artifact_store.start_collector()
+    start_local_worker(artifact_store)
 
 def require_auth(f):
     @wraps(f)
@@ -321,6 +338,22 @@ MUSIC_CREATE_CONTENT = """
         {% endif %}
 
         <script>
+            {% if job_id %}
+            // A queued music video: show the worker's real progress and reload once it has finished
+            document.getElementById('submit-btn').classList.add('hidden');
+            document.getElementById('loading-status').classList.remove('hidden');
+            (function follow() {
+                fetch('/jobs/{{ job_id }}').then(r => r.json()).then(job => {
+                    if (job.error && !job.state) { window.location = '/'; return; }
+                    const p = Math.round(job.progress || 0);
+                    document.getElementById('status-text').innerHTML = `<span class="animate-spin text-xl">⏳</span> ${job.stage || job.state}`;
+                    document.getElementById('progress-bar').style.width = `${p}%`;
+                    document.getElementById('progress-percent').innerText = `${p}%`;
+                    if (job.state === 'succeeded' || job.state === 'failed') { window.location.reload(); return; }
+                    setTimeout(follow, 2000);
+                }).catch(() => setTimeout(follow, 5000));
+            })();
+            {% endif %}
             document.getElementById('creator-form').onsubmit = function() {
                 // Hide button and show status
                 document.getElementById('submit-btn').classList.add('hidden');
@@ -479,8 +512,26 @@ def logout():
 @app.route("/")
 @require_auth
 def index():
+    """Creator form; with ?job= it follows a queued music video and shows it once it is done."""
+    job_id = request.args.get("job")
+    job = render_queue.get(job_id) if job_id else None
+    if job and job["kind"] != MUSIC_KIND:
+        job = None
+    if job and job["state"] == SUCCEEDED:
+        filename = job["result"]["filename"]
+        output_path = os.path.join(UPLOAD_FOLDER, filename)
+        if os.path.exists(output_path) or artifact_store.materialize(job["result"]["video"], output_path):
+            return render_template_string(LAYOUT_START + MUSIC_CREATE_CONTENT + LAYOUT_END,
+                                         title="Video Selesai", active="dashboard", result_video=filename)
+        flash("Video sudah kedaluwarsa dan dihapus dari server. Silakan buat ulang.")
+        job = None
+    elif job and job["state"] == FAILED:
+        flash(f"Gagal membuat video: {job['error']}")
+        job = None
+    elif job_id and not job:
+        flash("Proses tidak ditemukan.")
     return render_template_string(LAYOUT_START + MUSIC_CREATE_CONTENT + LAYOUT_END, 
-                                 title="Music Video Creator", active="dashboard")
+                                 title="Music Video Creator", active="dashboard", job_id=job["id"] if job else None)
 
 @app.route("/gallery")
 @require_auth
@@ -528,47 +579,54 @@ def generate():
         flash("File audio wajib diunggah!")
         return redirect(url_for("index"))
 
-    # Save audio
-    audio_path = os.path.join("temp", audio_file.filename)
-    os.makedirs("temp", exist_ok=True)
-    audio_file.save(audio_path)
+    # Uploads get unique names (two requests may send the same filename); the job carries
+    # them as artifact-store copies, so they are deleted once it is queued
+    uploads = []
+    def save_upload(file):
+        path = os.path.join("temp", f"upload_{uuid.uuid4().hex}{os.path.splitext(file.filename)[1].lower()}")
+        file.save(path)
+        uploads.append(path)
+        return path
 
+    os.makedirs("temp", exist_ok=True)
     try:
-        image_paths = []
-        if image_prompt and (not manual_images or not manual_images[0].filename):
-            # Use AI Generator with selected model
-            image_paths = ai_handler.generate_images_from_prompt(image_prompt, count=5, model=ai_model)
-        elif manual_images and manual_images[0].filename:
-            # Save manual images
-            for img in manual_images:
-                path = os.path.join("temp", img.filename)
-                img.save(path)
-                image_paths.append(path)
-        
-        if not image_paths:
+        audio = stored_input(artifact_store, save_upload(audio_file), "audio")
+        images = []
+        if manual_images and manual_images[0].filename:
+            images = [stored_input(artifact_store, save_upload(img), "image") for img in manual_images]
+        elif not image_prompt:
             flash("Gagal mendapatkan gambar (AI atau Manual)!")
             return redirect(url_for("index"))
 
-        # Create video
-        output_filename = f"music_video_{int(time.time())}.mp4"
-        output_path = os.path.join(UPLOAD_FOLDER, output_filename)
-        os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-
-        success = video_processor.create_video_from_images_and_audio(
-            image_paths, audio_path, output_path
-        )
-
-        if success:
-            return render_template_string(LAYOUT_START + MUSIC_CREATE_CONTENT + LAYOUT_END, 
-                                         title="Video Selesai", active="dashboard", result_video=output_filename)
-        else:
-            flash("Gagal membuat video. Cek log server.")
-            return redirect(url_for("index"))
+        # AI visuals (when no photos were uploaded) and the render run on a worker; the page follows the job
+        session_id = uuid.uuid4().hex[:8]
+        job_id = render_queue.enqueue(MUSIC_KIND, {
+            "session_id": session_id,
+            "filename": f"music_video_{session_id}.mp4",
+            "audio": audio,
+            "images": images,
+            "image_prompt": None if images else image_prompt,
+            "prompt": image_prompt or os.path.splitext(audio_file.filename)[0],
+            "ai_model": ai_model,
+        }, priority=5)
+        return redirect(url_for("index", job=job_id))
 
     except Exception as e:
         logger.error(f"Generate Error: {e}")
         flash(f"Error: {e}")
         return redirect(url_for("index"))
+    finally:
+        for path in uploads:
+            try: os.remove(path)
+            except OSError: pass
+
+@app.route("/jobs/<job_id>")
+@require_auth
+def job_status(job_id):
+    job = render_queue.get(job_id)
+    if not job:
+        return jsonify({"error": "job not found"}), 404
+    return jsonify({key: job.get(key) for key in ("id", "state", "stage", "progress", "error")})
 
 @app.route("/download/<path:filename>")
 @require_auth
@@ -576,4 +634,6 @@ def download(filename):
     return send_from_directory(UPLOAD_FOLDER, filename, as_attachment=True)
 
 if __name__ == "__main__":
+    # Development server; production runs `python serve.py music_dashboard`
+    start_background_services()
     app.run(debug=True, port=5001)
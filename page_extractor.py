@@ -0,0 +1,141 @@
+import re
+import json
+
+# All regexes are compiled once at import; product pages are several hundred KB,
+# so every extra pass or lowercase copy of the HTML shows up in scrape latency.
+# Block-page markers, matched case-insensitively ("CaPTCHA" counts) without copying the
+# page the way html.lower() would.
+CAPTCHA_RE = re.compile(r'captcha', re.IGNORECASE)
+VERIFY_RE = re.compile(r'verify', re.IGNORECASE)
+CHALLENGE_RE = re.compile(r'challenge', re.IGNORECASE)
+TITLE_RE = re.compile(r'"title":"(.*?)"')
+# Gallery images: the 1080 photomode variant is preferred, any CDN jpg/webp otherwise.
+# One alternation so the page is scanned a single time for both.
+CDN_IMAGE_RE = re.compile(
+    r'https://[a-zA-Z0-9.-]+\.(?:byteimg|tiktokcdn)\.com/[a-zA-Z0-9/_.-]+'
+    r'(?P<photomode>~plv-photomode-video:1080:1080\.jpeg)?(?(photomode)|\.(?:webp|jpg|jpeg))'
+)
+
+# <script> tags that carry the server-rendered page state, in order of preference
+STATE_SCRIPT_IDS = ("__MODERN_ROUTER_DATA__", "__UNIVERSAL_DATA_FOR_REHYDRATION__")
+MAX_WALK_DEPTH = 40
+
+def is_blocked_page(html):
+    """True for CAPTCHA / security challenge pages."""
+    return bool(CAPTCHA_RE.search(html) or (VERIFY_RE.search(html) and CHALLENGE_RE.search(html)))
+
+def find_state_json(html):
+    """Locates the embedded state blob and parses only that slice. Returns the object or None."""
+    for script_id in STATE_SCRIPT_IDS:
+        marker = html.find(f'id="{script_id}"')
+        if marker == -1:
+            continue
+        start = html.find(">", marker) + 1
+        end = html.find("</script>", start)
+        if start == 0 or end == -1:
+            continue
+        try:
+            return json.loads(html[start:end])
+        except ValueError:
+            continue
+    return None
+
+def _find_product_node(node, depth=0):
+    """Depth-first search for the dict describing the product (the one holding product_base)."""
+    if depth > MAX_WALK_DEPTH:
+        return None
+    if isinstance(node, dict):
+        if isinstance(node.get("product_base"), dict):
+            return node
+        children = node.values()
+    elif isinstance(node, list):
+        children = node
+    else:
+        return None
+    for child in children:
+        if isinstance(child, (dict, list)):
+            found = _find_product_node(child, depth + 1)
+            if found:
+                return found
+    return None
+
+def _first_url(image):
+    if isinstance(image, str):
+        return image
+    if isinstance(image, dict):
+        urls = image.get("url_list") or image.get("thumb_url_list") or []
+        return urls[0] if urls else image.get("url")
+    return None
+
+def _price_text(price):
+    if isinstance(price, dict):
+        real = price.get("real_price") or price.get("sale_price") or price.get("original_price")
+        if isinstance(real, dict):
+            real = real.get("price_str") or real.get("price_val")
+        return str(real) if real else None
+    return str(price) if price else None
+
+def extract_from_state(html):
+    """Structured product record from the embedded state JSON, or None if the page has none."""
+    state = find_state_json(html)
+    node = _find_product_node(state) if state is not None else None
+    if not node:
+        return None
+    base = node["product_base"]
+    images = [url for url in (_first_url(img) for img in base.get("images") or []) if url]
+    seller = node.get("seller") or node.get("shop_info") or {}
+    return {
+        "title": base.get("title"),
+        "image_urls": list(dict.fromkeys(images)),
+        "price": _price_text(base.get("price")),
+        "shop": seller.get("name") or seller.get("shop_name") if isinstance(seller, dict) else None,
+        "source": "json",
+    }
+
+def extract_with_regex(html):
+    """Legacy extraction: scans the whole page for a title and CDN image URLs."""
+    title_match = TITLE_RE.search(html)
+    photomode, generic = [], []
+    for match in CDN_IMAGE_RE.finditer(html):
+        (photomode if match.group("photomode") else generic).append(match.group(0))
+    found_images = photomode or generic
+
+    # De-duplicate and filter
+    image_urls = []
+    seen = set()
+    for img_url in found_images:
+        clean_url = img_url.replace('\\u002F', '/')
+        if clean_url not in seen and ('obj' in clean_url or 'photomode' in clean_url):
+            image_urls.append(clean_url)
+            seen.add(clean_url)
+
+    if not image_urls:
+        image_urls = list(set(found_images))[:5]
+
+    return {
+        "title": title_match.group(1) if title_match else None,
+        "image_urls": image_urls,
+        "price": None,
+        "shop": None,
+        "source": "regex",
+    }
+
+def extract_product(html):
+    """
+    Returns {"title", "image_urls", "price", "shop", "source", "blocked"} for a product page.
+    The embedded JSON is tried first; a page that carries the product state is never a
+    challenge page, so the block-marker scan and the regex fallback only run without it.
+    """
+    record = extract_from_state(html)
+    if record and record["image_urls"]:
+        record["blocked"] = False
+        return record
+    if is_blocked_page(html):
+        return {"title": None, "image_urls": [], "price": None, "shop": None, "source": None, "blocked": True}
+    fallback = extract_with_regex(html)
+    fallback["blocked"] = False
+    if record:
+        # Keep whatever the JSON did provide (title, price, shop)
+        fallback.update({k: v for k, v in record.items() if v and k != "image_urls"})
+        fallback["source"] = "json+regex"
+    return fallback
@@ -0,0 +1,146 @@
+import os
+import time
+import asyncio
+import threading
+from urllib.parse import urlsplit
+from logger_config import logger
+from metrics import export_metrics
+
+# Starting rate (requests/s) and burst per host suffix. A bucket may grow to twice its
+# starting rate while responses are clean and shrink to a tenth of it under blocking.
+# Override with RATE_LIMITS="tiktok.com=1:3,pollinations.ai=2:4".
+HOST_LIMITS = {
+    "tiktok.com": (1.0, 3),
+    "byteimg.com": (20.0, 20),
+    "tiktokcdn.com": (20.0, 20),
+    "tiktokcdn-us.com": (20.0, 20),
+    "pollinations.ai": (2.0, 4),
+    "tiktok-tts.weilnet.workers.dev": (5.0, 5),
+}
+THROTTLE_STATUSES = (403, 429)
+DECREASE_FACTOR = 0.5
+
+def _limits_from_env():
+    limits = dict(HOST_LIMITS)
+    for item in os.getenv("RATE_LIMITS", "").split(","):
+        if "=" not in item:
+            continue
+        host, spec = item.split("=", 1)
+        try:
+            rate, _, burst = spec.partition(":")
+            limits[host.strip().lower()] = (float(rate), int(burst or max(float(rate), 1)))
+        except ValueError:
+            logger.warning(f"Ignoring invalid RATE_LIMITS entry: {item}")
+    return limits
+
+class AdaptiveTokenBucket:
+    """
+    Token bucket whose rate follows AIMD: +10% of the starting rate per clean response,
+    halved on 403/429/CAPTCHA. Callers reserve a token and sleep until it is due, so
+    requests queue up behind the limit instead of failing. Safe for threads and asyncio.
+    """
+    def __init__(self, name, rate, burst):
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = rate / 10
+        self.max_rate = rate * 2
+        self.increase = rate / 10
+        self.tokens = float(burst)
+        self.waiting = 0
+        self.throttled = 0
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self):
+        """Takes a token (possibly going into debt) and returns how long to wait for it."""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+            if wait:
+                self.waiting += 1
+            return wait
+
+    def _done_waiting(self):
+        with self._lock:
+            self.waiting -= 1
+
+    def acquire(self):
+        wait = self._reserve()
+        if wait:
+            try:
+                time.sleep(wait)
+            finally:
+                self._done_waiting()
+
+    async def aacquire(self):
+        wait = self._reserve()
+        if wait:
+            try:
+                await asyncio.sleep(wait)
+            finally:
+                self._done_waiting()
+
+    def on_response(self, status=None, blocked=False):
+        with self._lock:
+            if blocked or status in THROTTLE_STATUSES:
+                self.rate = max(self.min_rate, self.rate * DECREASE_FACTOR)
+                # Drop any saved-up burst so the slowdown takes effect immediately
+                self.tokens = min(self.tokens, 0.0)
+                self.throttled += 1
+                logger.warning(f"Rate limit {self.name}: throttled (status {status}, blocked={blocked}), now {self.rate:.2f} req/s")
+            elif status and status < 400:
+                self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def snapshot(self):
+        return {"rate": round(self.rate, 3), "queue": self.waiting, "throttled": self.throttled}
+
+class RateLimiter:
+    """Per-host adaptive buckets; hosts without a configured limit pass straight through."""
+    def __init__(self, limits=None):
+        self.limits = limits or _limits_from_env()
+        self.buckets = {}
+        self._lock = threading.Lock()
+
+    def bucket_for(self, url):
+        host = (urlsplit(url).hostname or "").lower()
+        for suffix, (rate, burst) in self.limits.items():
+            if host == suffix or host.endswith("." + suffix):
+                with self._lock:
+                    if suffix not in self.buckets:
+                        self.buckets[suffix] = AdaptiveTokenBucket(suffix, rate, burst)
+                    return self.buckets[suffix]
+        return None
+
+    def acquire(self, url):
+        """Blocks until a request to `url` may be sent."""
+        bucket = self.bucket_for(url)
+        if bucket:
+            bucket.acquire()
+            self.export()
+
+    async def aacquire(self, url):
+        bucket = self.bucket_for(url)
+        if bucket:
+            await bucket.aacquire()
+            self.export()
+
+    def record(self, url, status=None, blocked=False):
+        """Feeds a response (or a CAPTCHA page) back into the host's rate."""
+        bucket = self.bucket_for(url)
+        if bucket:
+            bucket.on_response(status, blocked)
+            self.export(force=blocked or status in THROTTLE_STATUSES)
+
+    def snapshot(self):
+        with self._lock:
+            return {name: bucket.snapshot() for name, bucket in self.buckets.items()}
+
+    def export(self, force=False):
+        export_metrics("rate_limits", self.snapshot(), min_interval=0 if force else 5)
+
+# Shared by every component in the process so one host has one bucket
+rate_limiter = RateLimiter()
@@ -0,0 +1,127 @@
+import os
+import shutil
+from logger_config import logger
+from video_processor import VideoProcessor
+from job_queue import QUEUED, RUNNING, SUCCEEDED, PermanentJobError
+from artifact_store import RemoteArtifactClient
+
+RENDER_KIND = "render"
+# "inline" renders in the calling process (dashboards run queued jobs on an in-process worker);
+# "queue" hands renders to worker.py processes, which must then be running
+RENDER_MODE = os.getenv("RENDER_MODE", "inline").lower()
+RENDER_TIMEOUT = float(os.getenv("RENDER_JOB_TIMEOUT", 900))
+# A job still queued after this long while no job runs anywhere means no worker is alive
+RENDER_PICKUP_TIMEOUT = float(os.getenv("RENDER_PICKUP_TIMEOUT", 60))
+WORKER_DIR = os.path.join("temp", "worker")
+
+def stored_input(store, path, kind):
+    """Puts an input into the artifact store and describes it for a job payload."""
+    return {"sha256": store.put(path, kind, store.sha_for(path)), "ext": os.path.splitext(path)[1].lower()}
+
+def enqueue_render(queue, store, image_paths, audio_path, bg_music_path=None, description="", priority=0, meta=None):
+    """
+    Queues a slideshow render. Inputs travel as artifact-store hashes, so the job does not
+    depend on the producer's workspace still existing when a worker picks it up.
+    `meta` is kept in the payload for the producer to read back when collecting; workers ignore it.
+    """
+    payload = {
+        "images": [stored_input(store, path, "image") for path in image_paths],
+        "audio": stored_input(store, audio_path, "audio"),
+        "music": stored_input(store, bg_music_path, "audio") if bg_music_path and os.path.exists(bg_music_path) else None,
+        "description": description,
+        "meta": meta or {},
+    }
+    return queue.enqueue(RENDER_KIND, payload, priority=priority)
+
+def collect_render(queue, store, job, output_path):
+    """Links a finished render into output_path; raises if the job failed or timed out."""
+    if not job:
+        raise RuntimeError("Render job not found")
+    if job["state"] != SUCCEEDED:
+        if queue.cancel(job["id"], "timed out waiting for a worker"):
+            raise TimeoutError("No render worker picked up the job (is worker.py running?)")
+        raise RuntimeError(job.get("error") or f"Render job {job['id']} is still {job['state']}")
+    if not store.materialize(job["result"]["video"], output_path):
+        raise FileNotFoundError(f"Render {job['id']} finished but its video is missing from the artifact store")
+    return True
+
+def _no_worker(queue, job):
+    return bool(job) and job["state"] == QUEUED and not queue.stats().get(RUNNING)
+
+def wait_render(queue, job_id):
+    """
+    Waits for a render job; gives up after RENDER_PICKUP_TIMEOUT instead of RENDER_JOB_TIMEOUT
+    when no worker is alive (collect_render then cancels the job).
+    """
+    job = queue.wait(job_id, RENDER_PICKUP_TIMEOUT)
+    if not job or job["state"] not in (QUEUED, RUNNING) or _no_worker(queue, job):
+        return job
+    return queue.wait(job_id, max(RENDER_TIMEOUT - RENDER_PICKUP_TIMEOUT, 1))
+
+async def await_render(queue, job_id, executor):
+    """Async wait_render() for the bot's event loop."""
+    job = await queue.await_job(job_id, RENDER_PICKUP_TIMEOUT)
+    if not job or job["state"] not in (QUEUED, RUNNING) or await executor.run_io(_no_worker, queue, job):
+        return job
+    return await queue.await_job(job_id, max(RENDER_TIMEOUT - RENDER_PICKUP_TIMEOUT, 1))
+
+def render_video(queue, store, image_paths, audio_path, output_path, bg_music_path=None, description="", priority=0):
+    """Drop-in for VideoProcessor.create_video_from_images_and_audio that renders on a worker."""
+    if RENDER_MODE != "queue":
+        return VideoProcessor.create_video_from_images_and_audio(
+            image_paths, audio_path, output_path, bg_music_path=bg_music_path, description=description)
+    job_id = enqueue_render(queue, store, image_paths, audio_path, bg_music_path, description, priority)
+    return collect_render(queue, store, wait_render(queue, job_id), output_path)
+
+async def arender_video(queue, store, executor, image_paths, audio_path, output_path, bg_music_path=None, description="", priority=0):
+    """Async render_video(); inline mode runs the render on the given JobExecutor."""
+    if RENDER_MODE != "queue":
+        return await executor.run(VideoProcessor.create_video_from_images_and_audio,
+                                  image_paths, audio_path, output_path, bg_music_path=bg_music_path, description=description)
+    job_id = await executor.run_io(enqueue_render, queue, store, image_paths, audio_path, bg_music_path, description, priority)
+    job = await await_render(queue, job_id, executor)
+    return await executor.run_io(collect_render, queue, store, job, output_path)
+
+def input_fetcher(store, remote, workdir):
+    """Returns fetch(item, name, kind): links a payload input into workdir, pulling it from the shared store if needed."""
+    def fetch(item, name, kind):
+        if remote and not remote.ensure(item["sha256"], kind, item["ext"]):
+            raise FileNotFoundError(f"Input {item['sha256'][:12]} could not be fetched from the shared store")
+        path = store.materialize(item["sha256"], os.path.join(workdir, name + item["ext"]))
+        if not path:
+            raise PermanentJobError(f"Input {item['sha256'][:12]} is missing from the artifact store")
+        return path
+    return fetch
+
+def run_render_job(job, store, report):
+    """
+    Worker side: materializes the inputs, renders and stores the video. Returns the job result.
+    On a secondary node (ARTIFACT_REMOTE_URL set) inputs are fetched from and the video is
+    pushed to the primary node's store, where the producer picks it up.
+    """
+    payload = job["payload"]
+    remote = RemoteArtifactClient.from_env(store)
+    workdir = os.path.join(WORKER_DIR, job["id"])
+    os.makedirs(workdir, exist_ok=True)
+    try:
+        fetch = input_fetcher(store, remote, workdir)
+        report("preparing", 5)
+        images = [fetch(item, f"image_{i}", "image") for i, item in enumerate(payload["images"])]
+        audio_path = fetch(payload["audio"], "voice", "audio")
+        music_path = fetch(payload["music"], "music", "audio") if payload.get("music") else None
+
+        report("rendering", 10)
+        output_path = os.path.join(workdir, "video.mp4")
+        VideoProcessor.create_video_from_images_and_audio(
+            images, audio_path, output_path, bg_music_path=music_path, description=payload.get("description", ""),
+            on_progress=lambda fraction: report("rendering", 10 + 85 * fraction))
+
+        report("storing", 95)
+        size = os.path.getsize(output_path)
+        sha256 = store.put(output_path, "video", link=True)
+        if remote:
+            remote.push(sha256, "video")
+        logger.info(f"Render job {job['id']} produced {sha256[:12]} ({size} bytes)")
+        return {"video": sha256, "size": size}
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
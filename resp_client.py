@@ -0,0 +1,94 @@
+import os
+import socket
+import threading
+from urllib.parse import urlsplit, unquote
+
+class RespError(Exception):
+    """Error reply (-ERR ...) from the server."""
+
+class RespClient:
+    """
+    Minimal Redis protocol (RESP2) client: one connection shared under a lock, reconnecting
+    once on a broken socket. A forked child (preloaded serving workers) opens its own
+    connection instead of talking over the parent's. Enough for the job queue without adding a dependency.
+    URL format: redis://[:password@]host[:port][/db]
+    """
+    def __init__(self, url="redis://localhost:6379/0", timeout=10):
+        parts = urlsplit(url)
+        self.host = parts.hostname or "localhost"
+        self.port = parts.port or 6379
+        self.password = unquote(parts.password) if parts.password else None
+        self.db = int(parts.path.lstrip("/") or 0)
+        self.timeout = timeout
+        self._sock = None
+        self._reader = None
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def _connect(self):
+        self._pid = os.getpid()
+        self._sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._reader = self._sock.makefile("rb")
+        if self.password:
+            self._call("AUTH", self.password)
+        if self.db:
+            self._call("SELECT", self.db)
+
+    def close(self):
+        with self._lock:
+            if self._sock:
+                try: self._sock.close()
+                except OSError: pass
+            self._sock = self._reader = None
+
+    @staticmethod
+    def _encode(args):
+        out = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode("utf-8")
+            out.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        return b"".join(out)
+
+    def _read(self):
+        line = self._reader.readline()
+        if not line:
+            raise ConnectionError("Connection closed by server")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b"+":
+            return rest.decode("utf-8")
+        if kind == b"-":
+            raise RespError(rest.decode("utf-8"))
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            length = int(rest)
+            if length < 0:
+                return None
+            return self._reader.read(length + 2)[:-2].decode("utf-8")
+        if kind == b"*":
+            length = int(rest)
+            return None if length < 0 else [self._read() for _ in range(length)]
+        raise ConnectionError(f"Unexpected reply: {line[:40]!r}")
+
+    def _call(self, *args):
+        self._sock.sendall(self._encode(args))
+        return self._read()
+
+    def execute(self, *args):
+        """Sends one command and returns the decoded reply (str, int, None or list)."""
+        with self._lock:
+            if self._pid != os.getpid():
+                self._sock = self._reader = None
+            for attempt in range(2):
+                try:
+                    if not self._sock:
+                        self._connect()
+                    return self._call(*args)
+                except (OSError, ConnectionError):
+                    if self._sock:
+                        try: self._sock.close()
+                        except OSError: pass
+                    self._sock = self._reader = None
+                    if attempt:
+                        raise
@@ -0,0 +1,105 @@
+import os
+import json
+import time
+import sqlite3
+import contextlib
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+from logger_config import logger
+
+CACHE_DIR = os.path.join("temp", "cache")
+
+# Hosts that only redirect to the real product page
+SHORT_LINK_HOSTS = ("vt.tiktok.com", "vm.tiktok.com")
+
+# Query parameters that only track who shared a link and how; anything else (variant, sku, item id) is kept
+TRACKING_PARAM_PREFIXES = ("utm_", "share_")
+TRACKING_PARAMS = {
+    "sharer_language", "social_share_type", "u_code", "tt_from", "enter_from", "enter_method",
+    "source", "source_type", "sec_uid", "sec_user_id", "timestamp", "checksum", "_r", "_svg",
+    "refer", "referer", "referrer", "fbclid", "gclid", "is_from_webapp", "sender_device", "web_id",
+}
+
+def _is_tracking_param(name):
+    name = name.lower()
+    return name in TRACKING_PARAMS or name.startswith(TRACKING_PARAM_PREFIXES)
+
+def canonicalize_url(url):
+    """
+    Canonical product URL: lowercase host, no fragment or trailing slash, tracking parameters
+    dropped and the remaining query parameters sorted.
+    """
+    parts = urlsplit(url.strip())
+    path = parts.path.rstrip("/") or "/"
+    query = urlencode(sorted((name, value) for name, value in parse_qsl(parts.query, keep_blank_values=True)
+                             if not _is_tracking_param(name)))
+    return urlunsplit((parts.scheme.lower() or "https", parts.netloc.lower(), path, query, ""))
+
+def is_short_link(url):
+    return (urlsplit(url).hostname or "").lower() in SHORT_LINK_HOSTS
+
+class ScrapeCache:
+    """
+    Two-level persistent cache for the scraper, stored in SQLite so it survives restarts and is
+    shared by the bot and dashboard processes:
+      1. short link -> canonical product URL (long TTL, redirects rarely change)
+      2. canonical URL -> parsed product record (short TTL, listings do change)
+    """
+    def __init__(self, db_path=None, url_ttl=None, product_ttl=None):
+        self.db_path = db_path or os.path.join(CACHE_DIR, "scraper.sqlite")
+        self.url_ttl = float(url_ttl or os.getenv("SCRAPE_URL_TTL", 7 * 24 * 3600))
+        self.product_ttl = float(product_ttl or os.getenv("SCRAPE_PRODUCT_TTL", 3600))
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        with self._connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("CREATE TABLE IF NOT EXISTS resolved_urls (url TEXT PRIMARY KEY, canonical TEXT, expires REAL)")
+            db.execute("CREATE TABLE IF NOT EXISTS products (canonical TEXT PRIMARY KEY, record TEXT, expires REAL)")
+
+    @contextlib.contextmanager
+    def _connect(self):
+        """One transaction on a fresh connection that is closed afterwards (sqlite3's own `with` only commits)."""
+        with contextlib.closing(sqlite3.connect(self.db_path, timeout=30)) as db, db:
+            yield db
+
+    def resolve(self, url):
+        """Returns the canonical product URL for a link, or None if a short link is not cached yet."""
+        if not is_short_link(url):
+            return canonicalize_url(url)
+        with self._connect() as db:
+            row = db.execute("SELECT canonical FROM resolved_urls WHERE url=? AND expires>?", (url.strip(), time.time())).fetchone()
+        return row[0] if row else None
+
+    def put_resolved(self, url, final_url):
+        """Remembers where a short link redirects; returns the canonical URL."""
+        canonical = canonicalize_url(final_url)
+        if is_short_link(url):
+            with self._connect() as db:
+                db.execute("INSERT OR REPLACE INTO resolved_urls VALUES (?, ?, ?)", (url.strip(), canonical, time.time() + self.url_ttl))
+        return canonical
+
+    def get_product(self, canonical):
+        """Returns the cached product record (a scrape result dict) or None."""
+        if not canonical:
+            return None
+        with self._connect() as db:
+            row = db.execute("SELECT record FROM products WHERE canonical=? AND expires>?", (canonical, time.time())).fetchone()
+        if not row:
+            return None
+        record = json.loads(row[0])
+        record["cached"] = True
+        return record
+
+    def put_product(self, canonical, record):
+        """Caches a successful scrape result for its canonical URL."""
+        if not record.get("success") or record.get("is_direct"):
+            return
+        with self._connect() as db:
+            db.execute("INSERT OR REPLACE INTO products VALUES (?, ?, ?)", (canonical, json.dumps(record), time.time() + self.product_ttl))
+
+    def purge_expired(self):
+        now = time.time()
+        with self._connect() as db:
+            removed = db.execute("DELETE FROM resolved_urls WHERE expires<=?", (now,)).rowcount
+            removed += db.execute("DELETE FROM products WHERE expires<=?", (now,)).rowcount
+        if removed:
+            logger.info(f"Scrape cache: purged {removed} expired entries")
+        return removed
@@ -2,7 +2,94 @@ import requests
 import re
 import os
 import uuid
+import asyncio
+import threading
+import aiohttp
+from urllib.parse import urlparse
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
 from logger_config import logger
+from downloader import download_to_file, adownload_to_file, extension_for
+from metrics import export_metrics
+from scrape_cache import ScrapeCache
+from page_extractor import extract_product
+from image_dedupe import canonicalize_image_urls, dedupe_images
+from rate_limiter import rate_limiter
+from artifact_store import ArtifactStore
+
+IMAGE_EXTENSIONS = ['.jpg', '.jpeg', '.png', '.webp', '.avif']
+
+# Keep-alive connections kept per host: image CDNs get many (a page lists up to 6 images),
+# tiktok.com itself only serves one page per link
+HOST_POOL_SIZES = {
+    "byteimg.com": 10,
+    "tiktokcdn.com": 10,
+    "tiktokcdn-us.com": 10,
+    "tiktok.com": 4,
+}
+DEFAULT_POOL_SIZE = 4
+
+def pool_size_for(host):
+    host = (host or "").lower()
+    for suffix, size in HOST_POOL_SIZES.items():
+        if host == suffix or host.endswith("." + suffix):
+            return size
+    return DEFAULT_POOL_SIZE
+
+class ConnectionStats:
+    """Counts requests vs. newly opened connections for the sync and async scraper sessions."""
+    def __init__(self):
+        self.requests = 0
+        self.new_connections = 0
+        self._lock = threading.Lock()
+
+    def record(self, new_connection=False, request=False):
+        with self._lock:
+            self.requests += int(request)
+            self.new_connections += int(new_connection)
+        export_metrics("scraper_http", self.snapshot())
+
+    def snapshot(self):
+        reused = max(self.requests - self.new_connections, 0)
+        return {
+            "requests": self.requests,
+            "new_connections": self.new_connections,
+            "reuse_rate": round(reused / self.requests, 3) if self.requests else 0.0,
+        }
+
+connection_stats = ConnectionStats()
+
+class _CountingHTTPConnectionPool(HTTPConnectionPool):
+    def _new_conn(self):
+        connection_stats.record(new_connection=True)
+        return super()._new_conn()
+
+class _CountingHTTPSConnectionPool(HTTPSConnectionPool):
+    def _new_conn(self):
+        connection_stats.record(new_connection=True)
+        return super()._new_conn()
+
+class PooledAdapter(HTTPAdapter):
+    """HTTPAdapter with per-host pool sizes, rate limiting and connection counting."""
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _CountingHTTPConnectionPool,
+            "https": _CountingHTTPSConnectionPool,
+        }
+
+    def build_connection_pool_key_attributes(self, request, verify, cert=None):
+        host_params, pool_kwargs = super().build_connection_pool_key_attributes(request, verify, cert)
+        pool_kwargs["maxsize"] = pool_size_for(host_params.get("host"))
+        return host_params, pool_kwargs
+
+    def send(self, request, *args, **kwargs):
+        # Every hop (redirects included) waits for its host's rate limit
+        rate_limiter.acquire(request.url)
+        connection_stats.record(request=True)
+        response = super().send(request, *args, **kwargs)
+        rate_limiter.record(request.url, response.status_code)
+        return response
 
 class TikTokShopScraper:
     def __init__(self, temp_dir="temp"):
@@ -11,7 +98,24 @@ class TikTokShopScraper:
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
             "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8",
             "Accept-Language": "en-US,en;q=0.9,id;q=0.8",
+            "Accept-Encoding": requests.utils.DEFAULT_ACCEPT_ENCODING,
         }
+        # Long-lived keep-alive session shared by every page and image request
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        adapter = PooledAdapter(pool_connections=20, pool_maxsize=DEFAULT_POOL_SIZE)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        # Event loop -> (aiohttp session, lifetime guard); see get_async_session
+        self._aio_sessions = {}
+        self._aio_lock = threading.Lock()
+        # Short link -> canonical URL -> parsed product, shared with the other processes
+        self.cache = ScrapeCache()
+        self.cache.purge_expired()
+        # Downloaded images are content-addressed so repeats share one file on disk
+        self.store = ArtifactStore()
+        # Max concurrent requests per host for the async bulk API
+        self.per_host_limit = int(os.getenv("SCRAPER_PER_HOST_LIMIT", "4"))
 
     def extract_urls(self, text):
         """Extracts TikTok Shop urls and direct image urls from text."""
@@ -23,105 +127,239 @@ class TikTokShopScraper:
         urls = re.findall(tiktok_pattern, text) + re.findall(image_pattern, text)
         return list(dict.fromkeys(urls)) # De-duplicate while preserving order
 
-    def scrape_product(self, url):
-        """
-        Scrapes a TikTok Shop product URL for images OR handles direct image URLs.
-        """
-        # 1. Check if the URL is already a direct image
-        is_direct_image = any(ext in url.lower() for ext in ['.jpg', '.jpeg', '.png', '.webp', '.avif'])
-        if is_direct_image:
-            logger.info(f"Direct image URL detected: {url}")
+    def _direct_image_result(self, url):
+        """Result for a URL that already points at an image (no page to scrape)."""
+        if any(ext in url.lower() for ext in IMAGE_EXTENSIONS):
             return {
                 "success": True,
                 "product_name": "Image Link",
                 "image_urls": [url],
                 "is_direct": True
             }
+        return None
+
+    def _parse_product_page(self, final_url, status_code, html_content):
+        """Turns a fetched product page into the scrape result dict (shared by sync and async paths)."""
+        logger.info(f"Resolved URL: {final_url} (Status: {status_code})")
+
+        # If the resolved URL is an image (some redirect to images)
+        direct = self._direct_image_result(final_url)
+        if direct:
+            return direct
+
+        record = extract_product(html_content)
+
+        # Check for CAPTCHA or blocking
+        if status_code == 403 or record["blocked"]:
+            if status_code != 403:
+                # A 200 CAPTCHA page is a throttle signal too (403s are seen by the HTTP layer)
+                rate_limiter.record(final_url, blocked=True)
+            logger.warning(f"TikTok Shop scraping blocked by CAPTCHA/Security: {final_url}")
+            return {
+                "success": False, 
+                "error": "Tiktok memblokir akses otomatis (CAPTCHA). Silakan coba lagi nanti atau upload foto manual.",
+                "is_captcha": True
+            }
+
+        product_name = record["title"] or "Produk TikTok Shop"
+        # One URL per stored photo, at the resolution closest to what the renderer uses
+        image_urls = canonicalize_image_urls(record["image_urls"])
+        logger.info(f"Found {len(image_urls)} potential images for product: {product_name} (via {record['source']})")
+        
+        return {
+            "success": True,
+            "product_name": product_name,
+            "image_urls": image_urls[:6],
+            "price": record["price"],
+            "shop": record["shop"],
+        }
+
+    def _cached_product(self, url):
+        """Returns a cached scrape result for the link without touching the network, or None."""
+        record = self.cache.get_product(self.cache.resolve(url))
+        if record:
+            logger.info(f"Scrape cache hit: {url} ({record['product_name']})")
+        return record
+
+    def _store_product(self, url, final_url, result):
+        """Records the redirect target and caches the parsed product."""
+        canonical = self.cache.put_resolved(url, final_url)
+        self.cache.put_product(canonical, result)
+        return result
+
+    def scrape_product(self, url):
+        """
+        Scrapes a TikTok Shop product URL for images OR handles direct image URLs.
+        """
+        # 1. Check if the URL is already a direct image
+        direct = self._direct_image_result(url)
+        if direct:
+            logger.info(f"Direct image URL detected: {url}")
+            return direct
+
+        cached = self._cached_product(url)
+        if cached:
+            return cached
 
         logger.info(f"Attempting to scrape TikTok Shop URL: {url}")
         
         try:
             # Handle redirects (especially for short URLs like vt.tiktok.com)
-            response = requests.get(url, headers=self.headers, allow_redirects=True, timeout=15)
-            final_url = response.url
-            html_content = response.text
-            
-            logger.info(f"Resolved URL: {final_url} (Status: {response.status_code})")
-
-            # Check for CAPTCHA or blocking
-            if response.status_code == 403 or "captcha" in html_content.lower() or "verify" in html_content.lower() and "challenge" in html_content.lower():
-                logger.warning(f"TikTok Shop scraping blocked by CAPTCHA/Security: {final_url}")
-                return {
-                    "success": False, 
-                    "error": "Tiktok memblokir akses otomatis (CAPTCHA). Silakan coba lagi nanti atau upload foto manual.",
-                    "is_captcha": True
-                }
-
-            # If the resolved URL is an image (some redirect to images)
-            if any(ext in final_url.lower() for ext in ['.jpg', '.jpeg', '.png', '.webp', '.avif']):
-                 return {
-                    "success": True,
-                    "product_name": "Image Link",
-                    "image_urls": [final_url],
-                    "is_direct": True
-                }
-
-            # 1. Try to find the title/product name
-            # Pattern for TikTok Shop product name in metadata/JSON
-            title_match = re.search(r'"title":"(.*?)"', html_content)
-            product_name = title_match.group(1) if title_match else "Produk TikTok Shop"
-            
-            # 2. Try to find image URLs
-            image_urls = []
-            
-            # Common pattern for gallery images 
-            found_images = re.findall(r'https://[a-zA-Z0-9.-]+\.(?:byteimg|tiktokcdn)\.com/[a-zA-Z0-9/_.-]+~plv-photomode-video:1080:1080\.jpeg', html_content)
-            
-            if not found_images:
-                found_images = re.findall(r'https://[a-zA-Z0-9.-]+\.(?:byteimg|tiktokcdn)\.com/[a-zA-Z0-9/_.-]+\.(?:webp|jpg|jpeg)', html_content)
-
-            # De-duplicate and filter
-            seen = set()
-            for img_url in found_images:
-                clean_url = img_url.replace('\\u002F', '/')
-                if clean_url not in seen and ('obj' in clean_url or 'photomode' in clean_url):
-                    image_urls.append(clean_url)
-                    seen.add(clean_url)
-            
-            if not image_urls:
-                image_urls = list(set(found_images))[:5]
-            
-            logger.info(f"Found {len(image_urls)} potential images for product: {product_name}")
-            
-            return {
-                "success": True,
-                "product_name": product_name,
-                "image_urls": image_urls[:6]
-            }
+            response = self.session.get(url, allow_redirects=True, timeout=15)
+            result = self._parse_product_page(response.url, response.status_code, response.text)
+            return self._store_product(url, response.url, result)
 
         except Exception as e:
             logger.error(f"Scraping Error: {e}")
             return {"success": False, "error": str(e), "is_captcha": False}
 
+    async def get_async_session(self):
+        """
+        Returns the keep-alive aiohttp session of the running event loop, creating it on first
+        use. Each loop (the bot's, or an asyncio.run in a Flask request) gets its own session,
+        closed when that loop shuts down: a guard async generator is started in the loop, and
+        loop.shutdown_asyncgens() (run by asyncio.run) finalizes it, closing the session.
+        """
+        loop = asyncio.get_running_loop()
+        with self._aio_lock:
+            # Entries of finished loops (their sessions are already closed) are dropped here
+            for old_loop in [l for l in self._aio_sessions if l.is_closed()]:
+                del self._aio_sessions[old_loop]
+            entry = self._aio_sessions.get(loop)
+        if entry and not entry[0].closed:
+            return entry[0]
+
+        async def on_create(session, ctx, params):
+            connection_stats.record(new_connection=True, request=True)
+
+        async def on_reuse(session, ctx, params):
+            connection_stats.record(request=True)
+
+        trace = aiohttp.TraceConfig()
+        trace.on_connection_create_end.append(on_create)
+        trace.on_connection_reuseconn.append(on_reuse)
+        connector = aiohttp.TCPConnector(limit=50, limit_per_host=self.per_host_limit, keepalive_timeout=60)
+        session = aiohttp.ClientSession(headers=self.headers, connector=connector, trace_configs=[trace])
+        guard = self._session_guard(session)
+        await guard.__anext__()
+        with self._aio_lock:
+            self._aio_sessions[loop] = (session, guard)
+        return session
+
+    @staticmethod
+    async def _session_guard(session):
+        try:
+            yield
+        finally:
+            await session.close()
+
+    async def close_async_session(self):
+        """Closes the running loop's session now (instead of at loop shutdown)."""
+        with self._aio_lock:
+            entry = self._aio_sessions.pop(asyncio.get_running_loop(), None)
+        if entry:
+            await entry[1].aclose()
+
+    async def scrape_products_async(self, urls, chat_id, image_limit=6, output_dir=None, on_progress=None, keep_session=True):
+        """
+        Scrapes all links concurrently and downloads their images in parallel, with at most
+        SCRAPER_PER_HOST_LIMIT requests in flight per host. Returns one result per URL in the
+        original order; successful results gain "image_paths". `on_progress(done, total, url, result)`
+        is awaited as each link completes.
+        """
+        output_dir = output_dir or self.temp_dir
+        host_limits = {}
+        done = 0
+
+        def host_slot(url):
+            host = urlparse(url).hostname or ""
+            if host not in host_limits:
+                host_limits[host] = asyncio.Semaphore(self.per_host_limit)
+            return host_limits[host]
+
+        async def fetch_page(session, url):
+            direct = self._direct_image_result(url)
+            if direct:
+                logger.info(f"Direct image URL detected: {url}")
+                return direct
+            # The scrape cache and artifact store are SQLite (and hashing/linking): keep them off the shared loop
+            cached = await asyncio.to_thread(self._cached_product, url)
+            if cached:
+                return cached
+            logger.info(f"Attempting to scrape TikTok Shop URL: {url}")
+            try:
+                async with host_slot(url):
+                    await rate_limiter.aacquire(url)
+                    async with session.get(url, allow_redirects=True, timeout=aiohttp.ClientTimeout(total=15)) as resp:
+                        rate_limiter.record(str(resp.url), resp.status)
+                        html_content = await resp.text(errors="replace")
+                        final_url = str(resp.url)
+                        result = self._parse_product_page(final_url, resp.status, html_content)
+                return await asyncio.to_thread(self._store_product, url, final_url, result)
+            except Exception as e:
+                logger.error(f"Scraping Error: {e}")
+                return {"success": False, "error": str(e), "is_captcha": False}
+
+        async def download(session, link_idx, i, img_url):
+            filename = f"scrape_{chat_id}_{link_idx}_{i}_{uuid.uuid4().hex[:6]}"
+            async with host_slot(img_url):
+                await rate_limiter.aacquire(img_url)
+                result = await adownload_to_file(session, img_url, os.path.join(output_dir, filename), timeout=10)
+                rate_limiter.record(img_url, result["status"])
+            if not result["success"]:
+                return None
+            ext = extension_for(result["content_type"], ".webp" if ".webp" in img_url else ".jpg")
+            path = os.path.join(output_dir, filename + ext)
+            os.replace(result["path"], path)
+            await asyncio.to_thread(self.store.adopt, path, "image", sha256=result["sha256"])
+            logger.info(f"Downloaded: {filename + ext}")
+            return path
+
+        async def process(session, link_idx, url):
+            nonlocal done
+            result = await fetch_page(session, url)
+            if result["success"] and result.get("image_urls"):
+                paths = await asyncio.gather(*(download(session, link_idx, i, img_url)
+                                               for i, img_url in enumerate(result["image_urls"][:image_limit])))
+                result["image_paths"] = await asyncio.to_thread(dedupe_images, [p for p in paths if p])
+            done += 1
+            if on_progress:
+                try:
+                    await on_progress(done, len(urls), url, result)
+                except Exception as e:
+                    logger.error(f"Scrape progress callback failed: {e}")
+            return result
+
+        session = await self.get_async_session()
+        try:
+            return await asyncio.gather(*(process(session, i, url) for i, url in enumerate(urls)))
+        finally:
+            # Callers that own a short-lived loop (asyncio.run) must close the session with it
+            if not keep_session:
+                await self.close_async_session()
+
+    def download_image(self, url, path):
+        """Streams a single image to `path`. Returns True on success."""
+        result = download_to_file(url, path, session=self.session, timeout=10)
+        if result["success"]:
+            self.store.adopt(path, "image", sha256=result["sha256"])
+            logger.info(f"Downloaded: {os.path.basename(path)} ({result['size']} bytes)")
+        return result["success"]
+
     def download_images(self, urls, chat_id):
         """Downloads images to the temporary directory."""
         downloaded_paths = []
         for i, url in enumerate(urls):
-            try:
-                # Add headers to avoid 403
-                resp = requests.get(url, headers=self.headers, timeout=10)
-                if resp.status_code == 200:
-                    ext = ".jpg" # Default to jpg
-                    if ".webp" in url: ext = ".webp"
-                    
-                    filename = f"scrape_{chat_id}_{i}_{uuid.uuid4().hex[:6]}{ext}"
-                    path = os.path.join(self.temp_dir, filename)
-                    
-                    with open(path, "wb") as f:
-                        f.write(resp.content)
-                    downloaded_paths.append(path)
-                    logger.info(f"Downloaded: {filename}")
-            except Exception as e:
-                logger.error(f"Download failed for {url}: {e}")
+            # Add headers to avoid 403
+            filename = f"scrape_{chat_id}_{i}_{uuid.uuid4().hex[:6]}"
+            result = download_to_file(url, os.path.join(self.temp_dir, filename), session=self.session, timeout=10)
+            if result["success"]:
+                # Name the file after what the CDN actually served
+                ext = extension_for(result["content_type"], ".webp" if ".webp" in url else ".jpg")
+                path = os.path.join(self.temp_dir, filename + ext)
+                os.replace(result["path"], path)
+                self.store.adopt(path, "image", sha256=result["sha256"])
+                downloaded_paths.append(path)
+                logger.info(f"Downloaded: {filename + ext}")
         
-        return downloaded_paths
+        return dedupe_images(downloaded_paths)
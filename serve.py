@@ -0,0 +1,94 @@
+# Production entry point for the dashboards: python serve.py [dashboard_pro|dashboard|music_dashboard]
+# Runs the Flask app under gunicorn with WEB_WORKERS processes x WEB_THREADS threads. The app is
+# imported once in the master (preload) and forked, so the handlers are built once and shared
+# copy-on-write. Everything a request needs lives outside the process (job queue, artifact store,
+# image cache, gallery folders, signed session cookies), so any process can answer for any job.
+# Without gunicorn (e.g. on Windows) it falls back to one threaded process.
+import os
+import sys
+import importlib
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from logger_config import logger
+from metrics import set_process_role, clear_metrics
+
+# App module -> default port (same as its `python <app>.py` development server)
+APPS = {"dashboard_pro": 5000, "dashboard": 5000, "music_dashboard": 5001}
+LOCK_DIR = os.path.join("temp", "cache")
+
+_held_locks = []
+
+def hold_node_lock(name):
+    """
+    Takes temp/cache/<name>.lock without blocking and keeps it for the life of the process.
+    True in exactly one process per node; the lock goes free when that process exits, so the
+    replacement gunicorn forks takes it over. Always True where fcntl is unavailable.
+    """
+    try:
+        import fcntl
+    except ImportError:
+        return True
+    os.makedirs(LOCK_DIR, exist_ok=True)
+    handle = open(os.path.join(LOCK_DIR, f"{name}.lock"), "w")
+    try:
+        fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        handle.close()
+        return False
+    _held_locks.append(handle)
+    return True
+
+def gunicorn_options(name):
+    return {
+        "bind": os.getenv("WEB_BIND", f"0.0.0.0:{APPS[name]}"),
+        "workers": int(os.getenv("WEB_WORKERS", 2)),
+        # Threads keep long-lived /jobs/<id>/events streams from blocking a whole process
+        "threads": int(os.getenv("WEB_THREADS", 8)),
+        "worker_class": "gthread",
+        "timeout": int(os.getenv("WEB_TIMEOUT", 120)),
+        "graceful_timeout": 30,
+        "preload_app": True,
+        "accesslog": "-" if os.getenv("WEB_ACCESS_LOG", "0") == "1" else None,
+    }
+
+def serve(name):
+    if name not in APPS:
+        raise SystemExit(f"Unknown app '{name}', expected one of: {', '.join(APPS)}")
+    # Per-process snapshots of the previous run would otherwise be summed with the new ones
+    clear_metrics(f"{name}@")
+    set_process_role(name)
+    module = importlib.import_module(name)
+    options = gunicorn_options(name)
+
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        logger.warning("gunicorn is not installed; serving with a single threaded process")
+        module.start_background_services()
+        host, port = options["bind"].rsplit(":", 1)
+        module.app.run(host=host, port=int(port), threaded=True)
+        return
+
+    def post_fork(server, worker):
+        set_process_role(f"{name}@{os.getpid()}")
+        # Threads do not survive fork: the warm pool and GC run in one serving process per node
+        if hold_node_lock(f"{name}-services"):
+            module.start_background_services()
+            logger.info(f"{name}: background services running in worker {os.getpid()}")
+
+    class DashboardApplication(BaseApplication):
+        def load_config(self):
+            for key, value in {**options, "post_fork": post_fork}.items():
+                if value is not None:
+                    self.cfg.set(key, value)
+
+        def load(self):
+            return module.app
+
+    logger.info(f"Serving {name} on {options['bind']} ({options['workers']} workers x {options['threads']} threads)")
+    DashboardApplication().run()
+
+if __name__ == "__main__":
+    serve(sys.argv[1] if len(sys.argv) > 1 else "dashboard_pro")
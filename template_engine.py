@@ -0,0 +1,93 @@
+import re
+import hashlib
+
+# Deterministic, offline script generator used when Groq misses its deadline.
+# Every script is HOOK + 2 BENEFITS + CTA (the same structure the LLM prompt asks for),
+# padded or trimmed to stay inside the 40-70 word rule.
+
+MIN_WORDS = 40
+MAX_WORDS = 70
+
+HOOKS = [
+    "Jujur, nyesel banget baru tau ada {name} sekeren ini!",
+    "Cowok cewek wajib punya {name} kalau nggak mau ribet lagi!",
+    "Liat deh, {name} ini beneran life changer banget buat sehari-hari!",
+    "Stop scroll! {name} ini lagi viral dan stoknya sisa dikit!",
+    "Kalian nggak akan percaya harga {name} sekeren ini!",
+]
+
+BENEFITS = [
+    "Kualitasnya juara, bahannya awet dan kerasa banget bedanya pas dipakai tiap hari.",
+    "Desainnya simpel tapi elegan, jadi cocok dipakai di rumah, kantor, atau pas jalan-jalan.",
+    "Praktis banget, tinggal pakai langsung beres tanpa ribet dan bikin hidup lebih gampang.",
+    "Udah banyak yang buktiin sendiri, reviewnya bagus-bagus dan bikin nagih.",
+    "Harganya ramah di kantong tapi hasilnya berasa kayak barang premium.",
+    "Ukurannya pas, gampang dibawa ke mana aja dan nggak makan tempat.",
+]
+
+PRICE_LINES = [
+    "Harganya cuma {price} aja, worth it banget!",
+    "Cuma {price}, murah banget buat kualitas segini!",
+]
+
+SHOP_LINES = [
+    "Langsung dari {shop} yang udah terpercaya.",
+    "Dijual resmi sama {shop}, jadi dijamin aman.",
+]
+
+CTAS = [
+    "Buruan klik keranjang kuning sekarang sebelum kehabisan ya!",
+    "Langsung aja klik keranjang kuning di bawah, stoknya terbatas banget!",
+    "Yuk checkout sekarang lewat keranjang kuning sebelum harganya naik!",
+]
+
+FILLERS = [
+    "Serius, ini salah satu barang paling berguna yang pernah gue beli.",
+    "Kalian bakal nyesel kalau sampai kelewatan promo yang satu ini.",
+    "Cocok juga buat jadi kado buat orang tersayang.",
+]
+
+def _word_count(text):
+    return len(text.split())
+
+def _short_name(product_name, max_words=6):
+    """Keeps scraped titles speakable: first few words, no brackets or separators."""
+    name = re.sub(r'[\[\](){}|#*_]+', ' ', product_name or "").strip()
+    words = name.split()
+    return " ".join(words[:max_words]) if words else "produk ini"
+
+class TemplateDescriptionEngine:
+    """Builds a valid 40-70 word Indonesian affiliate script from templates in well under a millisecond."""
+    name = "template"
+
+    def generate(self, product_name, metadata=None):
+        metadata = metadata or {}
+        digest = hashlib.md5((product_name or "").casefold().encode("utf-8")).digest()
+        pick = lambda options, i: options[digest[i] % len(options)]
+
+        name = _short_name(metadata.get("product_name") or product_name)
+        first = digest[1] % len(BENEFITS)
+        second = (first + 1 + digest[2] % (len(BENEFITS) - 1)) % len(BENEFITS)
+
+        parts = [pick(HOOKS, 0).format(name=name), BENEFITS[first], BENEFITS[second]]
+        if metadata.get("price"):
+            parts.append(pick(PRICE_LINES, 3).format(price=metadata["price"]))
+        if metadata.get("shop"):
+            parts.append(pick(SHOP_LINES, 4).format(shop=metadata["shop"]))
+        cta = pick(CTAS, 5)
+
+        # Pad with fillers until the script reaches the minimum length
+        for filler in FILLERS[digest[6] % len(FILLERS):] + FILLERS:
+            if _word_count(" ".join(parts + [cta])) >= MIN_WORDS:
+                break
+            parts.append(filler)
+
+        # Drop optional lines (never the hook) until it fits the maximum length
+        while _word_count(" ".join(parts + [cta])) > MAX_WORDS and len(parts) > 1:
+            parts.pop()
+
+        text = " ".join(parts + [cta])
+        words = text.split()
+        if len(words) > MAX_WORDS:
+            text = " ".join(words[:MAX_WORDS - 1]).rstrip(",.!") + "!"
+        return text
@@ -0,0 +1,103 @@
+import os
+import pytest
+import artifact_store
+from artifact_store import ArtifactStore, file_sha256
+
+@pytest.fixture(autouse=True)
+def no_metrics(monkeypatch):
+    monkeypatch.setattr(artifact_store, "export_metrics", lambda *args, **kwargs: False)
+
+@pytest.fixture
+def store(tmp_path):
+    return ArtifactStore(root=str(tmp_path / "store"), grace=3600, max_bytes=10 ** 9)
+
+def write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+    return str(path)
+
+def refs(store):
+    with store._connect() as db:
+        return dict(db.execute("SELECT path, sha256 FROM refs").fetchall())
+
+def test_put_stores_once_without_a_ref(store, tmp_path):
+    a = write(tmp_path / "in" / "a.jpg", b"photo")
+    b = write(tmp_path / "in" / "b.jpg", b"photo")
+    sha = store.put(a)
+    assert store.put(b) == sha == file_sha256(a)
+    assert store.lookup(sha).endswith(sha + ".jpg")
+    assert store.stats()["objects"] == 1
+    assert refs(store) == {}
+
+def test_materialize_links_and_references(store, tmp_path):
+    sha = store.put(write(tmp_path / "in" / "a.jpg", b"photo"))
+    dest = str(tmp_path / "job" / "img_0.jpg")
+    assert store.materialize(sha, dest) == dest
+    with open(dest, "rb") as f:
+        assert f.read() == b"photo"
+    assert refs(store) == {os.path.abspath(dest): sha}
+    assert store.sha_for(dest) == sha
+    assert store.materialize("0" * 64, str(tmp_path / "job" / "missing.jpg")) is None
+
+def test_adopt_swaps_duplicate_for_stored_object(store, tmp_path):
+    first = write(tmp_path / "job1" / "v.mp4", b"video")
+    second = write(tmp_path / "job2" / "v.mp4", b"video")
+    sha = store.adopt(first, "video")
+    assert store.adopt(second, "video") == sha
+    assert os.path.samefile(second, store.lookup(sha))
+    stats = store.stats()
+    assert (stats["objects"], stats["refs"], stats["bytes_saved"]) == (1, 2, len(b"video"))
+
+def test_gc_keeps_referenced_and_fresh_objects(store, tmp_path):
+    sha = store.adopt(write(tmp_path / "job" / "a.mp3", b"audio"), "audio")
+    store.put(write(tmp_path / "in" / "b.jpg", b"fresh"))
+    assert store.gc() == 0
+    assert store.stats()["objects"] == 2
+    assert store.lookup(sha)
+
+def test_released_idle_objects_are_collected(store, tmp_path):
+    path = write(tmp_path / "job" / "a.mp3", b"audio")
+    sha = store.adopt(path, "audio")
+    store.release(path)
+    os.remove(path)
+    store.grace = 0
+    assert store.gc() == 1
+    assert store.lookup(sha) is None
+    assert store.stats() == {"objects": 0, "bytes": 0, "refs": 0, "bytes_saved": 0}
+
+def test_gc_prunes_refs_of_deleted_files(store, tmp_path):
+    keep = write(tmp_path / "job" / "keep.jpg", b"same")
+    gone = str(tmp_path / "job" / "gone.jpg")
+    sha = store.adopt(keep)
+    store.materialize(sha, gone)
+    os.remove(gone)
+    store.grace = 0
+    assert store.gc() == 0
+    assert refs(store) == {os.path.abspath(keep): sha}
+
+def test_over_budget_evicts_least_recently_used(store, tmp_path):
+    old = store.put(write(tmp_path / "in" / "old.jpg", b"x" * 10))
+    with store._connect() as db:
+        db.execute("UPDATE objects SET last_used = last_used - 60 WHERE sha256=?", (old,))
+    new = store.put(write(tmp_path / "in" / "new.jpg", b"y" * 10))
+    store.max_bytes = 15
+    assert store.gc() == 1
+    assert store.lookup(old) is None and store.lookup(new)
+
+def test_put_copies_sources_it_does_not_own(store, tmp_path):
+    upload = write(tmp_path / "temp" / "audio.mp3", b"first upload")
+    sha = store.put(upload, "audio")
+    job = store.materialize(sha, str(tmp_path / "job" / "voice.mp3"))
+    # A later upload with the same name rewrites the file in place
+    with open(upload, "wb") as f:
+        f.write(b"second")
+    with open(store.lookup(sha), "rb") as f:
+        assert f.read() == b"first upload"
+    with open(job, "rb") as f:
+        assert f.read() == b"first upload"
+
+def test_put_links_sources_that_are_handed_over(store, tmp_path):
+    output = write(tmp_path / "worker" / "video.mp4", b"render")
+    sha = store.put(output, "video", link=True)
+    assert os.path.samefile(output, store.lookup(sha))
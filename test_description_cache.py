@@ -0,0 +1,56 @@
+import pytest
+import description_cache
+from description_cache import DescriptionCache, normalize_product_name
+
+@pytest.fixture(autouse=True)
+def no_metrics(monkeypatch):
+    monkeypatch.setattr(description_cache, "export_metrics", lambda *args, **kwargs: False)
+
+def test_key_strips_decoration():
+    assert normalize_product_name("🔥 PROMO Sepatu Lari Pria!!! GRATIS ONGKIR 🔥") == "sepatu lari pria"
+    assert normalize_product_name("Sepatu_Lari   (Diskon) | COD") == "sepatu lari"
+    assert normalize_product_name(None) == ""
+
+def test_key_keeps_distinguishing_words():
+    assert normalize_product_name("Sepatu Original") != normalize_product_name("Sepatu")
+    assert normalize_product_name("iPhone 15 new") != normalize_product_name("iPhone 15")
+    assert normalize_product_name("Kaos 100% Cotton") == "kaos 100 cotton"
+    # Promo words only match whole words
+    assert normalize_product_name("Codet Kaos") == "codet kaos"
+
+def test_misses_until_variant_pool_is_full():
+    cache = DescriptionCache(max_variants=2)
+    cache.put("Sepatu Lari", "naskah satu")
+    assert cache.get("sepatu lari") is None
+    cache.put("SEPATU LARI 🔥", "naskah dua")
+    assert cache.get("Sepatu Lari") in ("naskah satu", "naskah dua")
+
+def test_hits_rotate_through_variants():
+    cache = DescriptionCache(max_variants=3)
+    for text in ("a", "b", "c"):
+        cache.put("Tas", text)
+    assert [cache.get("Tas") for _ in range(4)] == ["a", "b", "c", "a"]
+    assert cache.stats()["hits"] == 4
+
+def test_duplicate_text_is_not_a_new_variant():
+    cache = DescriptionCache(max_variants=2)
+    cache.put("Tas", "a")
+    cache.put("Tas", "a")
+    assert cache.get("Tas") is None
+
+def test_expired_variants_are_dropped(monkeypatch):
+    cache = DescriptionCache(ttl=10, max_variants=1)
+    cache.put("Tas", "a")
+    assert cache.get("Tas") == "a"
+    now = description_cache.time.time()
+    monkeypatch.setattr(description_cache.time, "time", lambda: now + 11)
+    assert cache.get("Tas") is None
+
+def test_least_recently_used_key_is_evicted():
+    cache = DescriptionCache(max_keys=2, max_variants=1)
+    cache.put("A", "a")
+    cache.put("B", "b")
+    cache.get("A")
+    cache.put("C", "c")
+    assert cache.get("B") is None
+    assert cache.get("A") == "a" and cache.get("C") == "c"
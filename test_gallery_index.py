@@ -0,0 +1,71 @@
+import os
+import pytest
+import gallery_index
+from gallery_index import GalleryIndex
+
+@pytest.fixture(autouse=True)
+def no_ffprobe(monkeypatch):
+    monkeypatch.setattr(gallery_index.VideoProcessor, "get_duration", staticmethod(lambda path: 1.0))
+
+@pytest.fixture
+def index(tmp_path):
+    return GalleryIndex(root=str(tmp_path / "web_uploads"), db_path=str(tmp_path / "gallery.sqlite"))
+
+def make_video(index, session, name, data=b"mp4"):
+    path = os.path.join(index.root, session, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+    return path
+
+def walk(index, sort, limit):
+    pages, cursor = [], None
+    while True:
+        videos, cursor = index.page(sort, cursor, limit)
+        pages.append([video["path"] for video in videos])
+        if not cursor:
+            return pages
+
+@pytest.mark.parametrize("sort", ["newest", "oldest"])
+def test_equal_timestamps_page_by_path_without_gaps(index, sort):
+    # A bulk job finishing in one tick indexes every video with the same time
+    for i in range(7):
+        index.add(make_video(index, f"s{i % 3}", f"v{i}.mp4"), created=1000.0)
+    index.add(make_video(index, "s9", "later.mp4"), created=2000.0)
+    pages = walk(index, sort, 3)
+    paths = [path for page in pages for path in page]
+    assert [len(page) for page in pages] == [3, 3, 2]
+    assert len(paths) == len(set(paths)) == 8
+    tied = sorted(path for path in paths if path != "s9/later.mp4")
+    if sort == "newest":
+        assert paths == ["s9/later.mp4"] + tied[::-1]
+    else:
+        assert paths == tied + ["s9/later.mp4"]
+
+def test_last_full_page_has_no_cursor(index):
+    for i in range(3):
+        index.add(make_video(index, "s", f"v{i}.mp4"), created=1000.0)
+    videos, cursor = index.page("newest", None, 3)
+    assert len(videos) == 3 and cursor is None
+
+def test_mangled_cursor_starts_over(index):
+    index.add(make_video(index, "s", "v.mp4"), created=1000.0)
+    assert index.page("newest", "not-a-cursor", 10) == index.page("newest", None, 10)
+
+def test_reindex_keeps_created(index):
+    path = make_video(index, "s", "v.mp4")
+    index.add(path, created=1000.0)
+    with open(path, "ab") as f:
+        f.write(b"more")
+    index.add(path, created=5000.0)
+    (video,), _ = index.page()
+    assert video["created"] == 1000.0 and video["size"] == 7
+
+def test_reconcile_adds_and_drops(index):
+    kept = make_video(index, "s", "kept.mp4")
+    index.add(kept)
+    index.add(make_video(index, "s", "gone.mp4"))
+    os.remove(os.path.join(index.root, "s", "gone.mp4"))
+    make_video(index, "t", "new.mp4")
+    assert index.reconcile() == {"added": 1, "removed": 1}
+    assert sorted(video["path"] for video in index.page("name")[0]) == ["s/kept.mp4", "t/new.mp4"]
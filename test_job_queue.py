@@ -0,0 +1,209 @@
+import os
+import time
+import shutil
+import tempfile
+import threading
+import socketserver
+from job_queue import SQLiteJobQueue, RedisJobQueue, QUEUED, RUNNING, SUCCEEDED, FAILED
+import job_queue
+
+class FakeRedisHandler(socketserver.StreamRequestHandler):
+    """Speaks just enough RESP for the job queue: hashes, sets and sorted sets in memory."""
+    def read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        args = []
+        for _ in range(int(line[1:-2])):
+            length = int(self.rfile.readline()[1:-2])
+            args.append(self.rfile.read(length + 2)[:-2].decode("utf-8"))
+        return args
+
+    def reply(self, value):
+        if value is None:
+            data = b"$-1\r\n"
+        elif isinstance(value, int):
+            data = b":%d\r\n" % int(value)
+        elif isinstance(value, list):
+            self.wfile.write(b"*%d\r\n" % len(value))
+            for item in value:
+                self.reply(item)
+            return
+        else:
+            raw = str(value).encode("utf-8")
+            data = b"$%d\r\n%s\r\n" % (len(raw), raw)
+        self.wfile.write(data)
+
+    def handle(self):
+        while True:
+            args = self.read_command()
+            if args is None:
+                return
+            with self.server.lock:
+                try:
+                    self.reply(self.server.run(args[0].upper(), args[1:]))
+                except Exception as e:
+                    self.wfile.write(f"-ERR {e}\r\n".encode("utf-8"))
+
+class FakeRedisServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), FakeRedisHandler)
+        self.data = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _score(value):
+        return float("-inf") if value == "-inf" else float("inf") if value == "+inf" else float(value)
+
+    def run(self, cmd, args):
+        data = self.data
+        if cmd in ("PING", "AUTH", "SELECT"):
+            return "OK"
+        if cmd == "EXPIRE":
+            return 1 if args[0] in data else 0
+        if cmd == "HSET":
+            h = data.setdefault(args[0], {})
+            added = sum(1 for k in args[1::2] if k not in h)
+            h.update(zip(args[1::2], args[2::2]))
+            return added
+        if cmd == "HGETALL":
+            return [x for kv in data.get(args[0], {}).items() for x in kv]
+        if cmd == "HMGET":
+            h = data.get(args[0], {})
+            return [h.get(k) for k in args[1:]]
+        if cmd == "HINCRBY":
+            h = data.setdefault(args[0], {})
+            h[args[1]] = str(int(h.get(args[1], 0)) + int(args[2]))
+            return int(h[args[1]])
+        if cmd == "SADD":
+            s = data.setdefault(args[0], set())
+            before = len(s)
+            s.update(args[1:])
+            return len(s) - before
+        if cmd == "SMEMBERS":
+            return sorted(data.get(args[0], set()))
+        if cmd == "ZADD":
+            z = data.setdefault(args[0], {})
+            flags = set()
+            rest = args[1:]
+            while rest[0].upper() in ("NX", "XX", "CH"):
+                flags.add(rest[0].upper())
+                rest = rest[1:]
+            changed = 0
+            for score, member in zip(rest[::2], rest[1::2]):
+                exists = member in z
+                if ("NX" in flags and exists) or ("XX" in flags and not exists):
+                    continue
+                if not exists or ("CH" in flags and z[member] != float(score)):
+                    changed += 1
+                z[member] = float(score)
+            return changed
+        if cmd == "ZSCORE":
+            score = data.get(args[0], {}).get(args[1])
+            return None if score is None else repr(score)
+        if cmd == "ZREM":
+            z = data.get(args[0], {})
+            return sum(1 for m in args[1:] if z.pop(m, None) is not None)
+        if cmd == "ZCARD":
+            return len(data.get(args[0], {}))
+        if cmd == "ZRANGE":
+            items = sorted(data.get(args[0], {}).items(), key=lambda kv: (kv[1], kv[0]))
+            items = items[int(args[1]): (int(args[2]) + 1) or None]
+            if len(args) > 3 and args[3].upper() == "WITHSCORES":
+                return [x for m, s in items for x in (m, repr(s))]
+            return [m for m, _ in items]
+        if cmd == "ZRANGEBYSCORE":
+            low, high = self._score(args[1]), self._score(args[2])
+            items = sorted(data.get(args[0], {}).items(), key=lambda kv: (kv[1], kv[0]))
+            return [m for m, s in items if low <= s <= high]
+        raise ValueError(f"unknown command '{cmd}'")
+
+def check(label, condition):
+    print(f"  {'OK  ' if condition else 'FAIL'} {label}")
+    return condition
+
+def exercise(name, make_queue):
+    print(f"Testing {name} backend...")
+    results = []
+    queue = make_queue(lease=1)
+
+    low = queue.enqueue("render", {"n": 1}, priority=0)
+    high = queue.enqueue("render", {"n": 2}, priority=10)
+    job = queue.claim("w1")
+    results.append(check("highest priority claimed first", job["id"] == high and job["state"] == RUNNING))
+    queue.complete(job["id"], "w1", {"video": "abc"})
+    done = queue.get(high)
+    results.append(check("completed job keeps its result", done["state"] == SUCCEEDED and done["result"] == {"video": "abc"}))
+
+    job = queue.claim("w1")
+    queue.fail(job["id"], "w1", "boom")
+    results.append(check("failed attempt waits for its retry", queue.get(low)["state"] == QUEUED and queue.claim("w2") is None))
+    time.sleep(job_queue.RETRY_BASE_DELAY + 0.1)
+    job = queue.claim("w2")
+    results.append(check("retried after backoff", job and job["id"] == low and job["attempts"] == 2))
+
+    # w2 "dies": no heartbeat, the lease runs out and another worker takes over
+    time.sleep(1.2)
+    job = queue.claim("w3")
+    results.append(check("expired lease is reclaimed", job and job["id"] == low and job["attempts"] == 3))
+    queue.complete(low, "w2", {"stale": True})
+    results.append(check("lost worker cannot complete the job", queue.get(low)["state"] == RUNNING))
+    for _ in range(3):
+        time.sleep(0.5)
+        queue.heartbeat(low, "w3", "rendering", 50)
+    results.append(check("heartbeats keep the lease", queue.claim("w4") is None and queue.get(low)["progress"] == 50))
+    # Two heartbeats within one clock tick leave the lease score unchanged
+    frozen, real_time = time.time(), job_queue.time.time
+    job_queue.time.time = lambda: frozen
+    try:
+        same_tick = queue.heartbeat(low, "w3") and queue.heartbeat(low, "w3")
+    finally:
+        job_queue.time.time = real_time
+    results.append(check("heartbeat with an unchanged lease still succeeds", same_tick))
+    queue.fail(low, "w3", "boom again")
+    results.append(check("out of attempts -> failed", queue.get(low)["state"] == FAILED))
+
+    cancelled = queue.enqueue("render", {})
+    results.append(check("queued job can be cancelled", queue.cancel(cancelled) and queue.get(cancelled)["state"] == FAILED))
+
+    ids = {queue.enqueue("render", {"i": i}) for i in range(40)}
+    claimed = []
+
+    def drain(worker_id):
+        # Each thread gets its own client/connection, like separate worker processes
+        q = make_queue(lease=30)
+        while True:
+            job = q.claim(worker_id)
+            if not job:
+                return
+            claimed.append(job["id"])
+            q.complete(job["id"], worker_id, {})
+
+    threads = [threading.Thread(target=drain, args=(f"t{i}",)) for i in range(4)]
+    for t in threads: t.start()
+    for t in threads: t.join()
+    results.append(check("40 jobs, 4 workers: each claimed exactly once", sorted(claimed) == sorted(ids)))
+    results.append(check(f"stats {queue.stats()}", queue.stats()[SUCCEEDED] == 41 and queue.stats()[QUEUED] == 0))
+    return all(results)
+
+def test_job_queue():
+    job_queue.RETRY_BASE_DELAY = 0.5
+    workdir = tempfile.mkdtemp()
+    server = FakeRedisServer()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        db_path = os.path.join(workdir, "queue.sqlite")
+        ok = exercise("SQLite", lambda lease: SQLiteJobQueue(db_path, lease=lease))
+        url = f"redis://127.0.0.1:{server.server_address[1]}/0"
+        ok &= exercise("Redis (local RESP stand-in)", lambda lease: RedisJobQueue(url, lease=lease, prefix="test"))
+        print("All checks passed." if ok else "Some checks FAILED.")
+        assert ok
+    finally:
+        server.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == "__main__":
+    test_job_queue()
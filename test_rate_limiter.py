@@ -0,0 +1,68 @@
+import pytest
+import rate_limiter
+from rate_limiter import AdaptiveTokenBucket, RateLimiter, _limits_from_env
+
+@pytest.fixture(autouse=True)
+def no_metrics(monkeypatch):
+    monkeypatch.setattr(rate_limiter, "export_metrics", lambda *args, **kwargs: False)
+
+def test_throttle_halves_rate_down_to_floor():
+    bucket = AdaptiveTokenBucket("h", rate=4.0, burst=4)
+    bucket.on_response(429)
+    assert bucket.rate == 2.0
+    bucket.on_response(403)
+    bucket.on_response(blocked=True)
+    assert bucket.rate == 0.5
+    for _ in range(10):
+        bucket.on_response(429)
+    assert bucket.rate == pytest.approx(0.4)
+    assert bucket.throttled == 13
+
+def test_throttle_drops_saved_burst():
+    bucket = AdaptiveTokenBucket("h", rate=4.0, burst=4)
+    assert bucket.tokens == 4
+    bucket.on_response(429)
+    assert bucket.tokens <= 0
+
+def test_clean_responses_recover_additively_up_to_cap():
+    bucket = AdaptiveTokenBucket("h", rate=4.0, burst=4)
+    bucket.on_response(429)
+    for _ in range(5):
+        bucket.on_response(200)
+    assert bucket.rate == pytest.approx(4.0)
+    for _ in range(100):
+        bucket.on_response(200)
+    assert bucket.rate == pytest.approx(8.0)
+
+def test_errors_other_than_throttling_leave_rate_alone():
+    bucket = AdaptiveTokenBucket("h", rate=4.0, burst=4)
+    bucket.on_response(500)
+    bucket.on_response(None)
+    assert bucket.rate == 4.0
+
+def test_reserve_waits_once_burst_is_spent(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(rate_limiter.time, "monotonic", lambda: now[0])
+    bucket = AdaptiveTokenBucket("h", rate=2.0, burst=2)
+    assert bucket._reserve() == 0.0
+    assert bucket._reserve() == 0.0
+    assert bucket._reserve() == pytest.approx(0.5)
+    assert bucket._reserve() == pytest.approx(1.0)
+    now[0] += 1.0
+    assert bucket._reserve() == pytest.approx(0.5)
+
+def test_hosts_map_to_suffix_buckets():
+    limiter = RateLimiter({"tiktok.com": (1.0, 3)})
+    shop = limiter.bucket_for("https://shop.tiktok.com/view/product/1")
+    assert shop is limiter.bucket_for("https://vt.tiktok.com/abc")
+    assert limiter.bucket_for("https://nottiktok.com/") is None
+    assert limiter.bucket_for("https://example.com/") is None
+    limiter.record("https://shop.tiktok.com/x", 429)
+    assert limiter.snapshot()["tiktok.com"]["rate"] == 0.5
+
+def test_env_overrides(monkeypatch):
+    monkeypatch.setenv("RATE_LIMITS", "tiktok.com=3:6,Example.com=2,broken=x")
+    limits = _limits_from_env()
+    assert limits["tiktok.com"] == (3.0, 6)
+    assert limits["example.com"] == (2.0, 2)
+    assert "broken" not in limits
@@ -0,0 +1,58 @@
+import time
+import pytest
+import scrape_cache
+from scrape_cache import ScrapeCache, canonicalize_url, is_short_link
+
+@pytest.mark.parametrize("url", [
+    "https://shop.tiktok.com/view/product/1729?utm_source=copy&share_link_id=abc&u_code=x1",
+    "https://SHOP.TikTok.com/view/product/1729/",
+    "  https://shop.tiktok.com/view/product/1729#reviews  ",
+    "HTTPS://shop.tiktok.com/view/product/1729",
+])
+def test_variants_share_one_canonical_url(url):
+    assert canonicalize_url(url) == "https://shop.tiktok.com/view/product/1729"
+
+def test_canonical_keeps_path_case_and_defaults():
+    assert canonicalize_url("https://shop.tiktok.com/view/Product/AbC") == "https://shop.tiktok.com/view/Product/AbC"
+    assert canonicalize_url("https://shop.tiktok.com") == "https://shop.tiktok.com/"
+    assert canonicalize_url("https://shop.tiktok.com/a") != canonicalize_url("https://shop.tiktok.com/b")
+
+def test_non_tracking_parameters_are_kept_sorted():
+    base = "https://shop.tiktok.com/view/product/1729"
+    assert canonicalize_url(base + "?sku_id=2&region=ID&utm_medium=x") == base + "?region=ID&sku_id=2"
+    assert canonicalize_url(base + "?region=ID&sku_id=2") == canonicalize_url(base + "?sku_id=2&region=ID")
+    assert canonicalize_url(base + "?sku_id=1") != canonicalize_url(base + "?sku_id=2")
+
+def test_short_links():
+    assert is_short_link("https://vt.tiktok.com/ZSabc/")
+    assert is_short_link("https://VM.TIKTOK.COM/ZSabc")
+    assert not is_short_link("https://shop.tiktok.com/view/product/1")
+
+@pytest.fixture
+def cache(tmp_path):
+    return ScrapeCache(db_path=str(tmp_path / "scraper.sqlite"), url_ttl=60, product_ttl=60)
+
+def test_short_link_resolves_after_redirect_is_recorded(cache):
+    short = "https://vt.tiktok.com/ZSabc/"
+    assert cache.resolve(short) is None
+    canonical = cache.put_resolved(short, "https://shop.tiktok.com/view/product/1729?utm_campaign=x")
+    assert canonical == "https://shop.tiktok.com/view/product/1729"
+    assert cache.resolve(short) == canonical
+    # Long links need no lookup
+    assert cache.resolve("https://shop.tiktok.com/view/product/1729/?share_app_id=1") == canonical
+
+def test_only_successful_scrapes_are_cached(cache):
+    canonical = "https://shop.tiktok.com/view/product/1"
+    cache.put_product(canonical, {"success": False, "error": "captcha"})
+    assert cache.get_product(canonical) is None
+    cache.put_product(canonical, {"success": True, "product_name": "Tas"})
+    assert cache.get_product(canonical) == {"success": True, "product_name": "Tas", "cached": True}
+
+def test_expired_entries_are_ignored_and_purged(cache, monkeypatch):
+    canonical = cache.put_resolved("https://vt.tiktok.com/x", "https://shop.tiktok.com/p/1")
+    cache.put_product(canonical, {"success": True})
+    later = time.time() + 61
+    monkeypatch.setattr(scrape_cache.time, "time", lambda: later)
+    assert cache.resolve("https://vt.tiktok.com/x") is None
+    assert cache.get_product(canonical) is None
+    assert cache.purge_expired() == 2
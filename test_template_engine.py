@@ -0,0 +1,28 @@
+import pytest
+from template_engine import TemplateDescriptionEngine, MIN_WORDS, MAX_WORDS, _short_name
+
+NAMES = ["Sepatu", "Tas Ransel Anti Air 30L", "", None, "Kaos [PROMO] | Pria #viral",
+         " ".join(["Kata"] * 40), "Blender 🔥🔥 Portable"]
+
+METADATA = [None, {"price": "Rp49.000"}, {"shop": "Toko Resmi Indonesia Sejahtera"},
+            {"price": "Rp1.250.000", "shop": "Official Store", "product_name": "Nama Lain Dari Metadata"}]
+
+@pytest.mark.parametrize("metadata", METADATA)
+@pytest.mark.parametrize("name", NAMES)
+def test_word_count_within_bounds(name, metadata):
+    text = TemplateDescriptionEngine().generate(name, metadata)
+    assert MIN_WORDS <= len(text.split()) <= MAX_WORDS
+
+def test_same_product_same_script():
+    engine = TemplateDescriptionEngine()
+    assert engine.generate("Tas Ransel") == engine.generate("Tas Ransel")
+    # Template choice ignores case; only the spoken name keeps it
+    assert engine.generate("Tas Ransel").lower() == engine.generate("tas ransel").lower()
+
+def test_hook_mentions_short_name():
+    text = TemplateDescriptionEngine().generate("Kaos [PROMO] | Pria Lengan Panjang Katun Premium Murah")
+    assert "Kaos PROMO Pria Lengan Panjang Katun" in text
+
+def test_short_name_fallback():
+    assert _short_name("") == "produk ini"
+    assert _short_name("[ ] | #") == "produk ini"
@@ -1,22 +1,50 @@
 import subprocess
 import os
+import hashlib
+import tempfile
+
+# Bump whenever the filter graph or encoder settings change, so old render fingerprints stop matching
+RENDER_VERSION = 1
 
 class VideoProcessor:
     @staticmethod
-    def create_video_from_images_and_audio(image_paths, audio_path, output_path, bg_music_path=None, description=""):
+    def render_fingerprint(image_hashes, audio_hash, bg_music_path=None):
+        """
+        Identifies a render by its inputs: the images (in order), the voiceover and the
+        background track. Identical fingerprints produce identical videos.
+        """
+        parts = [f"v{RENDER_VERSION}", *image_hashes, audio_hash]
+        if bg_music_path and os.path.exists(bg_music_path):
+            stat = os.stat(bg_music_path)
+            parts.append(f"{os.path.basename(bg_music_path)}:{stat.st_size}:{int(stat.st_mtime)}")
+        return hashlib.sha256("|".join(parts).encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def get_duration(path):
+        """Duration of an audio or video file in seconds, via ffprobe."""
+        duration_cmd = [
+            'ffprobe', '-v', 'error', '-show_entries', 'format=duration',
+            '-of', 'default=noprint_wrappers=1:nokey=1', path
+        ]
+        return float(subprocess.check_output(duration_cmd).decode().strip())
+
+    @staticmethod
+    def create_video_from_images_and_audio(image_paths, audio_path, output_path, bg_music_path=None, description="", on_progress=None):
         """
         Creates a video by combining multiple images, an audio file, and optional background music
         with crossfade transitions and automatic subtitles.
+        `on_progress(fraction)` is called as ffmpeg encodes (0.0 -> 1.0 of the voiceover length).
         """
         if not image_paths or not os.path.exists(audio_path):
             raise FileNotFoundError("Image(s) or Audio file not found.")
 
+        # A leftover output may be a hardlink into the artifact store; ffmpeg -y would
+        # truncate the shared file in place, so unlink it first
+        if os.path.exists(output_path):
+            os.remove(output_path)
+
         # Get audio duration
-        duration_cmd = [
-            'ffprobe', '-v', 'error', '-show_entries', 'format=duration',
-            '-of', 'default=noprint_wrappers=1:nokey=1', audio_path
-        ]
-        duration = float(subprocess.check_output(duration_cmd).decode().strip())
+        duration = VideoProcessor.get_duration(audio_path)
         
         num_images = len(image_paths)
         img_duration = duration / num_images
@@ -79,6 +107,9 @@ class VideoProcessor:
             output_path
         ])
 
+        if on_progress:
+            return VideoProcessor._run_with_progress(command, duration, on_progress)
+
         try:
             # Set encoding to prevent issues with special characters 
             subprocess.run(command, capture_output=True, text=True, check=True, encoding='utf-8')
@@ -86,3 +117,22 @@ class VideoProcessor:
         except subprocess.CalledProcessError as e:
             print(f"FFmpeg Error: {e.stderr}")
             raise e
+
+    @staticmethod
+    def _run_with_progress(command, duration, on_progress):
+        """Runs ffmpeg with machine-readable progress on stdout (stderr goes to a temp file so neither pipe can fill up)."""
+        command = command[:-1] + ['-progress', 'pipe:1', '-nostats', command[-1]]
+        with tempfile.TemporaryFile(mode="w+", encoding='utf-8') as stderr:
+            process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=stderr, text=True, encoding='utf-8')
+            for line in process.stdout:
+                key, _, value = line.strip().partition("=")
+                # out_time_ms is (despite its name) in microseconds, like out_time_us
+                if key in ("out_time_us", "out_time_ms") and value.isdigit() and duration > 0:
+                    on_progress(min(int(value) / 1e6 / duration, 1.0))
+            if process.wait() != 0:
+                stderr.seek(0)
+                error = stderr.read()
+                print(f"FFmpeg Error: {error}")
+                raise subprocess.CalledProcessError(process.returncode, command, stderr=error)
+        on_progress(1.0)
+        return True
@@ -0,0 +1,135 @@
+# Render worker entry point: python worker.py
+# Single node: the default SQLite queue in temp/jobs. Several nodes: set JOB_QUEUE_BACKEND=redis
+# and REDIS_URL everywhere, plus ARTIFACT_REMOTE_URL/ARTIFACT_TOKEN on the secondary nodes so
+# inputs and videos travel through the primary node's artifact store.
+import os
+import time
+import signal
+import socket
+import threading
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from logger_config import logger
+from metrics import set_process_role
+from job_queue import get_job_queue, PermanentJobError
+from content_jobs import AFFILIATE_KIND, MUSIC_KIND, run_affiliate_job, run_music_job
+from artifact_store import ArtifactStore
+from render_jobs import RENDER_KIND, RENDER_MODE, run_render_job
+
+# Job kind -> handler(job, store, report) returning the job's result dict
+HANDLERS = {
+    RENDER_KIND: run_render_job,
+    AFFILIATE_KIND: run_affiliate_job,
+    MUSIC_KIND: run_music_job,
+}
+POLL_INTERVAL = float(os.getenv("WORKER_POLL_INTERVAL", 1))
+PURGE_INTERVAL = 3600
+
+class Worker:
+    """
+    Pulls jobs from the shared queue and runs them. Each slot works one job at a time and
+    heartbeats its lease while the job runs; throughput scales by starting more worker
+    processes (or slots). SIGTERM stops claiming new jobs and lets running ones finish.
+    """
+    def __init__(self, queue=None, store=None, concurrency=None):
+        self.queue = queue or get_job_queue()
+        self.store = store or ArtifactStore()
+        self.concurrency = int(concurrency or os.getenv("WORKER_CONCURRENCY", 1))
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.stopping = threading.Event()
+
+    def _heartbeat(self, job_id, slot_id, done):
+        while not done.wait(self.queue.lease / 3):
+            if not self.queue.heartbeat(job_id, slot_id):
+                logger.warning(f"Worker {slot_id} lost the lease on job {job_id}")
+                return
+
+    def process(self, job, slot_id):
+        handler = HANDLERS.get(job["kind"])
+        if not handler:
+            self.queue.fail(job["id"], slot_id, f"Unknown job kind: {job['kind']}", retry=False)
+            return
+        logger.info(f"Worker {slot_id} started job {job['id']} ({job['kind']}, attempt {job['attempts']})")
+
+        last = {}
+
+        def report(stage, progress):
+            # ffmpeg reports several times a second; only whole-percent changes are written
+            progress = int(progress)
+            if last.get("stage") != stage or last.get("progress") != progress:
+                last.update(stage=stage, progress=progress)
+                self.queue.heartbeat(job["id"], slot_id, stage, progress)
+
+        done = threading.Event()
+        threading.Thread(target=self._heartbeat, args=(job["id"], slot_id, done), daemon=True).start()
+        try:
+            self.queue.complete(job["id"], slot_id, handler(job, self.store, report))
+        except PermanentJobError as e:
+            logger.error(f"Job {job['id']} failed on {slot_id}: {e}")
+            self.queue.fail(job["id"], slot_id, e, retry=False)
+        except Exception as e:
+            logger.error(f"Job {job['id']} failed on {slot_id}: {e}")
+            self.queue.fail(job["id"], slot_id, e)
+        finally:
+            done.set()
+
+    def run_slot(self, slot):
+        slot_id = f"{self.worker_id}/{slot}"
+        while not self.stopping.is_set():
+            try:
+                job = self.queue.claim(slot_id, kinds=list(HANDLERS))
+            except Exception as e:
+                logger.error(f"Worker {slot_id} could not claim a job: {e}")
+                job = None
+            if job:
+                self.process(job, slot_id)
+            else:
+                self.stopping.wait(POLL_INTERVAL)
+
+    def start(self):
+        """Runs the slots as daemon threads of the calling process and returns at once."""
+        for i in range(self.concurrency):
+            threading.Thread(target=self.run_slot, args=(i,), daemon=True, name=f"worker-{i}").start()
+
+    def stop(self, *args):
+        logger.info(f"Worker {self.worker_id} stopping after current jobs")
+        self.stopping.set()
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        logger.info(f"Worker {self.worker_id} started with {self.concurrency} slot(s) for: {', '.join(HANDLERS)}")
+        slots = [threading.Thread(target=self.run_slot, args=(i,), name=f"worker-{i}") for i in range(self.concurrency)]
+        for thread in slots:
+            thread.start()
+        last_purge = 0
+        while any(thread.is_alive() for thread in slots):
+            if time.time() - last_purge > PURGE_INTERVAL:
+                try:
+                    self.queue.purge_finished()
+                except Exception as e:
+                    logger.error(f"Job purge error: {e}")
+                last_purge = time.time()
+            time.sleep(1)
+        for thread in slots:
+            thread.join()
+
+def start_local_worker(store=None):
+    """
+    RENDER_MODE=inline: runs the queue's jobs inside the calling dashboard, so a dashboard started
+    without worker.py still finishes what it enqueues. Returns the Worker (None in queue mode).
+    """
+    if RENDER_MODE == "queue":
+        return None
+    worker = Worker(store=store)
+    worker.worker_id += "/local"
+    worker.start()
+    logger.info(f"Local worker {worker.worker_id} started with {worker.concurrency} slot(s)")
+    return worker
+
+if __name__ == "__main__":
+    # Replicas all run as "worker"; a per-process role keeps their metric snapshots apart
+    set_process_role(f"worker@{socket.gethostname()}-{os.getpid()}")
+    Worker().run()